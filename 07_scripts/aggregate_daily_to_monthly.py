@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 """
 Агрегация дневных данных в месячные для использования в месячных отчетах
+Инкрементально: пересчитываются только месяцы, дневные данные которых
+изменились с прошлого запуска (по числу строк и MAX(created_at) месяца,
+сохраненным в spend_rollup_state). Каждый месяц заменяется одним запросом
+INSERT ... SELECT ... ON CONFLICT в базе, поэтому отчеты никогда не видят
+пустой месяц; все месяцы обновляются в одной транзакции. Месяцы, дневные
+данные которых удалены полностью, удаляются из publisher_spend и из состояния.
 """
 import pandas as pd
+import argparse
 from sqlalchemy import create_engine, text
 from db_utils import get_postgres_connection_string
 import sys
@@ -11,6 +18,12 @@ import io
 # Fix encoding for Windows console
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+STATE_TABLE = 'spend_rollup_state'
+
+parser = argparse.ArgumentParser(description='Roll up publisher_spend_daily into monthly publisher_spend')
+parser.add_argument('--full', action='store_true', help='Recompute all months, not only changed ones')
+args = parser.parse_args()
+
 print("=" * 80)
 print("АГРЕГАЦИЯ ДНЕВНЫХ ДАННЫХ В МЕСЯЧНЫЕ")
 print("=" * 80)
@@ -20,63 +33,160 @@ print()
 pg_uri = get_postgres_connection_string()
 engine = create_engine(pg_uri)
 
-# Get monthly aggregated data from daily table
-print("1. Агрегирую дневные данные по месяцам...")
-print()
+# Отпечаток дневных данных месяца на момент последней агрегации
+create_state_sql = f"""
+CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+    month VARCHAR(7) PRIMARY KEY,
+    daily_rows BIGINT NOT NULL,
+    max_created_at TIMESTAMP,
+    rolled_up_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
 
-query = """
-SELECT 
-    publisher_id,
-    publisher_name,
-    format,
-    TO_CHAR(date, 'YYYY-MM') as month,
-    SUM(deposits_reported) as deposits_reported,
-    SUM(spend) as spend,
-    CASE 
-        WHEN SUM(deposits_reported) > 0 
-        THEN SUM(spend) / SUM(deposits_reported)
-        ELSE 0
-    END as current_cpa
-FROM publisher_spend_daily
-WHERE publisher_id != 0
-GROUP BY publisher_id, publisher_name, format, TO_CHAR(date, 'YYYY-MM')
-ORDER BY month, publisher_id;
+# Месяцы, у которых изменилось число дневных строк или появились новые загрузки
+# (загрузчики заменяют период через DELETE + COPY, новые строки получают новый created_at)
+changed_months_sql = f"""
+WITH daily AS (
+    SELECT
+        TO_CHAR(date, 'YYYY-MM') AS month,
+        COUNT(*) AS daily_rows,
+        MAX(created_at) AS max_created_at
+    FROM publisher_spend_daily
+    GROUP BY TO_CHAR(date, 'YYYY-MM')
+)
+SELECT d.month, d.daily_rows, d.max_created_at
+FROM daily d
+LEFT JOIN {STATE_TABLE} s ON s.month = d.month
+WHERE :full
+   OR s.month IS NULL
+   OR s.daily_rows <> d.daily_rows
+   OR s.max_created_at IS DISTINCT FROM d.max_created_at
+ORDER BY d.month
 """
 
-monthly_data = pd.read_sql(query, engine)
+# Ранее агрегированные месяцы, в которых не осталось дневных строк
+# (месяцы из месячных CSV в состоянии не записаны и сюда не попадают)
+orphaned_months_sql = f"""
+SELECT s.month
+FROM {STATE_TABLE} s
+WHERE NOT EXISTS (
+    SELECT 1
+    FROM publisher_spend_daily d
+    WHERE d.date >= TO_DATE(s.month, 'YYYY-MM')
+      AND d.date < TO_DATE(s.month, 'YYYY-MM') + INTERVAL '1 month'
+)
+ORDER BY s.month
+"""
 
-print(f"   Найдено записей: {len(monthly_data)}")
-if len(monthly_data) > 0:
-    print(f"   Месяцы: {sorted(monthly_data['month'].unique())}")
-print()
+# Изменяющие CTE выполняются всегда, даже если их результат не читается
+drop_month_sql = f"""
+WITH removed AS (
+    DELETE FROM publisher_spend WHERE month = :month RETURNING 1
+),
+forgotten AS (
+    DELETE FROM {STATE_TABLE} WHERE month = :month
+)
+SELECT COUNT(*) FROM removed
+"""
 
-# Insert/update monthly data
-print("2. Загрузка агрегированных данных в publisher_spend...")
-print()
+# Замена месяца одним запросом: агрегат считается в базе, паблишеры, пропавшие
+# из дневных данных, удаляются, остальные вставляются/обновляются по (publisher_id, month)
+rollup_month_sql = """
+WITH rolled AS (
+    SELECT
+        publisher_id,
+        SUM(deposits_reported) AS deposits_reported,
+        SUM(spend) AS spend,
+        CASE
+            WHEN SUM(deposits_reported) > 0
+            THEN SUM(spend) / SUM(deposits_reported)
+            ELSE 0
+        END AS current_cpa
+    FROM publisher_spend_daily
+    WHERE date >= TO_DATE(:month, 'YYYY-MM')
+      AND date < TO_DATE(:month, 'YYYY-MM') + INTERVAL '1 month'
+      AND publisher_id != 0
+    GROUP BY publisher_id
+),
+removed AS (
+    DELETE FROM publisher_spend ps
+    WHERE ps.month = :month
+      AND NOT EXISTS (SELECT 1 FROM rolled r WHERE r.publisher_id = ps.publisher_id)
+    RETURNING 1
+),
+upserted AS (
+    INSERT INTO publisher_spend (publisher_id, month, deposits_reported, spend, current_cpa)
+    SELECT publisher_id, :month, deposits_reported, spend, current_cpa
+    FROM rolled
+    ON CONFLICT (publisher_id, month) DO UPDATE
+    SET deposits_reported = EXCLUDED.deposits_reported,
+        spend = EXCLUDED.spend,
+        current_cpa = EXCLUDED.current_cpa
+    RETURNING 1
+)
+SELECT
+    (SELECT COUNT(*) FROM upserted) AS upserted,
+    (SELECT COUNT(*) FROM removed) AS removed
+"""
+
+save_state_sql = f"""
+INSERT INTO {STATE_TABLE} (month, daily_rows, max_created_at, rolled_up_at)
+VALUES (:month, :daily_rows, :max_created_at, CURRENT_TIMESTAMP)
+ON CONFLICT (month) DO UPDATE
+SET daily_rows = EXCLUDED.daily_rows,
+    max_created_at = EXCLUDED.max_created_at,
+    rolled_up_at = EXCLUDED.rolled_up_at
+"""
 
 with engine.connect() as conn:
-    for month in monthly_data['month'].unique():
-        month_data = monthly_data[monthly_data['month'] == month]
-        
-        # Delete existing data for this month
-        delete_sql = text("DELETE FROM publisher_spend WHERE month = :month")
-        conn.execute(delete_sql, {'month': month})
-        conn.commit()
-        
-        # Insert new aggregated data
-        month_data_db = month_data[['publisher_id', 'publisher_name', 'format', 'month', 'deposits_reported', 'spend', 'current_cpa']].copy()
-        month_data_db.to_sql('publisher_spend', engine, if_exists='append', index=False)
-        
-        print(f"   Месяц {month}: {len(month_data)} записей")
+    conn.execute(text(create_state_sql))
+    conn.commit()
 
-print()
+    # Find months changed since the last run
+    print("1. Поиск месяцев с измененными дневными данными...")
+    print()
+    changed = conn.execute(text(changed_months_sql), {'full': args.full}).fetchall()
+    orphaned = [row.month for row in conn.execute(text(orphaned_months_sql))]
+
+    if not changed and not orphaned:
+        print("   ✓ Изменений нет, месячные данные актуальны")
+        print()
+    else:
+        if changed:
+            print(f"   Месяцы к пересчету: {[row.month for row in changed]}")
+        if orphaned:
+            print(f"   Месяцы без дневных данных (будут удалены): {orphaned}")
+        print()
+
+        # Roll up each changed month in the database
+        print("2. Агрегация в publisher_spend...")
+        print()
+        try:
+            for row in changed:
+                upserted, removed = conn.execute(text(rollup_month_sql), {'month': row.month}).fetchone()
+                conn.execute(text(save_state_sql), {
+                    'month': row.month,
+                    'daily_rows': row.daily_rows,
+                    'max_created_at': row.max_created_at,
+                })
+                print(f"   Месяц {row.month}: {upserted} записей" + (f", удалено {removed}" if removed else ""))
+            for month in orphaned:
+                removed = conn.execute(text(drop_month_sql), {'month': month}).scalar()
+                print(f"   Месяц {month}: удален, записей {removed}")
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"   ✗ Ошибка, изменения отменены: {e}")
+            sys.exit(1)
+
+    print()
 
 # Get statistics
 print("3. Статистика по месяцам:")
 print()
 
 stats_query = """
-SELECT 
+SELECT
     month,
     COUNT(DISTINCT publisher_id) as publishers,
     SUM(spend) as total_spend,
@@ -96,4 +206,3 @@ print("=" * 80)
 print()
 print("Теперь можно использовать месячные отчеты для всех загруженных месяцев.")
 print()
-
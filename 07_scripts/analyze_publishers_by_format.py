@@ -2,7 +2,7 @@ import pandas as pd
 import sqlite3
 import sys
 import io
-import re
+from publisher_parsing import parse_publishers
 
 # Fix encoding for Windows console
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -12,51 +12,12 @@ print("АНАЛИЗ ПАБЛИШЕРОВ ПО ФОРМАТАМ (с интегр
 print("=" * 80)
 print()
 
-# Function to extract publisher_id and format from publisher name
-def extract_format(publisher_str):
-    """Extract ad format from publisher name with improved logic"""
-    name_upper = str(publisher_str).upper()
-    
-    # Используем регулярные выражения для более точного определения формата
-    # Ищем формат после дефиса или в конце названия (например, "-PUSH", "PUSH-Premium", "UGW-VIDEO")
-    
-    # Используем более строгие паттерны - формат должен быть отдельным словом
-    # после дефиса, перед дефисом, или в конце, но НЕ внутри другого слова
-    # Проверяем форматы в правильном порядке - сначала более специфичные
-    
-    # POP - проверяем перед PUSH, чтобы перехватить "-POP" раньше
-    if re.search(r'-POP\b|POP-|POP\s|POP$', name_upper):
-        return 'POP'
-    # BANNER - проверяем первым среди остальных, так как может быть в конце названия
-    elif re.search(r'-BANNER\b|BANNER-|BANNER\s|BANNER$', name_upper):
-        return 'BANNER'
-    # VIDEO - проверяем перед PUSH
-    elif re.search(r'-VIDEO\b|VIDEO-|VIDEO\s|VIDEO$', name_upper):
-        return 'VIDEO'
-    # PUSH - проверяем последним, исключая случаи где PUSH внутри слова
-    # Ищем PUSH только как отдельное слово (после/перед дефисом или пробелом)
-    elif (re.search(r'-PUSH\b|PUSH-|PUSH\s|PUSH$|IN-PAGE|INPAGE', name_upper) and 
-          not re.search(r'[A-Z]PUSH[A-Z]', name_upper)):  # Исключаем PUSH внутри слова
-        return 'PUSH'
-    # NATIVE
-    elif re.search(r'-NATIVE\b|NATIVE-|NATIVE\s|NATIVE$', name_upper):
-        return 'NATIVE'
-    else:
-        return 'OTHER'
-
-def extract_publisher_id(publisher_str):
-    match = re.match(r'\((\d+)\)', str(publisher_str))
-    if match:
-        return int(match.group(1))
-    return None
-
 # Load November spend data
 print("1. Загружаю данные по расходам (ноябрь)...")
 print()
 
 nov_spend = pd.read_csv('C:/Users/Nalivator3000/Downloads/export (1).csv', skiprows=1)
-nov_spend['publisher_id'] = nov_spend['Publisher'].apply(extract_publisher_id)
-nov_spend['format'] = nov_spend['Publisher'].apply(extract_format)
+nov_spend[['publisher_id', 'format']] = parse_publishers(nov_spend['Publisher'])
 
 # Keep only relevant columns
 nov_spend = nov_spend[['publisher_id', 'Publisher', 'format', 'FTD', 'Deposit', 'Spend']].copy()
@@ -77,25 +38,22 @@ print("2. Загружаю FTD/RD статистику из базы данны
 print()
 
 from db_utils import get_db_connection
+from deposit_summary import deposit_summary_exists, MISSING_SUMMARY_MESSAGE
 conn = get_db_connection()
+# FTD/RD берем из user_deposit_summary (ее обновляют загрузчики, отчет только читает)
+if not deposit_summary_exists(conn):
+    print(MISSING_SUMMARY_MESSAGE)
+    sys.exit(1)
 
 query_nov = '''
-WITH user_first_deposit_ever AS (
-    SELECT
-        external_user_id,
-        MIN(event_date) as first_deposit_ever
-    FROM user_events
-    WHERE event_type = 'deposit'
-    GROUP BY external_user_id
-),
-nov_deposits AS (
+WITH nov_deposits AS (
     SELECT
         e.external_user_id,
         e.publisher_id,
         e.event_date,
-        f.first_deposit_ever
+        f.first_deposit AS first_deposit_ever
     FROM user_events e
-    LEFT JOIN user_first_deposit_ever f
+    LEFT JOIN user_deposit_summary f
         ON e.external_user_id = f.external_user_id
     WHERE e.event_type = 'deposit'
       AND e.event_date >= '2025-11-01 00:00:00'
@@ -311,7 +269,7 @@ print("ИТОГОВАЯ СТАТИСТИКА ПО ФОРМАТАМ:")
 print("=" * 80)
 print()
 
-summary_by_format = significant[significant['publisher_id'] != 0].groupby('format').agg({
+summary_by_format = significant[significant['publisher_id'] != 0].groupby('format', observed=True).agg({
     'publisher_id': 'count',
     'spend': 'sum',
     'total_deps': 'sum',
@@ -12,7 +12,12 @@ print("=" * 80)
 print()
 
 from db_utils import get_db_connection
+from deposit_summary import deposit_summary_exists, MISSING_SUMMARY_MESSAGE
 conn = get_db_connection()
+# FTD/RD берем из user_deposit_summary (ее обновляют загрузчики, отчет только читает)
+if not deposit_summary_exists(conn):
+    print(MISSING_SUMMARY_MESSAGE)
+    sys.exit(1)
 
 # Function to analyze a full month
 def analyze_month(month_name, start_date, end_date):
@@ -20,22 +25,14 @@ def analyze_month(month_name, start_date, end_date):
 
     # Get FTD/RD stats
     query = f'''
-    WITH user_first_deposit_ever AS (
-        SELECT
-            external_user_id,
-            MIN(event_date) as first_deposit_ever
-        FROM user_events
-        WHERE event_type = 'deposit'
-        GROUP BY external_user_id
-    ),
-    month_deposits AS (
+    WITH month_deposits AS (
         SELECT
             e.external_user_id,
             e.publisher_id,
             e.event_date,
-            f.first_deposit_ever
+            f.first_deposit AS first_deposit_ever
         FROM user_events e
-        LEFT JOIN user_first_deposit_ever f
+        LEFT JOIN user_deposit_summary f
             ON e.external_user_id = f.external_user_id
         WHERE e.event_type = 'deposit'
           AND e.event_date >= '{start_date} 00:00:00'
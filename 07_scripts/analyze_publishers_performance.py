@@ -11,68 +11,30 @@ print("АНАЛИЗ ПАБЛИШЕРОВ: Ноябрь 18-23, 2025")
 print("=" * 80)
 print()
 
-from db_utils import get_db_connection
+from sqlalchemy import text
+from db_utils import get_db_connection, ensure_deposit_index
+from reactivation_engine import reactivations_sql, window_params, period_window, categorize_days
 conn = get_db_connection()
 
 # Get all reactivations by publisher for November 18-23
 print("1. Анализирую реактивации по паблишерам...")
 print()
 
-query = '''
-WITH nov_first_deposit AS (
-    SELECT
-        external_user_id,
-        publisher_id,
-        MIN(event_date) as first_deposit_nov
-    FROM user_events
-    WHERE event_type = 'deposit'
-      AND event_date >= '2025-11-18 00:00:00'
-      AND event_date <= '2025-11-23 23:59:59'
-    GROUP BY external_user_id, publisher_id
-),
-prev_deposits AS (
-    SELECT
-        n.external_user_id,
-        n.publisher_id,
-        n.first_deposit_nov,
-        MAX(e.event_date) as prev_deposit_date
-    FROM nov_first_deposit n
-    LEFT JOIN user_events e
-        ON n.external_user_id = e.external_user_id
-        AND e.event_type = 'deposit'
-        AND e.event_date < n.first_deposit_nov
-    GROUP BY n.external_user_id, n.publisher_id, n.first_deposit_nov
-)
-SELECT
-    publisher_id,
-    external_user_id as user_id,
-    first_deposit_nov,
-    prev_deposit_date,
-    CAST((julianday(first_deposit_nov) - julianday(prev_deposit_date)) AS INTEGER) as days_inactive
-FROM prev_deposits
-WHERE prev_deposit_date IS NOT NULL
-'''
-
-reactivations = pd.read_sql(query, conn)
+# LAG/ROW_NUMBER по депозитам вместо LEFT JOIN ... MAX() на каждого пользователя
+ensure_deposit_index(conn)
+conn.commit()
+query = reactivations_sql(conn, group_columns=['publisher_id'])
+params = window_params(*period_window('2025-11-18', '2025-11-23'))
+
+reactivations = pd.read_sql(text(query), conn, params=params)
+reactivations = reactivations.rename(columns={'first_deposit': 'first_deposit_nov'})
 conn.close()
 
 print(f"   Найдено реактиваций: {len(reactivations):,}")
 print()
 
 # Categorize
-def categorize(days):
-    if days < 7:
-        return '0-7 days'
-    elif days < 14:
-        return '7-14 days'
-    elif days < 30:
-        return '14-30 days'
-    elif days < 90:
-        return '30-90 days'
-    else:
-        return '90+ days'
-
-reactivations['period'] = reactivations['days_inactive'].apply(categorize)
+reactivations['period'] = categorize_days(reactivations['days_inactive'])
 
 # Calculate metrics by publisher and period
 print("2. Подсчет метрик по паблишерам и сегментам...")
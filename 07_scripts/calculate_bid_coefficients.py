@@ -2,57 +2,32 @@ import pandas as pd
 import sqlite3
 import sys
 import io
-import re
+import argparse
+from db_utils import execute_query
+from publisher_parsing import parse_publishers
 
 # Fix encoding for Windows console
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+parser = argparse.ArgumentParser(description='Calculate bid coefficients from target CPA per format')
+cache_group = parser.add_mutually_exclusive_group()
+cache_group.add_argument('--cache', dest='cache', action='store_true', default=None,
+                         help='Cache DB query results on disk (default: only if QUERY_CACHE_DIR is set)')
+cache_group.add_argument('--no-cache', dest='cache', action='store_false',
+                         help='Always query the database, even if QUERY_CACHE_DIR is set')
+args = parser.parse_args()
+
 print("=" * 80)
 print("РАСЧЕТ КОЭФФИЦИЕНТОВ ДЛЯ ЦЕЛЕВОЙ ЦЕНЫ ДЕПОЗИТА")
 print("=" * 80)
 print()
 
-# Function to extract publisher_id and format
-def extract_publisher_id(publisher_str):
-    match = re.match(r'\((\d+)\)', str(publisher_str))
-    if match:
-        return int(match.group(1))
-    return None
-
-def extract_format(publisher_str):
-    """Extract ad format from publisher name with improved logic"""
-    name_upper = str(publisher_str).upper()
-    
-    # Используем регулярные выражения для более точного определения формата
-    # Ищем формат после дефиса или в конце названия (например, "-PUSH", "PUSH-Premium", "UGW-VIDEO")
-    
-    # BANNER - проверяем первым, так как может быть в конце названия
-    if re.search(r'-BANNER|BANNER-|BANNER\s|BANNER$', name_upper):
-        return 'BANNER'
-    # VIDEO - проверяем перед PUSH, чтобы не перехватить "VIDEO" в других словах
-    elif re.search(r'-VIDEO|VIDEO-|VIDEO\s|VIDEO$', name_upper):
-        return 'VIDEO'
-    # PUSH - проверяем точные паттерны, чтобы не перехватить "RealPush", "Pushub" и т.д.
-    # Ищем PUSH после дефиса, перед дефисом, или как отдельное слово, но НЕ в начале слова
-    # Исключаем случаи типа "RealPush", "Pushub" (PUSH в начале или середине слова)
-    elif re.search(r'-PUSH|PUSH-|PUSH\s|PUSH$|IN-PAGE|INPAGE', name_upper) and not re.search(r'^[A-Z]*PUSH|PUSH[A-Z]', name_upper):
-        return 'PUSH'
-    # POP
-    elif re.search(r'-POP|POP-|POP\s|POP$', name_upper):
-        return 'POP'
-    # NATIVE
-    elif re.search(r'-NATIVE|NATIVE-|NATIVE\s|NATIVE$', name_upper):
-        return 'NATIVE'
-    else:
-        return 'OTHER'
-
 # Load November spend data
 print("1. Загружаю данные по расходам (ноябрь)...")
 print()
 
 nov_spend = pd.read_csv('C:/Users/Nalivator3000/Downloads/export (1).csv', skiprows=1)
-nov_spend['publisher_id'] = nov_spend['Publisher'].apply(extract_publisher_id)
-nov_spend['format'] = nov_spend['Publisher'].apply(extract_format)
+nov_spend[['publisher_id', 'format']] = parse_publishers(nov_spend['Publisher'])
 
 # Keep only relevant columns
 nov_spend = nov_spend[['publisher_id', 'Publisher', 'format', 'Deposit', 'Spend']].copy()
@@ -140,27 +115,13 @@ print()
 print("3. Загружаю статистику депозитов из базы данных...")
 print()
 
-from db_utils import get_db_connection
-conn = get_db_connection()
-
 query_nov = '''
-WITH user_first_deposit_ever AS (
-    SELECT
-        external_user_id,
-        MIN(event_date) as first_deposit_ever
-    FROM user_events
-    WHERE event_type = 'deposit'
-    GROUP BY external_user_id
-),
-nov_deposits AS (
+WITH nov_deposits AS (
     SELECT
         e.external_user_id,
         e.publisher_id,
-        e.event_date,
-        f.first_deposit_ever
+        e.event_date
     FROM user_events e
-    LEFT JOIN user_first_deposit_ever f
-        ON e.external_user_id = f.external_user_id
     WHERE e.event_type = 'deposit'
       AND e.event_date >= '2025-11-01 00:00:00'
       AND e.event_date <= '2025-11-30 23:59:59'
@@ -172,8 +133,8 @@ FROM nov_deposits
 GROUP BY publisher_id
 '''
 
-nov_db_stats = pd.read_sql(query_nov, conn)
-conn.close()
+# Пока данные в базе не менялись, повторный запуск берет результат из кэша
+nov_db_stats = execute_query(query_nov, cache=args.cache)
 
 print(f"   Загружено: {len(nov_db_stats)} паблишеров")
 print()
@@ -8,8 +8,17 @@ import pandas as pd
 import sys
 import io
 import argparse
+import os
 from datetime import datetime
-from db_utils import get_db_engine, get_db_type
+from db_utils import (
+    get_db_engine, get_db_type, ensure_deposit_index, load_id_temp_table,
+    iter_query, write_csv_chunks, write_parquet_chunks,
+)
+from reactivation_engine import reactivations_sql, window_params, period_window, categorize_days, INACTIVITY_LABELS
+
+# Больше ID - временная таблица вместо параметра-массива
+ARRAY_PARAM_MAX_IDS = 10000
+USER_LIST_TABLE = 'reactivation_user_list'
 
 # Fix encoding for Windows console
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -25,6 +34,8 @@ parser.add_argument('--users', type=str, help='Comma-separated list of user IDs
 parser.add_argument('--start-date', type=str, required=True, help='Start date of reactivation period (YYYY-MM-DD)')
 parser.add_argument('--end-date', type=str, required=True, help='End date of reactivation period (YYYY-MM-DD)')
 parser.add_argument('--output', type=str, default='reactivations_by_user_list', help='Output file prefix (default: reactivations_by_user_list)')
+parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='Detail file format (parquet requires pyarrow)')
+parser.add_argument('--chunk-size', type=int, default=50000, help='Rows fetched and written per chunk (default: 50000)')
 args = parser.parse_args()
 
 # Validate dates
@@ -45,15 +56,14 @@ print()
 user_ids = []
 if args.users:
     # Check if it's a file path
-    import os
     if os.path.exists(args.users):
         # Load from CSV file
         try:
-            users_df = pd.read_csv(args.users)
+            users_df = pd.read_csv(args.users, dtype=str)
             if 'user_id' in users_df.columns:
-                user_ids = users_df['user_id'].tolist()
+                user_ids = users_df['user_id'].dropna().str.strip().tolist()
             elif 'external_user_id' in users_df.columns:
-                user_ids = users_df['external_user_id'].tolist()
+                user_ids = users_df['external_user_id'].dropna().str.strip().tolist()
             else:
                 print(f"ERROR: CSV file must contain 'user_id' or 'external_user_id' column")
                 print(f"Available columns: {', '.join(users_df.columns)}")
@@ -64,7 +74,7 @@ if args.users:
             sys.exit(1)
     else:
         # Comma-separated list
-        user_ids = [uid.strip() for uid in args.users.split(',')]
+        user_ids = [uid.strip() for uid in args.users.split(',') if uid.strip()]
         print(f"   Загружено {len(user_ids)} пользователей из аргумента")
 else:
     print("ERROR: --users is required")
@@ -84,137 +94,73 @@ engine = get_db_engine()
 print(f"   Тип БД: {db_type}")
 print()
 
-# Build SQL query based on database type
+# Build SQL query
 print("3. Расчет реактиваций...")
 print()
 
-if db_type == 'postgresql':
-    # PostgreSQL query
-    # Convert user_ids list to SQL IN clause
-    user_ids_str = "', '".join(str(uid) for uid in user_ids)
-    
-    query = f'''
-    WITH period_first_deposit AS (
-        SELECT
-            external_user_id,
-            MIN(event_date) as first_deposit
-        FROM user_events
-        WHERE event_type = 'deposit'
-          AND external_user_id IN ('{user_ids_str}')
-          AND event_date >= '{args.start_date} 00:00:00'
-          AND event_date <= '{args.end_date} 23:59:59'
-        GROUP BY external_user_id
-    ),
-    prev_deposits AS (
-        SELECT
-            p.external_user_id,
-            p.first_deposit,
-            MAX(e.event_date) as prev_deposit_date
-        FROM period_first_deposit p
-        LEFT JOIN user_events e
-            ON p.external_user_id = e.external_user_id
-            AND e.event_type = 'deposit'
-            AND e.event_date < p.first_deposit
-        GROUP BY p.external_user_id, p.first_deposit
-    )
-    SELECT
-        external_user_id as user_id,
-        first_deposit,
-        prev_deposit_date,
-        CASE 
-            WHEN prev_deposit_date IS NOT NULL 
-            THEN EXTRACT(EPOCH FROM (first_deposit - prev_deposit_date)) / 86400
-            ELSE NULL
-        END as days_inactive
-    FROM prev_deposits
-    WHERE prev_deposit_date IS NOT NULL
-    ORDER BY days_inactive
-    '''
-else:
-    # SQLite query
-    user_ids_str = "', '".join(str(uid) for uid in user_ids)
-    
-    query = f'''
-    WITH period_first_deposit AS (
-        SELECT
-            external_user_id,
-            MIN(event_date) as first_deposit
-        FROM user_events
-        WHERE event_type = 'deposit'
-          AND external_user_id IN ('{user_ids_str}')
-          AND event_date >= '{args.start_date} 00:00:00'
-          AND event_date <= '{args.end_date} 23:59:59'
-        GROUP BY external_user_id
-    ),
-    prev_deposits AS (
-        SELECT
-            p.external_user_id,
-            p.first_deposit,
-            MAX(e.event_date) as prev_deposit_date
-        FROM period_first_deposit p
-        LEFT JOIN user_events e
-            ON p.external_user_id = e.external_user_id
-            AND e.event_type = 'deposit'
-            AND e.event_date < p.first_deposit
-        GROUP BY p.external_user_id, p.first_deposit
-    )
-    SELECT
-        external_user_id as user_id,
-        first_deposit,
-        prev_deposit_date,
-        CAST((julianday(first_deposit) - julianday(prev_deposit_date)) AS INTEGER) as days_inactive
-    FROM prev_deposits
-    WHERE prev_deposit_date IS NOT NULL
-    ORDER BY days_inactive
-    '''
-
-# Execute query
-with engine.connect() as conn:
-    reactivations = pd.read_sql(query, conn)
+# Один запрос для PostgreSQL и SQLite: диалектные выражения берутся из db_utils.
+# Список пользователей не вставляется в текст SQL: небольшой передается одним
+# массивом (= ANY(:ids)), большой загружается во временную таблицу и джойнится
+params = window_params(*period_window(args.start_date, args.end_date))
 
-print(f"   Найдено реактиваций: {len(reactivations):,}")
-print()
+with engine.connect() as conn:
+    ensure_deposit_index(conn)
+    conn.commit()
 
-# Categorize by inactivity period
-def categorize(days):
-    if pd.isna(days):
-        return 'Нет данных'
-    days = int(days)
-    if days < 7:
-        return '0-7 days'
-    elif days < 14:
-        return '7-14 days'
-    elif days < 30:
-        return '14-30 days'
-    elif days < 90:
-        return '30-90 days'
+    if conn.dialect.name == 'postgresql' and len(user_ids) <= ARRAY_PARAM_MAX_IDS:
+        user_filter = "AND external_user_id = ANY(:ids)"
+        params['ids'] = [str(uid) for uid in user_ids]
+        print(f"   Список передан параметром-массивом ({len(user_ids):,} ID)")
     else:
-        return '90+ days'
+        loaded = load_id_temp_table(conn, user_ids, USER_LIST_TABLE)
+        conn.commit()
+        user_filter = f"AND external_user_id IN (SELECT external_user_id FROM {USER_LIST_TABLE})"
+        print(f"   Список загружен во временную таблицу {USER_LIST_TABLE} ({loaded:,} уникальных ID)")
+
+    query = reactivations_sql(conn, user_filter=user_filter)
+    query += "\n    ORDER BY days_inactive"
+
+    # Execute query: результат читается серверным курсором по чанкам и сразу
+    # пишется в файл, в памяти - только текущий чанк и счетчики по сегментам
+    detail_filename = f'{args.output}_detail.{args.format}'
+    period_counts = {}
+    period_days = {}
+
+    def categorized_chunks():
+        for chunk in iter_query(query, params=params, chunk_size=args.chunk_size, conn=conn):
+            chunk['days_inactive'] = chunk['days_inactive'].astype(float)
+            chunk['period'] = categorize_days(chunk['days_inactive'])
+            grouped = chunk.groupby('period')['days_inactive'].agg(['count', 'sum'])
+            for period, row in grouped.iterrows():
+                period_counts[period] = period_counts.get(period, 0) + int(row['count'])
+                period_days[period] = period_days.get(period, 0.0) + float(row['sum'])
+            yield chunk
+
+    if args.format == 'parquet':
+        total_reactivations = write_parquet_chunks(categorized_chunks(), detail_filename)
+    else:
+        total_reactivations = write_csv_chunks(categorized_chunks(), detail_filename, encoding='utf-8-sig')
 
-if len(reactivations) > 0:
-    reactivations['days_inactive'] = reactivations['days_inactive'].astype(float)
-    reactivations['period'] = reactivations['days_inactive'].apply(categorize)
-    
+print(f"   Найдено реактиваций: {total_reactivations:,}")
+print()
+
+if total_reactivations > 0:
     # Summary by period
     print("4. Распределение по периодам неактивности:")
     print()
-    summary = reactivations.groupby('period').agg({
-        'user_id': 'count',
-        'days_inactive': 'mean'
-    }).round(1)
-    summary.columns = ['count', 'avg_days']
+    summary = pd.DataFrame({
+        'count': pd.Series(period_counts),
+        'avg_days': (pd.Series(period_days) / pd.Series(period_counts)).round(1),
+    })
     summary['percentage'] = (summary['count'] / summary['count'].sum() * 100).round(1)
-    
-    # Reorder
-    desired_order = ['0-7 days', '7-14 days', '14-30 days', '30-90 days', '90+ days']
-    summary = summary.reindex([p for p in desired_order if p in summary.index])
+    summary = summary.reindex([p for p in INACTIVITY_LABELS if p in summary.index])
+    summary.index.name = 'period'
     
     print(summary)
     print()
     
     # Total statistics
     total_users_analyzed = len(user_ids)
-    total_reactivations = len(reactivations)
     new_users = total_users_analyzed - total_reactivations
     
     print(f"ИТОГО:")
@@ -228,10 +174,7 @@ if len(reactivations) > 0:
     print("5. Сохранение результатов...")
     print()
     
-    detail_filename = f'{args.output}_detail.csv'
     summary_filename = f'{args.output}_summary.csv'
-    
-    reactivations.to_csv(detail_filename, index=False, encoding='utf-8-sig')
     summary.to_csv(summary_filename, encoding='utf-8-sig')
     
     print(f"   Сохранено:")
@@ -239,10 +182,12 @@ if len(reactivations) > 0:
     print(f"     - {summary_filename}")
     print()
 else:
+    # Parquet-файл без строк не создается (write_parquet_chunks)
+    if os.path.exists(detail_filename):
+        os.remove(detail_filename)
     print("   Реактиваций не найдено")
     print()
 
 print("=" * 80)
 print("РАСЧЕТ ЗАВЕРШЕН!")
 print("=" * 80)
-
@@ -4,16 +4,26 @@ import sys
 import io
 import pandas as pd
 from sqlalchemy import create_engine, text
-from db_utils import get_postgres_connection_string
+from db_utils import get_postgres_connection_string, parse_pixel_ts
+from pixel_parquet import get_pixels_parquet_dir, read_pixel_dataset
 
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
 CSV_FILE = r"C:\Users\Nalivator3000\Downloads\pixels-019b379c-d78c-71d3-9d2a-4831948c32c5-12-19-2025-17-16-24-01.csv"
 
-print("Загружаю event_id из CSV...")
-csv_df = pd.read_csv(CSV_FILE, usecols=['EVENT_ID'], nrows=10000)
-csv_event_ids = set(csv_df['EVENT_ID'].dropna().astype(str))
-print(f"Event IDs в CSV (первые 10k строк): {len(csv_event_ids)}")
+PARQUET_DIR = get_pixels_parquet_dir()
+
+if PARQUET_DIR:
+    # Parquet датасет: читаем только event_id и только партиции 2-8 декабря
+    print(f"Загружаю event_id из Parquet датасета {PARQUET_DIR}...")
+    csv_df = read_pixel_dataset(PARQUET_DIR, columns=['event_id'], start_date='2025-12-02', end_date='2025-12-08')
+    csv_event_ids = set(csv_df['event_id'].dropna().astype(str).head(10000))
+    print(f"Event IDs в датасете (первые 10k за 2-8 декабря): {len(csv_event_ids)}")
+else:
+    print("Загружаю event_id из CSV...")
+    csv_df = pd.read_csv(CSV_FILE, usecols=['EVENT_ID'], nrows=10000)
+    csv_event_ids = set(csv_df['EVENT_ID'].dropna().astype(str))
+    print(f"Event IDs в CSV (первые 10k строк): {len(csv_event_ids)}")
 
 print("\nЗагружаю event_id из БД...")
 pg_uri = get_postgres_connection_string()
@@ -38,8 +48,13 @@ with engine.connect() as conn:
         print("Проверяю альтернативные варианты связывания...")
         
         # Проверяем по external_user_id + дата
-        csv_sample = pd.read_csv(CSV_FILE, usecols=['EXTERNAL_USER_ID', 'PIXEL_TS'], nrows=100)
-        csv_sample['PIXEL_TS'] = pd.to_datetime(csv_sample['PIXEL_TS'], errors='coerce')
+        if PARQUET_DIR:
+            csv_sample = read_pixel_dataset(
+                PARQUET_DIR, columns=['external_user_id', 'event_date'], start_date='2025-12-02', end_date='2025-12-08'
+            ).head(100)
+        else:
+            csv_sample = pd.read_csv(CSV_FILE, usecols=['EXTERNAL_USER_ID', 'PIXEL_TS'], nrows=100)
+            csv_sample['PIXEL_TS'], _ = parse_pixel_ts(csv_sample['PIXEL_TS'])
         csv_sample = csv_sample.dropna()
         print(f"\nПримеры из CSV:")
         print(csv_sample.head())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Конвертация pixel CSV экспорта в партиционированный Parquet датасет
+(event_day=YYYY-MM-DD/event_type=...) с типизированными колонками.
+Дальше лоадеры и проверки читают датасет вместо повторного парсинга CSV.
+"""
+import pandas as pd
+import sys
+import io
+import os
+import shutil
+import argparse
+from datetime import datetime
+from ingest_pipeline import run_pipeline
+from pixel_parquet import normalize_pixel_chunk, write_pixel_chunk, read_pixel_dataset
+from pixel_schema import pixel_read_csv_kwargs
+
+# Fix encoding for Windows console
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+parser = argparse.ArgumentParser(description='Convert pixel CSV export to a partitioned Parquet dataset')
+parser.add_argument('--csv', type=str, required=True, help='Path to pixel CSV export')
+parser.add_argument('--out', type=str, default=os.environ.get('PIXELS_PARQUET_DIR', 'pixels_parquet'),
+                    help='Output dataset directory (default: $PIXELS_PARQUET_DIR or ./pixels_parquet)')
+parser.add_argument('--chunk-size', type=int, default=200000, help='Rows per chunk (default: 200000)')
+parser.add_argument('--workers', type=int, default=2, help='Parallel chunk normalization threads (default: 2)')
+parser.add_argument('--overwrite', action='store_true', help='Remove existing dataset directory first')
+args = parser.parse_args()
+
+print("=" * 80)
+print("КОНВЕРТАЦИЯ PIXELS CSV В PARQUET")
+print("=" * 80)
+print()
+
+if not os.path.exists(args.csv):
+    print(f"ОШИБКА: CSV файл не найден: {args.csv}")
+    sys.exit(1)
+
+if os.path.exists(args.out) and os.listdir(args.out):
+    if not args.overwrite:
+        print(f"ОШИБКА: датасет уже существует: {args.out}")
+        print("   Используйте --overwrite для пересоздания")
+        sys.exit(1)
+    shutil.rmtree(args.out)
+
+print(f"CSV файл: {args.csv}")
+print(f"Датасет:  {args.out}")
+print(f"Размер чанка: {args.chunk_size:,} строк")
+print()
+
+rows_read = 0
+rows_written = 0
+slow_ts_rows = 0
+chunk_num = 0
+start_time = datetime.now()
+
+def transform(chunk):
+    df, slow_rows = normalize_pixel_chunk(chunk)
+    return df, len(chunk), slow_rows
+
+def write(item):
+    global rows_read, rows_written, slow_ts_rows, chunk_num
+    df, raw_rows, slow_rows = item
+    slow_ts_rows += slow_rows
+    write_pixel_chunk(df, args.out, chunk_num)
+    chunk_num += 1
+    rows_read += raw_rows
+    rows_written += len(df)
+
+    elapsed = (datetime.now() - start_time).total_seconds()
+    rate = rows_read / elapsed if elapsed > 0 else 0
+    print(f"Прогресс: {rows_read:,} строк | Скорость: {rate:.0f} строк/сек")
+
+# usecols/dtype/переименование колонок задаются схемой прямо в read_csv
+reader = pd.read_csv(args.csv, chunksize=args.chunk_size, **pixel_read_csv_kwargs(args.csv))
+run_pipeline(reader, transform, write, workers=args.workers)
+
+elapsed_total = (datetime.now() - start_time).total_seconds()
+print()
+print("=" * 80)
+print("КОНВЕРТАЦИЯ ЗАВЕРШЕНА!")
+print("=" * 80)
+print(f"Прочитано строк:  {rows_read:,}")
+print(f"Записано строк:   {rows_written:,} (без даты отброшено: {rows_read - rows_written:,})")
+print(f"PIXEL_TS вне формата 'YYYY-MM-DD HH:MM:SS UTC' (медленный парсинг): {slow_ts_rows:,} строк")
+print(f"Время: {elapsed_total/60:.1f} минут")
+print()
+
+summary = read_pixel_dataset(args.out, columns=['event_day', 'event_type'])
+print("Распределение по типам событий:")
+for event_type, count in summary['event_type'].value_counts().items():
+    print(f"  {event_type}: {count:,}")
+print(f"Диапазон дней: {summary['event_day'].min()} - {summary['event_day'].max()}")
+print()
+print("Для использования датасета в лоадерах установите:")
+print(f"  PIXELS_PARQUET_DIR={os.path.abspath(args.out)}")
+print()
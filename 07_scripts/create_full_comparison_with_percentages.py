@@ -1,65 +1,76 @@
+import argparse
 import pandas as pd
+from db_utils import get_db_connection
+from reactivation_engine import (
+    compute_reactivations, period_window, reactivations_only, summarize_reactivations, compare_periods,
+)
 
-print("=" * 80)
-print("СРАВНЕНИЕ ПЕРИОДОВ: Абсолютные числа + Проценты")
-print("=" * 80)
-print()
-
-# Load all summary files
-aug_summary = pd.read_csv('all_aug18-23_reactivations_summary.csv', index_col=0)
-sep_summary = pd.read_csv('all_sep18-23_reactivations_summary.csv', index_col=0)
-oct_summary = pd.read_csv('all_oct18-23_reactivations_summary.csv', index_col=0)
-nov_summary = pd.read_csv('all_nov18-23_reactivations_summary.csv', index_col=0)
+DEFAULT_PERIODS = [
+    'Aug:2025-08-18:2025-08-23',
+    'Sep:2025-09-18:2025-09-23',
+    'Oct:2025-10-18:2025-10-23',
+    'Nov:2025-11-18:2025-11-23',
+]
 
-# Get desired order
-desired_order = ['0-7 days', '7-14 days', '14-30 days', '30-90 days', '90+ days']
+parser = argparse.ArgumentParser(description='Compare reactivation distributions of several periods in one scan')
+parser.add_argument('--period', action='append', default=None, metavar='NAME:START:END',
+                    help='Named window, e.g. Nov:2025-11-18:2025-11-23 (repeatable; default: Aug/Sep/Oct/Nov 18-23)')
+parser.add_argument('--target', type=str, default=None,
+                    help='Period compared against the control average (default: the last one)')
+parser.add_argument('--control', type=str, nargs='+', default=None,
+                    help='Control periods to average (default: all except the target)')
+parser.add_argument('--save-periods', action='store_true',
+                    help='Also save all_<name>_reactivations_detail/summary.csv for every period')
+args = parser.parse_args()
 
-# Create comparison dataframe with counts
-comparison = pd.DataFrame({
-    'Aug_count': aug_summary.reindex(desired_order)['count'],
-    'Aug_%': aug_summary.reindex(desired_order)['percentage'],
-    'Sep_count': sep_summary.reindex(desired_order)['count'],
-    'Sep_%': sep_summary.reindex(desired_order)['percentage'],
-    'Oct_count': oct_summary.reindex(desired_order)['count'],
-    'Oct_%': oct_summary.reindex(desired_order)['percentage'],
-    'Nov_count': nov_summary.reindex(desired_order)['count'],
-    'Nov_%': nov_summary.reindex(desired_order)['percentage'],
-})
+windows = {}
+for spec in args.period or DEFAULT_PERIODS:
+    parts = spec.split(':')
+    if len(parts) != 3:
+        parser.error(f"--period {spec}: ожидается NAME:START:END")
+    name, start_date, end_date = parts
+    try:
+        start, end = period_window(start_date, end_date)
+    except ValueError:
+        parser.error(f"--period {spec}: неверная дата, ожидается YYYY-MM-DD")
+    if pd.isna(start) or pd.isna(end) or start >= end:
+        parser.error(f"--period {spec}: пустой или обратный интервал дат")
+    windows[name] = (start, end)
+names = list(windows)
+target = args.target or names[-1]
+control = args.control or [name for name in names if name != target]
 
-# Calculate control average (count and %)
-comparison['Control_avg_count'] = ((comparison['Aug_count'] +
-                                     comparison['Sep_count'] +
-                                     comparison['Oct_count']) / 3).round(0)
+# Проверка до сканирования депозитов: неизвестный период или пустой контроль
+unknown = [name for name in [target, *control] if name not in windows]
+if unknown:
+    parser.error(f"неизвестные периоды: {', '.join(unknown)} (заданы: {', '.join(names)})")
+if not control:
+    parser.error("нет контрольных периодов: задайте минимум два --period или --control")
 
-# Calculate control average percentage
-control_total = (aug_summary['count'].sum() + sep_summary['count'].sum() + oct_summary['count'].sum()) / 3
-comparison['Control_avg_%'] = (comparison['Control_avg_count'] / control_total * 100).round(1)
+print("=" * 80)
+print("СРАВНЕНИЕ ПЕРИОДОВ: Абсолютные числа + Проценты")
+print("=" * 80)
+print()
 
-# Calculate differences from November
-comparison['Diff_Nov_vs_Avg'] = comparison['Nov_count'] - comparison['Control_avg_count']
-comparison['Diff_Nov_vs_Aug'] = comparison['Nov_count'] - comparison['Aug_count']
-comparison['Diff_Nov_vs_Sep'] = comparison['Nov_count'] - comparison['Sep_count']
-comparison['Diff_Nov_vs_Oct'] = comparison['Nov_count'] - comparison['Oct_count']
+# Все периоды считаются за один проход по депозитам
+print(f"Периоды: {', '.join(names)} | контроль: {', '.join(control)} | сравниваем: {target}")
+print("Сканируем депозиты (один проход для всех периодов)...")
+conn = get_db_connection()
+details = compute_reactivations(conn, windows)
+conn.close()
 
-# Add totals row
-totals = pd.Series({
-    'Aug_count': aug_summary['count'].sum(),
-    'Aug_%': 100.0,
-    'Sep_count': sep_summary['count'].sum(),
-    'Sep_%': 100.0,
-    'Oct_count': oct_summary['count'].sum(),
-    'Oct_%': 100.0,
-    'Nov_count': nov_summary['count'].sum(),
-    'Nov_%': 100.0,
-    'Control_avg_count': (aug_summary['count'].sum() + sep_summary['count'].sum() + oct_summary['count'].sum()) / 3,
-    'Control_avg_%': 100.0,
-    'Diff_Nov_vs_Avg': nov_summary['count'].sum() - (aug_summary['count'].sum() + sep_summary['count'].sum() + oct_summary['count'].sum()) / 3,
-    'Diff_Nov_vs_Aug': nov_summary['count'].sum() - aug_summary['count'].sum(),
-    'Diff_Nov_vs_Sep': nov_summary['count'].sum() - sep_summary['count'].sum(),
-    'Diff_Nov_vs_Oct': nov_summary['count'].sum() - oct_summary['count'].sum(),
-}, name='TOTAL')
+summaries = {}
+for name in names:
+    reactivations = reactivations_only(details[name])
+    summaries[name] = summarize_reactivations(reactivations)
+    print(f"  {name}: депозитных юзеров {len(details[name]):,}, реактиваций {len(reactivations):,}")
+    if args.save_periods:
+        filename_base = f"all_{name.lower().replace(' ', '_')}_reactivations"
+        reactivations.to_csv(f'{filename_base}_detail.csv', index=False)
+        summaries[name].to_csv(f'{filename_base}_summary.csv')
+print()
 
-comparison = pd.concat([comparison, totals.to_frame().T])
+comparison = compare_periods(summaries, control, target)
 
 # Print formatted table
 print("СРАВНИТЕЛЬНАЯ ТАБЛИЦА:")
@@ -78,11 +89,13 @@ print()
 print("КЛЮЧЕВЫЕ ИНСАЙТЫ:")
 print()
 print("90+ дней:")
-print(f"  Август:   {int(comparison.loc['90+ days', 'Aug_count']):,} ({comparison.loc['90+ days', 'Aug_%']:.1f}%)")
-print(f"  Сентябрь: {int(comparison.loc['90+ days', 'Sep_count']):,} ({comparison.loc['90+ days', 'Sep_%']:.1f}%)")
-print(f"  Октябрь:  {int(comparison.loc['90+ days', 'Oct_count']):,} ({comparison.loc['90+ days', 'Oct_%']:.1f}%)")
+for name in control:
+    print(f"  {name + ':':<9} {int(comparison.loc['90+ days', f'{name}_count']):,} ({comparison.loc['90+ days', f'{name}_%']:.1f}%)")
 print(f"  Контроль: {int(comparison.loc['90+ days', 'Control_avg_count']):,} ({comparison.loc['90+ days', 'Control_avg_%']:.1f}%)")
-print(f"  Ноябрь:   {int(comparison.loc['90+ days', 'Nov_count']):,} ({comparison.loc['90+ days', 'Nov_%']:.1f}%)")
+print(f"  {target + ':':<9} {int(comparison.loc['90+ days', f'{target}_count']):,} ({comparison.loc['90+ days', f'{target}_%']:.1f}%)")
 print()
-print(f"  Прирост от среднего: {int(comparison.loc['90+ days', 'Diff_Nov_vs_Avg']):+,}")
-print(f"  Прирост %: {(comparison.loc['90+ days', 'Diff_Nov_vs_Avg'] / comparison.loc['90+ days', 'Control_avg_count'] * 100):.1f}%")
+diff = comparison.loc['90+ days', f'Diff_{target}_vs_Avg']
+control_count = comparison.loc['90+ days', 'Control_avg_count']
+print(f"  Прирост от среднего: {int(diff):+,}")
+if control_count > 0:
+    print(f"  Прирост %: {(diff / control_count * 100):.1f}%")
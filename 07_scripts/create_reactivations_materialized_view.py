@@ -1,85 +1,57 @@
 #!/usr/bin/env python3
 """
-Создание материализованного представления для реактиваций
-Это позволит быстро фильтровать по дате в Dashboard без пересчета всех данных
+Создание и обновление таблицы реактиваций reactivations_materialized
+Это позволит быстро фильтровать по дате в Dashboard без пересчета всех данных.
+Повторный запуск обновляет только пользователей с новыми депозитами.
 """
 import sys
 import io
+import time
+import argparse
 from sqlalchemy import create_engine, text
-from db_utils import get_postgres_connection_string
+from db_utils import get_postgres_connection_string, ensure_loaded_at
+from reactivations_refresh import refresh_reactivations
 
 # Fix encoding for Windows console
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
 print("=" * 80)
-print("СОЗДАНИЕ МАТЕРИАЛИЗОВАННОГО ПРЕДСТАВЛЕНИЯ ДЛЯ РЕАКТИВАЦИЙ")
+print("ОБНОВЛЕНИЕ ТАБЛИЦЫ РЕАКТИВАЦИЙ (REACTIVATIONS_MATERIALIZED)")
 print("=" * 80)
 print()
 
+parser = argparse.ArgumentParser(description='Create or incrementally refresh reactivations_materialized')
+parser.add_argument('--full', action='store_true', help='Rebuild from all deposits instead of an incremental refresh')
+args = parser.parse_args()
+
 engine = create_engine(get_postgres_connection_string())
 
-print("1. Создание материализованного представления...")
-print("   Это может занять несколько минут (обработка ~8 млн депозитов)...")
+if args.full:
+    print("1. Полный пересчет реактиваций...")
+    print("   Это может занять несколько минут (обработка ~8 млн депозитов)...")
+else:
+    print("1. Инкрементальное обновление реактиваций...")
+    print("   Пересчитываются только пользователи с депозитами, загруженными после прошлого обновления")
+    print("   (первый запуск строит таблицу целиком)")
 print()
 
-# SQL для создания материализованного представления
-create_view_sql = """
--- Удаляем существующее представление, если есть
-DROP MATERIALIZED VIEW IF EXISTS reactivations_materialized CASCADE;
-
--- Создаем материализованное представление
-CREATE MATERIALIZED VIEW reactivations_materialized AS
-WITH 
--- 1. Получаем все депозиты, отсортированные по пользователю и дате
-all_deposits_ordered AS (
-    SELECT
-        external_user_id,
-        event_date as deposit_date,
-        LAG(event_date) OVER (PARTITION BY external_user_id ORDER BY event_date) as prev_deposit_date
-    FROM public.user_events
-    WHERE event_type = 'deposit'
-),
--- 2. Рассчитываем дни неактивности и категоризируем
-reactivations_with_period AS (
-    SELECT
-        external_user_id as user_id,
-        deposit_date as first_deposit,
-        prev_deposit_date,
-        CASE 
-            WHEN prev_deposit_date IS NOT NULL 
-            THEN EXTRACT(EPOCH FROM (deposit_date - prev_deposit_date)) / 86400
-            ELSE NULL
-        END as days_inactive,
-        CASE 
-            WHEN prev_deposit_date IS NULL THEN 'Новый пользователь'
-            WHEN EXTRACT(EPOCH FROM (deposit_date - prev_deposit_date)) / 86400 < 14 THEN '7-14 days'
-            WHEN EXTRACT(EPOCH FROM (deposit_date - prev_deposit_date)) / 86400 < 30 THEN '14-30 days'
-            WHEN EXTRACT(EPOCH FROM (deposit_date - prev_deposit_date)) / 86400 < 90 THEN '30-90 days'
-            ELSE '90+ days'
-        END as inactivity_period
-    FROM all_deposits_ordered
-)
-SELECT
-    user_id,
-    inactivity_period,
-    first_deposit,  -- Дата реактивации для фильтрации
-    days_inactive
-FROM reactivations_with_period
-WHERE prev_deposit_date IS NOT NULL  -- Только реактивации
-  AND days_inactive >= 7;  -- Исключаем реактивации менее 7 дней
-
--- Создаем индексы для быстрой фильтрации
-CREATE INDEX idx_reactivations_first_deposit ON reactivations_materialized(first_deposit);
-CREATE INDEX idx_reactivations_period ON reactivations_materialized(inactivity_period);
-CREATE INDEX idx_reactivations_user ON reactivations_materialized(user_id);
-"""
-
 try:
     with engine.connect() as conn:
         print("   Выполняю запрос...")
-        conn.execute(text(create_view_sql))
+        start_time = time.perf_counter()
+        # Скрипт настройки: loaded_at создается здесь, если загрузчики еще не запускались
+        ensure_loaded_at(conn)
         conn.commit()
-        print("   ✓ Материализованное представление создано")
+        stats = refresh_reactivations(conn, full=args.full)
+        elapsed = time.perf_counter() - start_time
+        if stats['mode'] == 'up-to-date':
+            print("   ✓ Новых депозитов нет, таблица актуальна")
+        elif stats['mode'] == 'full':
+            print(f"   ✓ Таблица построена целиком: {stats['inserted']:,} реактиваций ({elapsed:.1f} сек)")
+        else:
+            print(f"   ✓ Обновлено пользователей: {stats['affected_users']:,} "
+                  f"(удалено {stats['deleted']:,}, вставлено {stats['inserted']:,} строк, {elapsed:.1f} сек)")
+        print(f"   Watermark (loaded_at): {stats['watermark']}")
         print()
         
         # Проверяем количество записей
@@ -87,7 +59,7 @@ try:
         result = conn.execute(text(count_query))
         total = result.fetchone()[0]
         print(f"2. Проверка данных:")
-        print(f"   Всего реактиваций в представлении: {total:,}")
+        print(f"   Всего реактиваций в таблице: {total:,}")
         print()
         
         # Проверяем индексы
@@ -99,7 +71,7 @@ try:
         """
         indexes_result = conn.execute(text(indexes_query))
         indexes = [row[0] for row in indexes_result]
-        print(f"3. Созданные индексы:")
+        print(f"3. Индексы:")
         for idx in indexes:
             print(f"   - {idx}")
         print()
@@ -111,13 +83,13 @@ except Exception as e:
     sys.exit(1)
 
 print("=" * 80)
-print("МАТЕРИАЛИЗОВАННОЕ ПРЕДСТАВЛЕНИЕ УСПЕШНО СОЗДАНО!")
+print("ТАБЛИЦА РЕАКТИВАЦИЙ ОБНОВЛЕНА!")
 print("=" * 80)
 print()
 print("Теперь можно использовать быстрый запрос:")
 print("  SELECT * FROM reactivations_materialized WHERE first_deposit >= '2025-08-23' AND first_deposit <= '2025-08-25';")
 print()
-print("Для обновления данных (если добавились новые депозиты):")
-print("  REFRESH MATERIALIZED VIEW reactivations_materialized;")
+print("Для обновления данных (если добавились новые депозиты) запустите скрипт еще раз:")
+print("  python create_reactivations_materialized_view.py          # только изменившиеся пользователи")
+print("  python create_reactivations_materialized_view.py --full   # полный пересчет")
 print()
-
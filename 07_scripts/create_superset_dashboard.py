@@ -111,6 +111,7 @@ period_spend AS (
         spend,
         current_cpa
     FROM publisher_spend
+    JOIN publishers USING (publisher_id)  -- Название и формат из справочника
     WHERE publisher_id != 0
       AND spend >= 50
 ),
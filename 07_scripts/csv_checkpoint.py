@@ -0,0 +1,118 @@
+"""
+Byte-offset checkpoints for resumable CSV imports
+The reader tracks the byte offset after every chunk, so a restarted import
+seek()s straight to the first uncommitted row instead of re-tokenizing
+(skiprows) everything that was already loaded.
+"""
+import io
+import json
+import os
+import pandas as pd
+
+
+def checkpoint_path(csv_path):
+    """Path of the checkpoint file stored next to the CSV"""
+    return csv_path + '.checkpoint.json'
+
+
+def load_checkpoint(csv_path):
+    """
+    Load checkpoint for csv_path.
+
+    Returns:
+        dict with 'byte_offset', 'rows_committed' and 'completed' (the import
+        finished), or None if there is no checkpoint or the CSV file changed
+        (size/mtime differ) since it was written
+    """
+    path = checkpoint_path(csv_path)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+
+    stat = os.stat(csv_path)
+    if (checkpoint.get('file_path') != os.path.abspath(csv_path)
+            or checkpoint.get('file_size') != stat.st_size
+            or checkpoint.get('file_mtime') != stat.st_mtime):
+        print(f"⚠ Чекпоинт {path} относится к другой версии файла, игнорирую его")
+        return None
+    return checkpoint
+
+
+def save_checkpoint(csv_path, byte_offset, rows_committed, completed=False):
+    """
+    Atomically write checkpoint after a chunk has been committed.
+    completed=True marks the whole file as imported (after the final commit);
+    it stays valid only while the file keeps the same size and mtime.
+    """
+    stat = os.stat(csv_path)
+    checkpoint = {
+        'file_path': os.path.abspath(csv_path),
+        'file_size': stat.st_size,
+        'file_mtime': stat.st_mtime,
+        'byte_offset': byte_offset,
+        'rows_committed': rows_committed,
+        'completed': completed,
+    }
+    path = checkpoint_path(csv_path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def clear_checkpoint(csv_path):
+    """Remove checkpoint (e.g. after a completed import)"""
+    path = checkpoint_path(csv_path)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def iter_csv_chunks(csv_path, chunksize, start_offset=None, **read_csv_kwargs):
+    """
+    Read a CSV file in chunks while tracking byte offsets.
+    Records spanning several lines (quoted newlines) are kept together.
+
+    Args:
+        csv_path: path to CSV file with a header row
+        chunksize: rows per chunk
+        start_offset: byte offset to resume from (from a checkpoint);
+            None starts right after the header
+        **read_csv_kwargs: passed to pd.read_csv for every chunk
+
+    Yields:
+        (DataFrame, end_offset) tuples; end_offset is the byte offset of
+        the first row after the chunk, i.e. the value to checkpoint once
+        the chunk is committed
+    """
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        if start_offset is not None:
+            f.seek(start_offset)
+
+        while True:
+            buffer = io.BytesIO()
+            buffer.write(header)
+            rows = 0
+            in_quotes = False
+            while rows < chunksize:
+                line = f.readline()
+                if not line:
+                    break
+                buffer.write(line)
+                # Нечетное число кавычек в строке - запись продолжается на следующей строке
+                if line.count(b'"') % 2 == 1:
+                    in_quotes = not in_quotes
+                if not in_quotes:
+                    rows += 1
+
+            if rows == 0:
+                break
+
+            buffer.seek(0)
+            chunk_df = pd.read_csv(buffer, **read_csv_kwargs)
+            yield chunk_df, f.tell()
+
+            if rows < chunksize:
+                break
@@ -2,11 +2,26 @@
 Utility functions for database connection
 Supports both SQLite (legacy) and PostgreSQL
 """
+import io
 import os
-from sqlalchemy import create_engine, text
+import time
+import json
+import asyncio
+import atexit
+import hashlib
+from datetime import timedelta
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
 import pandas as pd
 
+# NULL marker used in COPY ... FORMAT csv buffers
+COPY_NULL = '\\N'
+
+# PIXEL_TS layout in pixel exports: '2025-12-02 14:03:27 UTC'
+PIXEL_TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+PIXEL_TS_PATTERN = r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?: UTC)?'
+
 def get_db_type():
     """Get database type from environment"""
     return os.environ.get('DB_TYPE', 'postgresql').lower()
@@ -45,52 +60,513 @@ def get_sqlite_path():
     # Docker default path
     return '/data/events.db'
 
+# Движки кэшируются на процесс: один пул соединений на строку подключения
+_engines = {}
+_pool_stats = {}
+
+def _env_flag(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def get_pool_settings():
+    """
+    Connection pool settings from environment variables:
+    DB_POOL_SIZE (10), DB_MAX_OVERFLOW (20), DB_POOL_TIMEOUT (30 s),
+    DB_POOL_RECYCLE (1800 s, -1 disables), DB_POOL_PRE_PING (true),
+    DB_PGBOUNCER (false) - PgBouncer in transaction mode pools connections
+    itself, so SQLAlchemy keeps none (NullPool) and pre-ping is skipped.
+    """
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '20')),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', True),
+        'pgbouncer': _env_flag('DB_PGBOUNCER', False),
+    }
+
+def _track_pool(engine):
+    stats = {'connects': 0, 'checkouts': 0, 'checkins': 0,
+             'waits': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+    _pool_stats[engine] = stats
+
+    def on_connect(dbapi_conn, connection_record):
+        stats['connects'] += 1
+
+    def on_checkout(dbapi_conn, connection_record, connection_proxy):
+        stats['checkouts'] += 1
+
+    def on_checkin(dbapi_conn, connection_record):
+        stats['checkins'] += 1
+
+    event.listen(engine, 'connect', on_connect)
+    event.listen(engine, 'checkout', on_checkout)
+    event.listen(engine, 'checkin', on_checkin)
+
+def get_engine(connection_string):
+    """
+    Get the process-wide engine for a connection string (created once,
+    pool configured by get_pool_settings()).
+    
+    Args:
+        connection_string: SQLAlchemy URL (postgresql://... or sqlite:///...)
+    
+    Returns:
+        SQLAlchemy Engine shared by all callers in this process
+    """
+    engine = _engines.get(connection_string)
+    if engine is not None:
+        return engine
+
+    settings = get_pool_settings()
+    if connection_string.startswith('sqlite'):
+        engine = create_engine(connection_string, pool_pre_ping=settings['pool_pre_ping'])
+        event.listen(engine, 'connect', register_sqlite_functions)
+    elif settings['pgbouncer']:
+        engine = create_engine(connection_string, poolclass=NullPool)
+    else:
+        engine = create_engine(
+            connection_string,
+            pool_size=settings['pool_size'],
+            max_overflow=settings['max_overflow'],
+            pool_timeout=settings['pool_timeout'],
+            pool_recycle=settings['pool_recycle'],
+            pool_pre_ping=settings['pool_pre_ping'],
+        )
+    _track_pool(engine)
+    _engines[connection_string] = engine
+    return engine
+
 def get_db_engine():
     """
     Get database engine (SQLAlchemy) for PostgreSQL or SQLite.
+    The engine and its pool are shared across calls (see get_engine).
     """
     db_type = get_db_type()
     
     if db_type == 'postgresql':
-        connection_string = get_postgres_connection_string()
-        return create_engine(connection_string, pool_pre_ping=True, pool_size=10, max_overflow=20)
+        return get_engine(get_postgres_connection_string())
     else:
         # SQLite (legacy support)
-        db_path = get_sqlite_path()
-        return create_engine(f'sqlite:///{db_path}', pool_pre_ping=True)
+        return get_engine(f'sqlite:///{get_sqlite_path()}')
+
+def connect_engine(engine):
+    """
+    Check out a connection from the engine's pool, recording how long the
+    checkout waited (see pool_stats).
+    """
+    started = time.perf_counter()
+    conn = engine.connect()
+    waited = time.perf_counter() - started
+    stats = _pool_stats.get(engine)
+    if stats is not None:
+        stats['waits'] += 1
+        stats['wait_seconds'] += waited
+        stats['max_wait_seconds'] = max(stats['max_wait_seconds'], waited)
+    return conn
 
 def get_db_connection():
     """
     Get database connection.
     Returns SQLAlchemy connection for compatibility with pandas.read_sql.
     """
-    engine = get_db_engine()
-    return engine.connect()
+    return connect_engine(get_db_engine())
 
-def execute_query(query, params=None):
+def pool_stats():
     """
-    Execute SQL query and return results as pandas DataFrame.
+    Pool statistics of every cached engine, for diagnosing slow scripts.
+    
+    Returns:
+        list of dicts: url (without password), pool (SQLAlchemy status line),
+        checked_out, connects (new DB connections), checkouts, checkins,
+        wait_seconds / max_wait_seconds (time spent in connect_engine)
+    """
+    result = []
+    for engine in _engines.values():
+        stats = _pool_stats.get(engine, {})
+        pool = engine.pool
+        result.append({
+            'url': engine.url.render_as_string(hide_password=True),
+            'pool': pool.status(),
+            'checked_out': pool.checkedout() if hasattr(pool, 'checkedout') else None,
+            **stats,
+        })
+    return result
+
+def print_pool_stats():
+    """Print pool_stats() (registered at exit when DB_POOL_STATS is set)"""
+    for stats in pool_stats():
+        print(f"[pool] {stats['url']}: {stats['pool']}")
+        print(f"[pool]   connects={stats.get('connects', 0)} checkouts={stats.get('checkouts', 0)} "
+              f"checked_out={stats['checked_out']} "
+              f"wait={stats.get('wait_seconds', 0.0):.3f}s max_wait={stats.get('max_wait_seconds', 0.0):.3f}s")
+
+def dispose_engines():
+    """Close all pooled connections and forget cached engines"""
+    for engine in _engines.values():
+        engine.dispose()
+    _engines.clear()
+    _pool_stats.clear()
+
+if _env_flag('DB_POOL_STATS'):
+    atexit.register(print_pool_stats)
+
+# Кэш результатов запросов на диске (opt-in): QUERY_CACHE_DIR включает кэш
+QUERY_CACHE_DEFAULT_DIR = '.query_cache'
+
+def get_query_cache_settings():
+    """
+    Query cache settings from environment variables:
+    QUERY_CACHE_DIR (cache is off when unset), QUERY_CACHE_TTL (seconds,
+    default 86400), QUERY_CACHE_MAX_MB (default 512, least recently used
+    entries are evicted above it).
+    """
+    return {
+        'dir': os.environ.get('QUERY_CACHE_DIR'),
+        'ttl': float(os.environ.get('QUERY_CACHE_TTL', '86400')),
+        'max_bytes': float(os.environ.get('QUERY_CACHE_MAX_MB', '512')) * 1024 * 1024,
+    }
+
+# Источники версии данных для ключа кэша: таблица -> колонка времени записи.
+# Каждый загрузчик/пересчет пишет сюда при любом изменении данных: user_events
+# (loaded_at), пересчеты deposit_summary/reactivations (refreshed_at, выполняются
+# после каждой загрузки пикселей, в том числе закоммиченной позже), spend-таблицы,
+# месячная агрегация и справочник publishers.
+# Удаление строк MAX не меняет, поэтому в версию входит и COUNT(*) источника -
+# кроме user_events (полный подсчет слишком дорог): строки оттуда уходят только
+# вместе с партициями, а список подключенных партиций тоже входит в версию
+DATA_VERSION_UNCOUNTED = {'user_events'}
+DATA_VERSION_SOURCES = {
+    'user_events': 'loaded_at',
+    'incremental_refresh_state': 'refreshed_at',
+    'publisher_spend_daily': 'created_at',
+    'publisher_spend': 'created_at',
+    'spend_loaded_files': 'loaded_at',
+    'spend_rollup_state': 'rolled_up_at',
+    'publishers': 'updated_at',
+}
+
+def get_data_version(conn):
+    """
+    Data-version key for cache entries, derived from the data itself rather
+    than from statistics counters (pg_stat_* are flushed lazily and reset on
+    restart). PostgreSQL: latest write timestamp and row count of every
+    table in DATA_VERSION_SOURCES (no count for DATA_VERSION_UNCOUNTED)
+    plus the attached user_events partitions; SQLite:
+    database file size and mtime.
+
+    Returns:
+        version string, or None when a source table has no timestamp column
+        (schema setup has not run) and results must not be cached
+    """
+    if conn.dialect.name == 'postgresql':
+        columns = {
+            (row[0], row[1]) for row in conn.execute(text("""
+                SELECT table_name, column_name
+                FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = ANY(:tables)
+            """), {'tables': list(DATA_VERSION_SOURCES)})
+        }
+        present = {table for table, _ in columns}
+        if any((table, column) not in columns
+               for table, column in DATA_VERSION_SOURCES.items() if table in present):
+            return None
+        parts = [
+            f"(SELECT MAX({column})::text FROM {table})"
+            if table in DATA_VERSION_UNCOUNTED else
+            f"(SELECT COALESCE(MAX({column})::text, '') || '#' || COUNT(*) FROM {table})"
+            for table, column in sorted(DATA_VERSION_SOURCES.items())
+            if table in present
+        ]
+        # Подключенные партиции: удаление/отключение месяца меняет данные без новых loaded_at
+        parts.append("""(
+            SELECT string_agg(c.relname, ',' ORDER BY c.relname)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass('user_events')
+        )""")
+        row = conn.execute(text(f"SELECT {', '.join(parts)}")).fetchone()
+        return '|'.join(str(value) for value in row)
+    stat = os.stat(get_sqlite_path())
+    return f"{stat.st_size}@{stat.st_mtime_ns}"
+
+def query_cache_key(query, params, url, data_version):
+    """Content address of a query result: normalized SQL, params, database and data version"""
+    normalized = ' '.join(query.split())
+    payload = json.dumps(
+        {'sql': normalized, 'params': params or {}, 'db': url, 'version': data_version},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _cache_entry_created(name):
+    # Имя файла: <key>-<время создания>.parquet; TTL считается от создания, LRU - по mtime
+    return int(name.rsplit('-', 1)[1].split('.', 1)[0])
+
+def _evict_query_cache(cache_dir, ttl, max_bytes):
+    """Drop entries created more than ttl ago, then least recently used ones above max_bytes"""
+    now = time.time()
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.parquet'):
+            continue
+        path = os.path.join(cache_dir, name)
+        stat = os.stat(path)
+        if now - _cache_entry_created(name) > ttl:
+            os.remove(path)
+        else:
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+def cached_read_sql(query, params=None, conn=None, cache_dir=None):
+    """
+    pd.read_sql with an on-disk Parquet cache. A hit needs the same
+    normalized SQL, params, database and data version (get_data_version)
+    within QUERY_CACHE_TTL; a hit refreshes the entry's LRU position.
+    Falls back to a plain query when pyarrow is missing, the data version
+    is unknown or the result can't be stored as Parquet.
     
     Args:
         query: SQL query string
         params: Optional parameters for parameterized queries
+        conn: existing connection (default: a pooled one)
+        cache_dir: cache directory (default: QUERY_CACHE_DIR or .query_cache)
     
     Returns:
         pandas DataFrame with results
     """
-    engine = get_db_engine()
-    with engine.connect() as conn:
+    if conn is None:
+        with get_db_connection() as own_conn:
+            return cached_read_sql(query, params=params, conn=own_conn, cache_dir=cache_dir)
+
+    settings = get_query_cache_settings()
+    cache_dir = cache_dir or settings['dir'] or QUERY_CACHE_DEFAULT_DIR
+    url = conn.engine.url.render_as_string(hide_password=True)
+    data_version = get_data_version(conn)
+    if data_version is None:
+        return pd.read_sql(text(query), conn, params=params or {})
+    key = query_cache_key(query, params, url, data_version)
+    now = time.time()
+    if os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            if not (name.startswith(f'{key}-') and name.endswith('.parquet')):
+                continue
+            if now - _cache_entry_created(name) > settings['ttl']:
+                continue
+            path = os.path.join(cache_dir, name)
+            try:
+                result = pd.read_parquet(path)
+                os.utime(path)
+                return result
+            except (ImportError, OSError, ValueError):
+                pass
+
+    result = pd.read_sql(text(query), conn, params=params or {})
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f'{key}-{int(now)}.parquet')
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        result.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        _evict_query_cache(cache_dir, settings['ttl'], settings['max_bytes'])
+    except (ImportError, OSError, ValueError, TypeError) as e:
+        print(f"[query cache] result not cached: {e}")
+    return result
+
+def execute_query(query, params=None, chunk_size=None, cache=None):
+    """
+    Execute SQL query and return results as pandas DataFrame.
+    
+    Args:
+        query: SQL query string
+        params: Optional parameters for parameterized queries
+        chunk_size: if set, stream the result instead (see iter_query)
+        cache: use the on-disk result cache (see cached_read_sql);
+            None - only when QUERY_CACHE_DIR is set, False - never
+    
+    Returns:
+        pandas DataFrame with results, or an iterator of DataFrames
+        of up to chunk_size rows when chunk_size is given
+    """
+    if chunk_size:
+        return iter_query(query, params=params, chunk_size=chunk_size)
+    if cache is None:
+        cache = bool(get_query_cache_settings()['dir'])
+    if cache:
+        return cached_read_sql(query, params=params)
+    with get_db_connection() as conn:
         if params:
             result = pd.read_sql(text(query), conn, params=params)
         else:
             result = pd.read_sql(text(query), conn)
     return result
 
+def iter_query(query, params=None, chunk_size=50000, conn=None):
+    """
+    Stream a query result as DataFrames of up to chunk_size rows.
+    On PostgreSQL stream_results/yield_per make psycopg2 use a named
+    server-side cursor, so only one chunk is held in memory at a time.
+    
+    Args:
+        query: SQL query string
+        params: Optional parameters for parameterized queries
+        chunk_size: rows per DataFrame (rows fetched per round trip)
+        conn: existing connection (e.g. one holding temp tables); default: a new one
+    
+    Yields:
+        DataFrames; a single empty DataFrame with the result columns if
+        the query returned no rows
+    """
+    if conn is None:
+        with get_db_connection() as own_conn:
+            yield from iter_query(query, params=params, chunk_size=chunk_size, conn=own_conn)
+        return
+
+    stream_conn = conn.execution_options(stream_results=True, yield_per=chunk_size)
+    result = stream_conn.execute(text(query), params or {})
+    columns = list(result.keys())
+    yielded = False
+    for rows in result.partitions():
+        yielded = True
+        yield pd.DataFrame(rows, columns=columns)
+    if not yielded:
+        yield pd.DataFrame(columns=columns)
+
+def _read_query(engine, query, params):
+    with connect_engine(engine) as conn:
+        return pd.read_sql(text(query), conn, params=params or {})
+
+async def run_queries_async(queries, engine=None, max_concurrency=None):
+    """
+    Run independent queries concurrently, each on its own pooled connection.
+    psycopg2 releases the GIL while waiting for the server, so the queries
+    overlap and a batch takes about as long as its slowest query.
+    
+    Args:
+        queries: dict name -> SQL string or (SQL string, params)
+        engine: SQLAlchemy engine (default: get_db_engine())
+        max_concurrency: queries in flight at once (default: pool size)
+    
+    Returns:
+        dict name -> DataFrame, in the order of queries
+    """
+    if engine is None:
+        engine = get_db_engine()
+    if max_concurrency is None:
+        size = engine.pool.size() if hasattr(engine.pool, 'size') else len(queries)
+        max_concurrency = max(1, min(len(queries), size))
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(query):
+        sql, params = query if isinstance(query, tuple) else (query, None)
+        async with semaphore:
+            return await asyncio.to_thread(_read_query, engine, sql, params)
+
+    results = await asyncio.gather(*(run_one(query) for query in queries.values()))
+    return dict(zip(queries.keys(), results))
+
+def run_queries(queries, engine=None, max_concurrency=None):
+    """Synchronous entry point for run_queries_async (for top-level scripts)"""
+    return asyncio.run(run_queries_async(queries, engine=engine, max_concurrency=max_concurrency))
+
+def write_csv_chunks(chunks, path, encoding='utf-8', **to_csv_kwargs):
+    """
+    Write an iterable of DataFrames to one CSV file as they arrive
+    (header from the first chunk).
+    
+    Returns:
+        Number of data rows written
+    """
+    rows = 0
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, index=False, header=(i == 0), **to_csv_kwargs)
+            rows += len(chunk)
+    return rows
+
+def write_parquet_chunks(chunks, path, compression='snappy'):
+    """
+    Write an iterable of DataFrames to one Parquet file, one row group per
+    chunk. The Arrow schema comes from the first chunk (all-NULL columns
+    are stored as strings); later chunks are cast to it. Requires pyarrow.
+    
+    Returns:
+        Number of rows written
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("pyarrow is required for Parquet export: pip install pyarrow")
+
+    writer = None
+    schema = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            if writer is None:
+                schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                for i, field in enumerate(schema):
+                    if pa.types.is_null(field.type):
+                        schema = schema.set(i, pa.field(field.name, pa.string()))
+                writer = pq.ParquetWriter(path, schema, compression=compression)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+def iter_sqlite_table(sqlite_conn, table_name, chunk_size=100000, after_rowid=0, max_rowid=None):
+    """
+    Stream a SQLite table in rowid order using keyset pagination.
+    Each chunk is fetched with WHERE rowid > :last ORDER BY rowid LIMIT n,
+    so SQLite seeks on the rowid B-tree instead of re-sorting and skipping
+    OFFSET rows for every chunk.
+    
+    Args:
+        sqlite_conn: sqlite3 connection
+        table_name: table to read (must be a rowid table)
+        chunk_size: rows per chunk
+        after_rowid: resume token - only rows with rowid > after_rowid are read
+        max_rowid: optional inclusive upper bound (for partitioned rowid ranges)
+    
+    Yields:
+        (DataFrame, last_rowid) tuples; last_rowid is the resume token
+        for the next call after the chunk has been committed
+    """
+    upper_bound_sql = "AND rowid <= ?" if max_rowid is not None else ""
+    query = f"""
+        SELECT rowid AS _source_rowid, *
+        FROM {table_name}
+        WHERE rowid > ? {upper_bound_sql}
+        ORDER BY rowid
+        LIMIT ?
+    """
+    last_rowid = after_rowid
+    while True:
+        if max_rowid is not None:
+            params = (last_rowid, max_rowid, chunk_size)
+        else:
+            params = (last_rowid, chunk_size)
+        chunk_df = pd.read_sql_query(query, sqlite_conn, params=params)
+        if len(chunk_df) == 0:
+            break
+        last_rowid = int(chunk_df['_source_rowid'].iloc[-1])
+        yield chunk_df.drop(columns=['_source_rowid']), last_rowid
+        if len(chunk_df) < chunk_size:
+            break
+
 def test_connection():
     """Test database connection"""
     try:
-        engine = get_db_engine()
-        with engine.connect() as conn:
+        with get_db_connection() as conn:
             result = conn.execute(text("SELECT 1"))
             result.fetchone()
         print(f"✓ Database connection successful ({get_db_type()})")
@@ -98,3 +574,533 @@ def test_connection():
     except Exception as e:
         print(f"✗ Database connection failed: {e}")
         return False
+
+def _copy_ready(df):
+    """
+    Prepare DataFrame for CSV serialization in COPY.
+    Float columns holding only whole numbers (e.g. INTEGER columns with NULLs
+    read through pandas) are cast to Int64 so that '123.0' never reaches an
+    INTEGER column.
+    """
+    df = df.copy()
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_float_dtype(series):
+            values = series.dropna()
+            if len(values) > 0 and (values % 1 == 0).all():
+                df[col] = series.astype('Int64')
+    return df
+
+def copy_dataframe(conn, df, table_name, columns=None):
+    """
+    Load DataFrame into a PostgreSQL table with COPY FROM STDIN.
+    
+    Args:
+        conn: SQLAlchemy connection (caller owns the transaction and commit)
+        df: pandas DataFrame to load
+        table_name: target table (may be schema-qualified)
+        columns: optional list of columns to load (default: all df columns)
+    
+    Returns:
+        Number of rows sent to the server
+    """
+    if columns is None:
+        columns = list(df.columns)
+    if len(df) == 0:
+        return 0
+
+    buffer = io.StringIO()
+    _copy_ready(df[columns]).to_csv(buffer, index=False, header=False, na_rep=COPY_NULL)
+    buffer.seek(0)
+
+    columns_sql = ', '.join(columns)
+    copy_sql = f"COPY {table_name} ({columns_sql}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+
+    cursor = conn.connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):
+            # psycopg2
+            cursor.copy_expert(copy_sql, buffer)
+        else:
+            # psycopg 3
+            with cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+    return len(df)
+
+def load_id_temp_table(conn, ids, table_name, column='external_user_id'):
+    """
+    Load a list of IDs into a session temp table (single TEXT primary key
+    column) so large cohorts are joined instead of inlined into the SQL text.
+    PostgreSQL loads it with COPY and ANALYZEs it, SQLite with executemany.
+    The table lives until the connection is closed; caller commits.
+    
+    Args:
+        conn: SQLAlchemy connection
+        ids: iterable of IDs (converted to str, duplicates and NULLs dropped)
+        table_name: temp table name (recreated if it exists)
+        column: column name
+    
+    Returns:
+        Number of distinct IDs loaded
+    """
+    ids_df = pd.DataFrame({column: pd.Series(list(ids), dtype=object)}).dropna()
+    ids_df[column] = ids_df[column].astype(str)
+    ids_df = ids_df.drop_duplicates()
+
+    conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
+    conn.execute(text(f"CREATE TEMP TABLE {table_name} ({column} TEXT PRIMARY KEY)"))
+    if conn.dialect.name == 'postgresql':
+        copy_dataframe(conn, ids_df, table_name)
+        conn.execute(text(f"ANALYZE {table_name}"))
+    elif len(ids_df) > 0:
+        conn.execute(
+            text(f"INSERT INTO {table_name} ({column}) VALUES (:id)"),
+            [{'id': value} for value in ids_df[column]],
+        )
+    return len(ids_df)
+
+def bulk_load_dataframes(chunks, table_name, engine=None, columns=None, progress=None):
+    """
+    Stream an iterable of DataFrames into a PostgreSQL table with COPY.
+    Each chunk is committed separately, so an interrupted load keeps
+    everything that was already written.
+    
+    Args:
+        chunks: iterable of pandas DataFrames
+        table_name: target table
+        engine: optional SQLAlchemy engine (default: get_db_engine())
+        columns: optional list of columns to load
+        progress: optional callback(rows_in_chunk) called after each commit
+    
+    Returns:
+        dict with 'rows', 'seconds' and 'rows_per_sec'
+    """
+    if engine is None:
+        engine = get_db_engine()
+
+    total_rows = 0
+    start_time = time.perf_counter()
+    with connect_engine(engine) as conn:
+        for chunk in chunks:
+            rows = copy_dataframe(conn, chunk, table_name, columns=columns)
+            conn.commit()
+            total_rows += rows
+            if progress is not None:
+                progress(rows)
+
+    return load_stats(total_rows, time.perf_counter() - start_time)
+
+def load_stats(rows, seconds):
+    """Build a load statistics dict with throughput in rows/sec"""
+    return {
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_sec': rows / seconds if seconds > 0 else 0.0,
+    }
+
+def parse_pixel_ts(values):
+    """
+    Parse PIXEL_TS strings to UTC timestamps.
+    Every distinct string is parsed once. Values in the fixed
+    'YYYY-MM-DD HH:MM:SS UTC' layout go through a single vectorized
+    strptime; only the remaining ones fall back to format inference.
+    
+    Args:
+        values: Series (or array-like) of timestamp strings
+    
+    Returns:
+        (Series of datetime64[ns, UTC] with NaT for unparseable values,
+         number of rows that took the slow path)
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return pd.to_datetime(series, utc=True), 0
+
+    # Повторяющиеся строки (события одной секунды) парсим один раз
+    codes, uniques = pd.factorize(series)
+    if len(uniques) == 0:
+        return pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns, UTC]', name=series.name), 0
+
+    parsed = pd.Series(pd.NaT, index=range(len(uniques)), dtype='datetime64[ns, UTC]')
+    uniques = pd.Series(uniques, dtype=object).astype(str).str.strip()
+    fast = uniques.str.fullmatch(PIXEL_TS_PATTERN)
+    if fast.any():
+        parsed[fast] = pd.to_datetime(
+            uniques[fast].str.slice(0, 19), format=PIXEL_TS_FORMAT, errors='coerce', utc=True
+        )
+
+    slow_rows = 0
+    slow = ~fast
+    if slow.any():
+        parsed[slow] = pd.to_datetime(
+            uniques[slow].str.replace(' UTC', '', regex=False), format='mixed', errors='coerce', utc=True
+        )
+        slow_rows = int(slow.to_numpy()[codes[codes >= 0]].sum())
+
+    result = pd.Series(parsed.array.take(codes, allow_fill=True), index=series.index, name=series.name)
+    return result, slow_rows
+
+# Кэш уже подключенных месячных партиций (в пределах процесса)
+_known_partitions = set()
+
+def month_partition_name(table_name, month_start):
+    """Name of the monthly partition, e.g. user_events_2025_12"""
+    return f"{table_name}_{month_start:%Y_%m}"
+
+def _month_start(value):
+    """Naive Timestamp of the first day of value's month (tz-aware values are taken in UTC)"""
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert('UTC').tz_localize(None)
+    return ts.to_period('M').to_timestamp()
+
+def is_partitioned_table(conn, table_name):
+    """Check whether a PostgreSQL table is declaratively partitioned"""
+    result = conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table_name)"),
+        {'table_name': table_name},
+    )
+    return result.fetchone() is not None
+
+def attached_partitions(conn, table_name='user_events'):
+    """
+    Names of partitions currently attached to table_name (pg_inherits).
+    A detached partition remains a standalone table, so to_regclass alone
+    can't tell whether a month is covered.
+    """
+    result = conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:table_name)
+    """), {'table_name': table_name})
+    return {row[0] for row in result}
+
+def ensure_month_partitions(conn, start, end, table_name='user_events'):
+    """
+    Create missing monthly range partitions covering [start, end].
+    Does nothing if the table is not partitioned (e.g. a legacy heap table).
+    Attached partitions are cached per process, so commit right away
+    (before writing data that may be rolled back).
+    
+    Args:
+        conn: SQLAlchemy connection (caller commits)
+        start: first timestamp/date to cover (str, datetime or Timestamp)
+        end: last timestamp/date to cover
+        table_name: partitioned parent table
+    
+    Returns:
+        List of created partition names
+
+    Raises:
+        RuntimeError: a month's partition table exists but is detached
+    """
+    if pd.isna(start) or pd.isna(end):
+        return []
+
+    months = pd.date_range(_month_start(start), _month_start(end), freq='MS')
+    missing = [m for m in months if month_partition_name(table_name, m) not in _known_partitions]
+    if not missing:
+        return []
+    if not is_partitioned_table(conn, table_name):
+        return []
+
+    attached = attached_partitions(conn, table_name)
+    created = []
+    for month in missing:
+        partition = month_partition_name(table_name, month)
+        if partition not in attached:
+            # Отсоединенная партиция - обычная таблица с тем же именем: CREATE IF NOT EXISTS ее не подключит
+            if conn.execute(text("SELECT to_regclass(:name)"), {'name': partition}).scalar() is not None:
+                raise RuntimeError(
+                    f"{partition} exists but is not attached to {table_name} (detached?): "
+                    f"re-attach it (ALTER TABLE {table_name} ATTACH PARTITION {partition} ...) "
+                    f"or rename/drop it before loading {month:%Y-%m}"
+                )
+            next_month = month + pd.offsets.MonthBegin(1)
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {partition}
+                PARTITION OF {table_name}
+                FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month:%Y-%m-%d}')
+            """))
+            created.append(partition)
+        _known_partitions.add(partition)
+    return created
+
+def detach_month_partition(conn, partition, table_name='user_events'):
+    """Detach a monthly partition (it stays as a standalone table; caller commits)"""
+    conn.execute(text(f"ALTER TABLE {table_name} DETACH PARTITION {partition}"))
+    _known_partitions.discard(partition)
+
+def list_month_partitions(conn, table_name='user_events'):
+    """
+    List partitions of a partitioned table with their bounds and size.
+    
+    Returns:
+        DataFrame with partition, bounds, total_bytes ordered by partition name
+    """
+    result = conn.execute(text("""
+        SELECT c.relname AS partition,
+               pg_get_expr(c.relpartbound, c.oid) AS bounds,
+               pg_total_relation_size(c.oid) AS total_bytes
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:table_name)
+        ORDER BY c.relname
+    """), {'table_name': table_name})
+    return pd.DataFrame(result.fetchall(), columns=['partition', 'bounds', 'total_bytes'])
+
+def create_staging_table(conn, staging_table, like_table):
+    """
+    Create an UNLOGGED staging table with the columns of like_table.
+    UNLOGGED skips WAL, so COPY into it is cheap; the data only needs to
+    survive until it is merged.
+    """
+    conn.execute(text(f"CREATE UNLOGGED TABLE IF NOT EXISTS {staging_table} (LIKE {like_table} INCLUDING DEFAULTS)"))
+
+def ensure_unique_index(conn, table_name, key_columns, index_name, dedupe=False):
+    """
+    Create a unique index on key_columns if it does not exist yet.
+    On a partitioned table the key must include the partition key.
+    
+    Args:
+        conn: SQLAlchemy connection (caller commits)
+        table_name: table to index
+        key_columns: list of key columns
+        index_name: index name
+        dedupe: delete rows duplicating an existing key first (keeps one row per key)
+    
+    Returns:
+        Number of duplicate rows deleted
+    """
+    exists = conn.execute(text("SELECT to_regclass(:name)"), {'name': index_name}).scalar()
+    if exists is not None:
+        return 0
+
+    deleted = 0
+    if dedupe:
+        key_match = ' AND '.join(f'a.{col} = b.{col}' for col in key_columns)
+        result = conn.execute(text(f"""
+            DELETE FROM {table_name} a
+            USING {table_name} b
+            WHERE a.tableoid = b.tableoid
+              AND a.ctid < b.ctid
+              AND {key_match}
+        """))
+        deleted = result.rowcount
+
+    keys_sql = ', '.join(key_columns)
+    conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {table_name} ({keys_sql})"))
+    return deleted
+
+def merge_staging_table(conn, staging_table, target_table, key_columns, columns, update=True,
+                        loaded_at_column=None):
+    """
+    Merge staged rows into target_table with one INSERT ... ON CONFLICT.
+    Rows repeated inside the staging table are collapsed to the last
+    loaded one first (ON CONFLICT cannot touch the same row twice).
+    Requires a unique index on key_columns.
+    
+    Args:
+        conn: SQLAlchemy connection (caller commits)
+        staging_table: table with staged rows
+        target_table: destination table
+        key_columns: conflict key, e.g. ['event_id', 'event_date']
+        columns: columns to insert (must include key_columns)
+        update: update non-key columns of existing rows (False: keep existing rows as is)
+        loaded_at_column: watermark column set to clock_timestamp() on inserted
+            and updated rows, so incremental refreshes see changed rows too
+    
+    Returns:
+        (inserted, updated) row counts
+    """
+    columns_sql = ', '.join(columns)
+    keys_sql = ', '.join(key_columns)
+    not_null_keys = ' AND '.join(f'{col} IS NOT NULL' for col in key_columns)
+    insert_columns_sql = columns_sql
+    select_columns_sql = columns_sql
+    if loaded_at_column:
+        insert_columns_sql += f', {loaded_at_column}'
+        select_columns_sql += ', clock_timestamp()'
+    if update:
+        update_set = ', '.join(f'{col} = EXCLUDED.{col}' for col in columns if col not in key_columns)
+        if loaded_at_column:
+            update_set += f', {loaded_at_column} = clock_timestamp()'
+        conflict_action = f"DO UPDATE SET {update_set}"
+    else:
+        conflict_action = "DO NOTHING"
+
+    result = conn.execute(text(f"""
+        WITH merged AS (
+            INSERT INTO {target_table} ({insert_columns_sql})
+            SELECT {select_columns_sql}
+            FROM (
+                SELECT DISTINCT ON ({keys_sql}) {columns_sql}
+                FROM {staging_table}
+                WHERE {not_null_keys}
+                ORDER BY {keys_sql}, ctid DESC
+            ) staged
+            ON CONFLICT ({keys_sql}) {conflict_action}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted)
+        FROM merged
+    """))
+    inserted, updated = result.fetchone()
+    return inserted, updated
+
+# Состояние инкрементально поддерживаемых таблиц: watermark по user_events.loaded_at
+WATERMARK_TABLE = 'incremental_refresh_state'
+
+# loaded_at - время внутри транзакции загрузки, а не время ее коммита: загрузка,
+# закоммиченная позже, может получить loaded_at ниже уже сохраненного watermark.
+# Поэтому инкрементальные пересчеты перечитывают окно перед watermark
+# (пересчет идемпотентен - пользователи из окна просто пересчитываются повторно)
+WATERMARK_SAFETY_MINUTES = int(os.getenv('WATERMARK_SAFETY_MINUTES', '60'))
+
+def ensure_refresh_state(conn):
+    """Create the watermark table of incremental refreshes (caller commits)"""
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            watermark TIMESTAMP,
+            refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+def ensure_loaded_at(conn):
+    """
+    Schema setup: make sure user_events has the loaded_at column used as
+    ingest watermark. Existing rows get the time of the ALTER (PostgreSQL
+    only; caller commits). ALTER TABLE locks user_events, so this runs only
+    in loaders/setup scripts, never in refreshes or reports.
+    """
+    conn.execute(text("""
+        ALTER TABLE public.user_events ADD COLUMN IF NOT EXISTS loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_user_events_loaded_at ON public.user_events(loaded_at)"))
+    ensure_refresh_state(conn)
+
+def require_loaded_at(conn):
+    """
+    Read-only check that schema setup (ensure_loaded_at) has run.
+
+    Raises:
+        RuntimeError: user_events has no loaded_at column
+    """
+    exists = conn.execute(text("""
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'user_events' AND column_name = 'loaded_at'
+    """)).fetchone() is not None
+    if not exists:
+        raise RuntimeError(
+            "user_events.loaded_at не найдена: сначала выполните загрузку "
+            "(migrate_to_postgresql.py или load_pixels_csv_to_postgresql.py), она создает колонку"
+        )
+
+def get_watermark(conn, table_name):
+    """Last user_events.loaded_at processed for table_name (None if never refreshed)"""
+    return conn.execute(
+        text(f"SELECT watermark FROM {WATERMARK_TABLE} WHERE table_name = :name"),
+        {'name': table_name},
+    ).scalar()
+
+def get_deposits_watermark(conn):
+    """Current max loaded_at among deposits (the watermark a refresh catches up to)"""
+    return conn.execute(
+        text("SELECT MAX(loaded_at) FROM public.user_events WHERE event_type = 'deposit'")
+    ).scalar()
+
+def watermark_since(watermark):
+    """Lower loaded_at bound of an incremental refresh: watermark minus the safety window"""
+    return watermark - timedelta(minutes=WATERMARK_SAFETY_MINUTES)
+
+def set_watermark(conn, table_name, watermark):
+    """Store watermark for table_name (in the caller's transaction)"""
+    conn.execute(
+        text(f"""
+            INSERT INTO {WATERMARK_TABLE} (table_name, watermark, refreshed_at)
+            VALUES (:name, :watermark, CURRENT_TIMESTAMP)
+            ON CONFLICT (table_name) DO UPDATE
+            SET watermark = EXCLUDED.watermark, refreshed_at = EXCLUDED.refreshed_at
+        """),
+        {'name': table_name, 'watermark': watermark},
+    )
+
+# Диалектные SQL-выражения: одинаковые запросы для PostgreSQL и SQLite
+DATE_TRUNC_UNITS = ('hour', 'day', 'week', 'month', 'year')
+
+def _md5_hash_int(value):
+    # Первые 7 hex-цифр md5 (28 бит) - то же значение, что sql_hash() дает в PostgreSQL
+    if value is None:
+        return None
+    return int(hashlib.md5(str(value).encode('utf-8')).hexdigest()[:7], 16)
+
+def register_sqlite_functions(dbapi_conn, connection_record=None):
+    """Register functions used by sql_hash() on a sqlite3 connection"""
+    dbapi_conn.create_function('md5_hash_int', 1, _md5_hash_int, deterministic=True)
+
+def sql_dialect(conn=None):
+    """
+    Backend name for SQL generation: 'postgresql' or 'sqlite'.
+    Taken from the connection when given, otherwise from DB_TYPE.
+    """
+    name = conn.dialect.name if conn is not None else get_db_type()
+    return 'postgresql' if name == 'postgresql' else 'sqlite'
+
+def sql_days_between(later, earlier, conn=None, whole=False):
+    """
+    SQL expression for the number of days between two timestamp expressions.
+
+    Args:
+        later, earlier: SQL expressions (column names)
+        conn: connection used to pick the dialect (default: DB_TYPE)
+        whole: truncate to whole days (integer), like CAST(julianday(...) AS INTEGER)
+    """
+    if sql_dialect(conn) == 'postgresql':
+        days = f"(EXTRACT(EPOCH FROM ({later} - {earlier})) / 86400)"
+        return f"CAST(TRUNC({days}) AS INTEGER)" if whole else days
+    days = f"(julianday({later}) - julianday({earlier}))"
+    return f"CAST({days} AS INTEGER)" if whole else days
+
+def sql_date_trunc(unit, expr, conn=None):
+    """
+    SQL expression truncating a timestamp to hour/day/week (Monday)/month/year.
+    PostgreSQL returns a timestamp, SQLite a 'YYYY-MM-DD HH:MM:SS' string -
+    both compare and group the same way as event_date.
+    """
+    if unit not in DATE_TRUNC_UNITS:
+        raise ValueError(f"Unsupported date_trunc unit: {unit}")
+    if sql_dialect(conn) == 'postgresql':
+        return f"DATE_TRUNC('{unit}', {expr})"
+    if unit == 'hour':
+        return f"strftime('%Y-%m-%d %H:00:00', {expr})"
+    if unit == 'week':
+        return (f"datetime({expr}, 'start of day', "
+                f"'-' || ((CAST(strftime('%w', {expr}) AS INTEGER) + 6) % 7) || ' days')")
+    return f"datetime({expr}, 'start of {unit}')"
+
+def sql_hash(expr, conn=None):
+    """
+    SQL expression with a stable non-negative integer hash of expr (28 bits
+    of its md5), identical on both backends - e.g. for deterministic user
+    bucketing: sql_hash('external_user_id') % 100. On SQLite it relies on
+    register_sqlite_functions (connections from get_db_engine have it).
+    """
+    if sql_dialect(conn) == 'postgresql':
+        return f"(('x' || substr(md5(CAST({expr} AS TEXT)), 1, 7))::bit(28)::int)"
+    return f"md5_hash_int({expr})"
+
+def ensure_deposit_index(conn):
+    """
+    Partial index on deposits (external_user_id, event_date): serves the
+    per-user window functions (LAG/ROW_NUMBER) of reactivation queries on
+    both backends. Caller commits.
+    """
+    conn.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_user_events_deposit_user_date
+            ON user_events(external_user_id, event_date) WHERE event_type = 'deposit'
+    """))
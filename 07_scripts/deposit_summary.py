@@ -0,0 +1,146 @@
+"""
+Per-user deposit summary (user_deposit_summary)
+One row per user with first/last deposit, deposit count and converted sum.
+FTD/RD classification joins it (event_date = first_deposit -> FTD) instead of
+building MIN(event_date) ... GROUP BY external_user_id over the whole
+user_events table in every query.
+
+On PostgreSQL the summary is refreshed incrementally: only users with
+deposits loaded after the stored watermark (user_events.loaded_at) are
+recomputed, so re-loaded events never double-count. Each refresh re-reads a
+safety window before the watermark (WATERMARK_SAFETY_MINUTES): loaded_at is
+set inside the load transaction, so a load that commits late can land below
+the stored watermark. On SQLite (legacy) it is
+rebuilt in full by import_to_sqlite.py or when the table is missing.
+Only loaders refresh the summary; reports just read it.
+"""
+from sqlalchemy import text
+from db_utils import (
+    ensure_refresh_state, require_loaded_at, get_watermark, get_deposits_watermark, set_watermark, watermark_since,
+)
+
+SUMMARY_TABLE = 'user_deposit_summary'
+
+create_summary_sql = f"""
+CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (
+    external_user_id TEXT PRIMARY KEY,
+    first_deposit TIMESTAMP NOT NULL,
+    last_deposit TIMESTAMP NOT NULL,
+    deposit_count BIGINT NOT NULL,
+    converted_sum DOUBLE PRECISION NOT NULL DEFAULT 0
+)
+"""
+
+# Агрегат по депозитам пользователя (одинаков для полного и инкрементального пересчета)
+summary_select_sql = """
+SELECT
+    e.external_user_id,
+    MIN(e.event_date),
+    MAX(e.event_date),
+    COUNT(*),
+    COALESCE(SUM(e.converted_amount), 0)
+FROM user_events e
+{join}
+WHERE e.event_type = 'deposit'
+  AND e.external_user_id IS NOT NULL
+GROUP BY e.external_user_id
+"""
+
+full_rebuild_sql = f"""
+INSERT INTO {SUMMARY_TABLE} (external_user_id, first_deposit, last_deposit, deposit_count, converted_sum)
+{summary_select_sql.format(join='')}
+"""
+
+affected_users_sql = """
+CREATE TEMP TABLE deposit_summary_users ON COMMIT DROP AS
+SELECT DISTINCT external_user_id
+FROM public.user_events
+WHERE event_type = 'deposit'
+  AND external_user_id IS NOT NULL
+  AND loaded_at > :since
+  AND loaded_at <= :new_watermark
+"""
+
+incremental_upsert_sql = f"""
+INSERT INTO {SUMMARY_TABLE} (external_user_id, first_deposit, last_deposit, deposit_count, converted_sum)
+{summary_select_sql.format(join='JOIN deposit_summary_users u ON u.external_user_id = e.external_user_id')}
+ON CONFLICT (external_user_id) DO UPDATE
+SET first_deposit = EXCLUDED.first_deposit,
+    last_deposit = EXCLUDED.last_deposit,
+    deposit_count = EXCLUDED.deposit_count,
+    converted_sum = EXCLUDED.converted_sum
+"""
+
+
+def deposit_summary_exists(conn):
+    """True if user_deposit_summary has been built (read-only check for reports)"""
+    if conn.dialect.name == 'postgresql':
+        return conn.execute(text("SELECT to_regclass(:name)"), {'name': SUMMARY_TABLE}).scalar() is not None
+    result = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': SUMMARY_TABLE},
+    )
+    return result.fetchone() is not None
+
+
+MISSING_SUMMARY_MESSAGE = (
+    f"ОШИБКА: таблица {SUMMARY_TABLE} не найдена. Она строится загрузчиками данных: "
+    "migrate_to_postgresql.py, load_pixels_csv_to_postgresql.py или import_to_sqlite.py"
+)
+
+
+def refresh_deposit_summary(conn, full=False):
+    """
+    Bring user_deposit_summary up to date with user_events.
+
+    Args:
+        conn: SQLAlchemy connection (PostgreSQL or SQLite)
+        full: rebuild from all deposits
+
+    Returns:
+        dict with mode ('full'/'incremental'/'up-to-date'), users (rows written)
+        and watermark
+    """
+    if conn.dialect.name != 'postgresql':
+        # SQLite: нет loaded_at - пересобираем, только если таблицы нет или попросили
+        exists = deposit_summary_exists(conn)
+        if exists and not full:
+            return {'mode': 'up-to-date', 'users': 0, 'watermark': None}
+        conn.execute(text(create_summary_sql))
+        conn.execute(text(f"DELETE FROM {SUMMARY_TABLE}"))
+        users = conn.execute(text(full_rebuild_sql)).rowcount
+        conn.commit()
+        return {'mode': 'full', 'users': users, 'watermark': None}
+
+    # loaded_at создается при настройке схемы (ensure_loaded_at в загрузчиках)
+    require_loaded_at(conn)
+    ensure_refresh_state(conn)
+    conn.execute(text(create_summary_sql))
+    conn.commit()
+
+    watermark = get_watermark(conn, SUMMARY_TABLE)
+    new_watermark = get_deposits_watermark(conn)
+    full = full or watermark is None
+    stats = {'mode': 'full' if full else 'incremental', 'users': 0, 'watermark': new_watermark}
+
+    if full:
+        conn.execute(text(f"DELETE FROM {SUMMARY_TABLE}"))
+        stats['users'] = conn.execute(text(full_rebuild_sql)).rowcount
+    elif new_watermark is None:
+        stats['mode'] = 'up-to-date'
+        conn.commit()
+        return stats
+    else:
+        # Окно перед watermark: загрузки, закоммиченные позже своего loaded_at
+        conn.execute(text(affected_users_sql), {'since': watermark_since(watermark), 'new_watermark': new_watermark})
+        stats['users'] = conn.execute(text(incremental_upsert_sql)).rowcount
+
+    if not full and stats['users'] == 0:
+        stats['mode'] = 'up-to-date'
+    # Watermark не откатывается назад (например, после удаления последних строк)
+    if watermark is not None and not full:
+        new_watermark = max(new_watermark, watermark)
+        stats['watermark'] = new_watermark
+    set_watermark(conn, SUMMARY_TABLE, new_watermark)
+    conn.commit()
+    return stats
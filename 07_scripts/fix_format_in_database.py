@@ -1,48 +1,33 @@
 #!/usr/bin/env python3
 """
 Исправление форматов в уже загруженных данных в PostgreSQL
-Обновляет format для паблишеров с неправильно определенным форматом
+Обновляет format в справочнике publishers для паблишеров с неправильно
+определенным форматом. Таблицы фактов (publisher_spend, publisher_spend_daily)
+хранят только publisher_id, поэтому пересчитывается одна небольшая таблица.
 """
 import pandas as pd
 import sys
 import io
-import re
+import argparse
 from sqlalchemy import create_engine, text
-from db_utils import get_postgres_connection_string
+from db_utils import get_postgres_connection_string, copy_dataframe
+from publisher_parsing import parse_publishers
+from publisher_dimension import PUBLISHERS_TABLE, publishers_exists, warn_legacy_spend_tables
 
 # Fix encoding for Windows console
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+MAPPING_TABLE = 'publisher_format_map'
+
+parser = argparse.ArgumentParser(description='Recalculate publisher formats in the publishers table')
+parser.add_argument('--dry-run', action='store_true', help='Show the diff without updating the database')
+args = parser.parse_args()
+
 print("=" * 80)
-print("ИСПРАВЛЕНИЕ ФОРМАТОВ В БАЗЕ ДАННЫХ")
+print("ИСПРАВЛЕНИЕ ФОРМАТОВ В БАЗЕ ДАННЫХ" + (" (DRY RUN)" if args.dry_run else ""))
 print("=" * 80)
 print()
 
-def extract_format_improved(publisher_str):
-    """Улучшенная функция определения формата"""
-    name_upper = str(publisher_str).upper()
-    
-    # Проверяем форматы в правильном порядке - сначала более специфичные
-    # POP - проверяем перед PUSH, чтобы перехватить "-POP" раньше
-    if re.search(r'-POP\b|POP-|POP\s|POP$', name_upper):
-        return 'POP'
-    # BANNER - проверяем первым среди остальных, так как может быть в конце названия
-    elif re.search(r'-BANNER\b|BANNER-|BANNER\s|BANNER$', name_upper):
-        return 'BANNER'
-    # VIDEO - проверяем перед PUSH
-    elif re.search(r'-VIDEO\b|VIDEO-|VIDEO\s|VIDEO$', name_upper):
-        return 'VIDEO'
-    # PUSH - проверяем последним, исключая случаи где PUSH внутри слова
-    # Ищем PUSH только как отдельное слово (после/перед дефисом или пробелом)
-    elif (re.search(r'-PUSH\b|PUSH-|PUSH\s|PUSH$|IN-PAGE|INPAGE', name_upper) and 
-          not re.search(r'[A-Z]PUSH[A-Z]', name_upper)):  # Исключаем PUSH внутри слова
-        return 'PUSH'
-    # NATIVE
-    elif re.search(r'-NATIVE\b|NATIVE-|NATIVE\s|NATIVE$', name_upper):
-        return 'NATIVE'
-    else:
-        return 'OTHER'
-
 # Connect to PostgreSQL
 print("1. Подключение к PostgreSQL...")
 pg_uri = get_postgres_connection_string()
@@ -50,118 +35,96 @@ engine = create_engine(pg_uri)
 print("   ✓ Подключено")
 print()
 
-# Get all unique publishers with their names
-print("2. Загрузка данных о паблишерах...")
-print()
+with engine.connect() as conn:
+    # Формат хранится только в справочнике publishers (таблицы фактов - по publisher_id).
+    # Только чтение: схема здесь не меняется
+    if not publishers_exists(conn):
+        print(f"   ✗ Таблица {PUBLISHERS_TABLE} не существует.")
+        print("   Загрузите расходы (load_spend_to_postgresql.py / load_daily_spend_to_postgresql.py)")
+        print("   или перенесите старые данные: python migrate_publishers_dimension.py --yes")
+        sys.exit(1)
+    warn_legacy_spend_tables(conn)
 
-# Check both tables
-tables_to_fix = ['publisher_spend', 'publisher_spend_daily']
+    print("2. Загрузка справочника паблишеров...")
+    print()
+    publishers = pd.read_sql(text(f"""
+        SELECT publisher_id, publisher_name, format AS old_format
+        FROM {PUBLISHERS_TABLE}
+        ORDER BY publisher_id
+    """), conn)
+    print(f"   Паблишеров: {len(publishers):,}")
+    print()
 
-for table_name in tables_to_fix:
-    print(f"3. Проверка таблицы {table_name}...")
+    # Recalculate format once per name (vectorized)
+    print("3. Пересчет форматов...")
     print()
-    
-    try:
-        # Get all unique publisher_name entries
-        query = f"""
-        SELECT DISTINCT publisher_id, publisher_name, format
-        FROM {table_name}
-        WHERE publisher_name IS NOT NULL
-        ORDER BY publisher_id;
-        """
-        
-        df = pd.read_sql(query, engine)
-        
-        if len(df) == 0:
-            print(f"   Таблица {table_name} пуста или не существует, пропускаю...")
-            print()
-            continue
-        
-        print(f"   Найдено уникальных паблишеров: {len(df)}")
+    publishers['new_format'] = parse_publishers(publishers['publisher_name'])['format'].astype(str)
+    diff = publishers[publishers['old_format'] != publishers['new_format']]
+
+    if len(diff) == 0:
+        print("   ✓ Все форматы корректны, изменений не требуется")
         print()
-        
-        # Recalculate format for each publisher
-        print("4. Пересчет форматов...")
+        sys.exit(0)
+
+    print(f"   Найдено несоответствий: {len(diff)} паблишеров")
+    print()
+    transitions = diff.groupby(['old_format', 'new_format']).size()
+    for (old_format, new_format), count in transitions.items():
+        print(f"   {old_format} → {new_format}: {count} паблишеров")
+    print()
+    print("   Примеры изменений:")
+    for _, change in diff.head(10).iterrows():  # Show first 10
+        print(f"   - Publisher {change['publisher_id']}: '{change['publisher_name']}'")
+        print(f"     {change['old_format']} → {change['new_format']}")
+    if len(diff) > 10:
+        print(f"   ... и еще {len(diff) - 10} изменений")
+    print()
+
+    if args.dry_run:
+        print("DRY RUN: база данных не изменена")
         print()
-        
-        updates = []
-        changes = []
-        
-        for idx, row in df.iterrows():
-            publisher_id = row['publisher_id']
-            publisher_name = row['publisher_name']
-            old_format = row['format']
-            
-            # Calculate new format
-            new_format = extract_format_improved(publisher_name)
-            
-            if old_format != new_format:
-                changes.append({
-                    'publisher_id': publisher_id,
-                    'publisher_name': publisher_name,
-                    'old_format': old_format,
-                    'new_format': new_format
-                })
-                updates.append({
-                    'publisher_id': publisher_id,
-                    'new_format': new_format
-                })
-        
-        if len(changes) > 0:
-            print(f"   Найдено несоответствий: {len(changes)}")
-            print()
-            print("   Примеры изменений:")
-            for change in changes[:10]:  # Show first 10
-                print(f"   - Publisher {change['publisher_id']}: '{change['publisher_name']}'")
-                print(f"     {change['old_format']} → {change['new_format']}")
-            if len(changes) > 10:
-                print(f"   ... и еще {len(changes) - 10} изменений")
-            print()
-            
-            # Update database
-            print("5. Обновление базы данных...")
-            print()
-            
-            with engine.connect() as conn:
-                for update in updates:
-                    update_sql = text(f"""
-                        UPDATE {table_name}
-                        SET format = :new_format
-                        WHERE publisher_id = :publisher_id
-                    """)
-                    conn.execute(update_sql, {
-                        'new_format': update['new_format'],
-                        'publisher_id': update['publisher_id']
-                    })
-                conn.commit()
-            
-            print(f"   ✓ Обновлено записей: {len(updates)}")
-            print()
-            
-            # Verify
-            print("6. Проверка результатов...")
-            print()
-            
-            verify_query = f"""
-            SELECT format, COUNT(*) as count
-            FROM {table_name}
-            GROUP BY format
-            ORDER BY format;
-            """
-            
-            verify_df = pd.read_sql(verify_query, engine)
-            print("   Распределение по форматам:")
-            for _, row in verify_df.iterrows():
-                print(f"     {row['format']}: {row['count']} записей")
-            print()
-        else:
-            print("   ✓ Все форматы корректны, изменений не требуется")
-            print()
-    
+        sys.exit(0)
+
+    # Один UPDATE ... FROM по таблице соответствий, в одной транзакции
+    print("4. Обновление справочника...")
+    print()
+    try:
+        conn.execute(text(f"""
+            CREATE TEMP TABLE {MAPPING_TABLE} (
+                publisher_id BIGINT PRIMARY KEY,
+                format VARCHAR(50) NOT NULL
+            ) ON COMMIT DROP
+        """))
+        copy_dataframe(conn, diff[['publisher_id', 'new_format']].rename(columns={'new_format': 'format'}),
+                       MAPPING_TABLE)
+        updated = conn.execute(text(f"""
+            UPDATE {PUBLISHERS_TABLE} p
+            SET format = m.format,
+                updated_at = CURRENT_TIMESTAMP
+            FROM {MAPPING_TABLE} m
+            WHERE m.publisher_id = p.publisher_id
+        """)).rowcount
+        conn.commit()
     except Exception as e:
-        print(f"   ✗ Ошибка при обработке таблицы {table_name}: {e}")
-        print()
-        continue
+        conn.rollback()
+        print(f"   ✗ Ошибка, изменения отменены: {e}")
+        sys.exit(1)
+    print(f"   ✓ Обновлено паблишеров: {updated:,}")
+    print()
+
+    # Verify
+    print("Проверка результатов...")
+    print()
+    verify_df = pd.read_sql(text(f"""
+        SELECT format, COUNT(*) as count
+        FROM {PUBLISHERS_TABLE}
+        GROUP BY format
+        ORDER BY format
+    """), conn)
+    print(f"   {PUBLISHERS_TABLE} - распределение по форматам:")
+    for _, row in verify_df.iterrows():
+        print(f"     {row['format']}: {row['count']} паблишеров")
+    print()
 
 print("=" * 80)
 print("ИСПРАВЛЕНИЕ ЗАВЕРШЕНО!")
@@ -172,4 +135,3 @@ print("  - RealPush-UGW-Banner → BANNER (не PUSH)")
 print("  - Pushub-UGW-Video → VIDEO (не PUSH)")
 print("  - И другие подобные случаи")
 print()
-
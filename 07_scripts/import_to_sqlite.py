@@ -5,17 +5,25 @@ Import CSV to SQLite database (no size limits!)
 import pandas as pd
 import sqlite3
 from datetime import datetime
+from sqlalchemy import create_engine
+from ingest_pipeline import run_pipeline
+from db_utils import parse_pixel_ts
+from pixel_schema import pixel_read_csv_kwargs, coerce_pixel_ids
+from deposit_summary import refresh_deposit_summary
+from csv_checkpoint import load_checkpoint, save_checkpoint, checkpoint_path, iter_csv_chunks
 
 CSV_FILE = r"C:\Users\Nalivator3000\Downloads\pixels-019b0312-fc43-7d21-b9c4-4f4b98deaa2a-12-09-2025-12-25-34-01.csv"
 SQLITE_DB = r"C:\Users\Nalivator3000\superset-data-import\events.db"
 CHUNK_SIZE = 50000
-SKIP_ROWS = 11100000  # Skip first 11.1M rows (already imported)
+TRANSFORM_WORKERS = 2  # Threads running process_chunk while the previous chunk is being written
+QUEUE_SIZE = 4  # Max chunks buffered between pipeline stages (bounds memory)
 
+# user_events columns, in INSERT order (read_csv renames/types them via pixel_schema)
 COLUMNS_TO_KEEP = [
-    'ID', 'EXTERNAL_USER_ID', 'UBIDEX_ID', 'TYPE', 'PIXEL_TS',
-    'PUBLISHER_ID', 'CAMPAIGN_ID', 'SUB_ID', 'AFFILIATE_ID',
-    'DEPOSIT_AMOUNT', 'CURRENCY', 'CONVERTED_AMOUNT', 'CONVERTED_CURRENCY',
-    'WEBSITE', 'COUNTRY', 'TRANSACTION_ID'
+    'event_id', 'external_user_id', 'ubidex_id', 'event_type',
+    'event_date', 'publisher_id', 'campaign_id', 'sub_id',
+    'affiliate_id', 'deposit_amount', 'currency', 'converted_amount',
+    'converted_currency', 'website', 'country', 'transaction_id'
 ]
 
 def create_table(conn):
@@ -53,27 +61,16 @@ def create_table(conn):
 
 def process_chunk(chunk_df):
     """Process chunk"""
-    chunk_df = chunk_df[COLUMNS_TO_KEEP].copy()
-    chunk_df.columns = [
-        'event_id', 'external_user_id', 'ubidex_id', 'event_type',
-        'event_date', 'publisher_id', 'campaign_id', 'sub_id',
-        'affiliate_id', 'deposit_amount', 'currency', 'converted_amount',
-        'converted_currency', 'website', 'country', 'transaction_id'
-    ]
-
-    # Fix dates
-    chunk_df['event_date'] = chunk_df['event_date'].str.replace(' UTC', '', regex=False)
-    chunk_df['event_date'] = pd.to_datetime(chunk_df['event_date'], format='%Y-%m-%d %H:%M:%S %z', errors='coerce')
+    chunk_df = coerce_pixel_ids(chunk_df[COLUMNS_TO_KEEP].copy())
+
+    # Fix dates (vectorized for the standard 'YYYY-MM-DD HH:MM:SS UTC' layout)
+    chunk_df['event_date'], slow_ts_rows = parse_pixel_ts(chunk_df['event_date'])
     chunk_df = chunk_df.dropna(subset=['event_date'])
 
     # Convert timestamp to string for SQLite
     chunk_df['event_date'] = chunk_df['event_date'].dt.strftime('%Y-%m-%d %H:%M:%S')
 
-    # Convert numeric (but keep ubidex_id as string - it's too large for SQLite INTEGER)
-    chunk_df['publisher_id'] = pd.to_numeric(chunk_df['publisher_id'], errors='coerce').astype('Int64')
-    chunk_df['campaign_id'] = pd.to_numeric(chunk_df['campaign_id'], errors='coerce').astype('Int64')
-    chunk_df['deposit_amount'] = pd.to_numeric(chunk_df['deposit_amount'], errors='coerce')
-    chunk_df['converted_amount'] = pd.to_numeric(chunk_df['converted_amount'], errors='coerce')
+    # Amounts are typed by read_csv (float64), IDs by coerce_pixel_ids (Int64)
 
     # Convert ubidex_id to string to avoid overflow
     chunk_df['ubidex_id'] = chunk_df['ubidex_id'].astype(str)
@@ -81,15 +78,26 @@ def process_chunk(chunk_df):
     # Replace NaN with None for SQL NULL
     chunk_df = chunk_df.where(pd.notnull(chunk_df), None)
 
-    return chunk_df
+    return chunk_df, slow_ts_rows
 
 print("=" * 80)
-print("CSV to SQLite Import (RESUME)")
+print("CSV to SQLite Import")
 print("=" * 80)
 print(f"\nCSV File: {CSV_FILE}")
 print(f"SQLite DB: {SQLITE_DB}")
 print(f"Chunk size: {CHUNK_SIZE:,}")
-print(f"Skipping first: {SKIP_ROWS:,} rows (already imported)")
+
+# Resume from byte-offset checkpoint (written after every committed chunk)
+checkpoint = load_checkpoint(CSV_FILE)
+if checkpoint:
+    resume_offset = checkpoint['byte_offset']
+    resume_rows = checkpoint['rows_committed']
+    print(f"Resuming from checkpoint: {resume_rows:,} rows already imported (byte offset {resume_offset:,})")
+else:
+    resume_offset = None
+    resume_rows = 0
+    print("No checkpoint found, importing from the beginning")
+print(f"Checkpoint file: {checkpoint_path(CSV_FILE)}")
 
 # Connect to SQLite
 print("\nConnecting to SQLite...")
@@ -111,53 +119,77 @@ if existing_count > 0:
 print("\nStarting import...")
 print("Progress updates every 100k rows.\n")
 
-rows_processed = SKIP_ROWS  # Start counting from where we left off
+rows_processed = resume_rows  # Start counting from where we left off
 rows_inserted = 0
+slow_ts_rows = 0  # PIXEL_TS values outside the standard layout (slow parsing path)
 start_time = datetime.now()
 total_rows = 21583338
 
+def transform(chunk):
+    """Pipeline stage: parse/clean a raw CSV chunk"""
+    chunk_df, end_offset = chunk
+    processed_chunk, slow_rows = process_chunk(chunk_df)
+    return processed_chunk, len(chunk_df), end_offset, slow_rows
+
+def write_chunk(item):
+    """Pipeline stage: insert processed chunk (runs in main thread, owns the connection)"""
+    global rows_processed, rows_inserted, slow_ts_rows
+    processed_chunk, raw_rows, end_offset, slow_rows = item
+    slow_ts_rows += slow_rows
+
+    # Insert into SQLite with INSERT OR IGNORE to skip duplicates
+    cursor = conn.cursor()
+    data = [tuple(row) for row in processed_chunk.values]
+    cursor.executemany("""
+        INSERT OR IGNORE INTO user_events (
+            event_id, external_user_id, ubidex_id, event_type, event_date,
+            publisher_id, campaign_id, sub_id, affiliate_id,
+            deposit_amount, currency, converted_amount, converted_currency,
+            website, country, transaction_id
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, data)
+    conn.commit()
+
+    rows_processed += raw_rows
+    rows_inserted += len(processed_chunk)
+    save_checkpoint(CSV_FILE, end_offset, rows_processed)
+
+    if rows_processed % 100000 == 0:
+        elapsed = (datetime.now() - start_time).total_seconds()
+        rate = (rows_processed - resume_rows) / elapsed
+        remaining = total_rows - rows_processed
+        eta = remaining / rate / 60 if rate > 0 else 0
+
+        print(f"Progress: {rows_processed:,} / {total_rows:,} ({rows_processed/total_rows*100:.1f}%) | "
+              f"Rate: {rate:.0f} rows/sec | ETA: {eta:.0f} min")
+
 try:
-    for chunk_num, chunk in enumerate(pd.read_csv(
+    reader = iter_csv_chunks(
         CSV_FILE,
-        chunksize=CHUNK_SIZE,
-        skiprows=range(1, SKIP_ROWS + 1),  # Skip header row 0 + data rows 1 to SKIP_ROWS
-        low_memory=False
-    ), 1):
-        processed_chunk = process_chunk(chunk)
-
-        # Insert into SQLite with INSERT OR IGNORE to skip duplicates
-        cursor = conn.cursor()
-        data = [tuple(row) for row in processed_chunk.values]
-        cursor.executemany("""
-            INSERT OR IGNORE INTO user_events (
-                event_id, external_user_id, ubidex_id, event_type, event_date,
-                publisher_id, campaign_id, sub_id, affiliate_id,
-                deposit_amount, currency, converted_amount, converted_currency,
-                website, country, transaction_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, data)
-        conn.commit()
-
-        rows_processed += len(chunk)
-        rows_inserted += len(processed_chunk)
-
-        if rows_processed % 100000 == 0:
-            elapsed = (datetime.now() - start_time).total_seconds()
-            rate = (rows_processed - SKIP_ROWS) / elapsed
-            remaining = total_rows - rows_processed
-            eta = remaining / rate / 60 if rate > 0 else 0
-
-            print(f"Progress: {rows_processed:,} / {total_rows:,} ({rows_processed/total_rows*100:.1f}%) | "
-                  f"Rate: {rate:.0f} rows/sec | ETA: {eta:.0f} min")
+        CHUNK_SIZE,
+        start_offset=resume_offset,  # seek() straight past already imported rows
+        **pixel_read_csv_kwargs(CSV_FILE, columns=COLUMNS_TO_KEEP)
+    )
+    pipeline_stats = run_pipeline(reader, transform, write_chunk, workers=TRANSFORM_WORKERS, queue_size=QUEUE_SIZE)
 
     elapsed_total = (datetime.now() - start_time).total_seconds()
     print("\n" + "=" * 80)
     print("OK Import completed!")
     print("=" * 80)
-    print(f"New rows processed: {rows_processed - SKIP_ROWS:,}")
+    print(f"New rows processed: {rows_processed - resume_rows:,}")
     print(f"New rows inserted: {rows_inserted:,}")
     print(f"Time elapsed: {elapsed_total/60:.1f} minutes")
-    print(f"Average rate: {(rows_processed - SKIP_ROWS)/elapsed_total:.0f} rows/sec")
+    print(f"Average rate: {(rows_processed - resume_rows)/elapsed_total:.0f} rows/sec")
+    print(f"Time spent writing to SQLite: {pipeline_stats['write_seconds']/60:.1f} minutes "
+          f"({pipeline_stats['write_seconds']/elapsed_total*100:.0f}% of total)")
+    print(f"PIXEL_TS outside 'YYYY-MM-DD HH:MM:SS UTC' (slow parsing path): {slow_ts_rows:,} rows")
+    print(f"Checkpoint kept at {checkpoint_path(CSV_FILE)} (delete it to re-import from scratch)")
+
+    # Rebuild per-user deposit summary used by the FTD/RD analysis scripts
+    print("\nRebuilding user_deposit_summary...")
+    with create_engine(f'sqlite:///{SQLITE_DB}').connect() as summary_conn:
+        summary_stats = refresh_deposit_summary(summary_conn, full=True)
+    print(f"OK Users with deposits: {summary_stats['users']:,}")
 
     # Final count
     cursor.execute("SELECT COUNT(*) FROM user_events")
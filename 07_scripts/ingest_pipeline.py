@@ -0,0 +1,131 @@
+"""
+Pipelined ingest: reader thread -> N transform workers -> writer
+Overlaps CSV parsing, chunk processing and database writes with
+bounded queues, so memory stays flat while the DB is kept busy.
+"""
+import queue
+import threading
+import time
+
+# Маркеры в очередях
+_END = object()
+
+
+class _Failure:
+    """Wraps an exception raised in a reader/worker thread"""
+
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _put(q, item, stop_event):
+    """Blocking put that gives up when the pipeline is stopping"""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def run_pipeline(chunks, transform, write, workers=2, queue_size=4):
+    """
+    Run a read -> transform -> write pipeline.
+
+    The chunks iterable is consumed in a reader thread (e.g. pd.read_csv with
+    chunksize), transform runs in `workers` threads, and write is called in
+    the calling thread, which therefore owns the database connection.
+    Chunks are written in their original order. Queues hold at most
+    `queue_size` chunks each, so a slow writer throttles the reader.
+
+    Args:
+        chunks: iterable of raw chunks
+        transform: function(raw_chunk) -> processed chunk
+        write: function(processed_chunk) called in order for every chunk
+        workers: number of transform threads
+        queue_size: capacity of the raw and processed queues
+
+    Returns:
+        dict with 'chunks', 'seconds' and 'write_seconds'
+    """
+    raw_queue = queue.Queue(maxsize=queue_size)
+    done_queue = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+
+    def reader():
+        try:
+            for seq, chunk in enumerate(chunks):
+                if not _put(raw_queue, (seq, chunk), stop_event):
+                    return
+        except Exception as e:
+            _put(done_queue, _Failure(e), stop_event)
+        finally:
+            for _ in range(workers):
+                _put(raw_queue, _END, stop_event)
+
+    def worker():
+        while not stop_event.is_set():
+            try:
+                item = raw_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if item is _END:
+                _put(done_queue, _END, stop_event)
+                return
+            seq, chunk = item
+            try:
+                result = transform(chunk)
+            except Exception as e:
+                _put(done_queue, _Failure(e), stop_event)
+                return
+            if not _put(done_queue, (seq, result), stop_event):
+                return
+
+    threads = [threading.Thread(target=reader, name='ingest-reader', daemon=True)]
+    threads += [
+        threading.Thread(target=worker, name=f'ingest-worker-{i}', daemon=True)
+        for i in range(workers)
+    ]
+
+    start_time = time.perf_counter()
+    write_seconds = 0.0
+    written = 0
+    next_seq = 0
+    pending = {}
+    finished_workers = 0
+
+    for thread in threads:
+        thread.start()
+    try:
+        while finished_workers < workers or pending:
+            if next_seq in pending:
+                write_start = time.perf_counter()
+                write(pending.pop(next_seq))
+                write_seconds += time.perf_counter() - write_start
+                next_seq += 1
+                written += 1
+                continue
+
+            if finished_workers == workers:
+                # Все воркеры завершились, но ожидаемого чанка нет
+                raise RuntimeError(f"Ingest pipeline lost chunk #{next_seq}")
+
+            item = done_queue.get()
+            if item is _END:
+                finished_workers += 1
+            elif isinstance(item, _Failure):
+                raise item.exc
+            else:
+                seq, result = item
+                pending[seq] = result
+    finally:
+        stop_event.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+    return {
+        'chunks': written,
+        'seconds': time.perf_counter() - start_time,
+        'write_seconds': write_seconds,
+    }
@@ -2,7 +2,7 @@ import pandas as pd
 import sqlite3
 import sys
 import io
-import re
+from publisher_parsing import parse_publishers
 
 # Fix encoding for Windows console
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -12,13 +12,6 @@ print("ИНТЕГРАЦИЯ SPEND С FTD/RD СТАТИСТИКОЙ")
 print("=" * 80)
 print()
 
-# Function to extract publisher_id from format "(ID) Name"
-def extract_publisher_id(publisher_str):
-    match = re.match(r'\((\d+)\)', str(publisher_str))
-    if match:
-        return int(match.group(1))
-    return None
-
 # Load November spend data
 print("1. Загружаю данные по расходам...")
 print()
@@ -27,8 +20,8 @@ nov_spend = pd.read_csv('C:/Users/Nalivator3000/Downloads/export (1).csv', skipr
 oct_spend = pd.read_csv('C:/Users/Nalivator3000/Downloads/export (2).csv', skiprows=1)
 
 # Extract publisher IDs
-nov_spend['publisher_id'] = nov_spend['Publisher'].apply(extract_publisher_id)
-oct_spend['publisher_id'] = oct_spend['Publisher'].apply(extract_publisher_id)
+nov_spend['publisher_id'] = parse_publishers(nov_spend['Publisher'])['publisher_id']
+oct_spend['publisher_id'] = parse_publishers(oct_spend['Publisher'])['publisher_id']
 
 # Keep only relevant columns and rename
 nov_spend = nov_spend[['publisher_id', 'Publisher', 'FTD', 'Deposit', 'Spend']].copy()
@@ -56,27 +49,25 @@ print()
 print("2. Загружаю FTD/RD статистику из базы данных...")
 print()
 
-from db_utils import get_db_connection
+from db_utils import get_db_connection, run_queries
+from deposit_summary import deposit_summary_exists, MISSING_SUMMARY_MESSAGE
 conn = get_db_connection()
+# FTD/RD берем из user_deposit_summary (ее обновляют загрузчики, отчет только читает)
+if not deposit_summary_exists(conn):
+    print(MISSING_SUMMARY_MESSAGE)
+    sys.exit(1)
+conn.close()
 
 # November FTD/RD
 query_nov = '''
-WITH user_first_deposit_ever AS (
-    SELECT
-        external_user_id,
-        MIN(event_date) as first_deposit_ever
-    FROM user_events
-    WHERE event_type = 'deposit'
-    GROUP BY external_user_id
-),
-nov_deposits AS (
+WITH nov_deposits AS (
     SELECT
         e.external_user_id,
         e.publisher_id,
         e.event_date,
-        f.first_deposit_ever
+        f.first_deposit AS first_deposit_ever
     FROM user_events e
-    LEFT JOIN user_first_deposit_ever f
+    LEFT JOIN user_deposit_summary f
         ON e.external_user_id = f.external_user_id
     WHERE e.event_type = 'deposit'
       AND e.event_date >= '2025-11-01 00:00:00'
@@ -91,26 +82,16 @@ FROM nov_deposits
 GROUP BY publisher_id
 '''
 
-nov_db_stats = pd.read_sql(query_nov, conn)
-
 # October FTD/RD
 query_oct = '''
-WITH user_first_deposit_ever AS (
-    SELECT
-        external_user_id,
-        MIN(event_date) as first_deposit_ever
-    FROM user_events
-    WHERE event_type = 'deposit'
-    GROUP BY external_user_id
-),
-oct_deposits AS (
+WITH oct_deposits AS (
     SELECT
         e.external_user_id,
         e.publisher_id,
         e.event_date,
-        f.first_deposit_ever
+        f.first_deposit AS first_deposit_ever
     FROM user_events e
-    LEFT JOIN user_first_deposit_ever f
+    LEFT JOIN user_deposit_summary f
         ON e.external_user_id = f.external_user_id
     WHERE e.event_type = 'deposit'
       AND e.event_date >= '2025-10-01 00:00:00'
@@ -125,8 +106,10 @@ FROM oct_deposits
 GROUP BY publisher_id
 '''
 
-oct_db_stats = pd.read_sql(query_oct, conn)
-conn.close()
+# Ноябрь и октябрь независимы - выполняем одновременно на двух соединениях пула
+db_stats = run_queries({'nov': query_nov, 'oct': query_oct})
+nov_db_stats = db_stats['nov']
+oct_db_stats = db_stats['oct']
 
 print(f"   November: {len(nov_db_stats)} паблишеров с депозитами")
 print(f"   October:  {len(oct_db_stats)} паблишеров с депозитами")
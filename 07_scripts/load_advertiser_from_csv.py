@@ -8,7 +8,8 @@ import io
 import os
 import argparse
 from sqlalchemy import create_engine, text
-from db_utils import get_postgres_connection_string
+from db_utils import get_postgres_connection_string, copy_dataframe
+from pixel_parquet import read_pixel_dataset
 
 # Fix encoding for Windows console
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -19,7 +20,11 @@ print("=" * 80)
 print()
 
 parser = argparse.ArgumentParser(description='Load advertiser data from CSV to user_events')
-parser.add_argument('--csv', type=str, required=True, help='Path to CSV file with advertiser data')
+parser.add_argument('--csv', type=str, default=None, help='Path to CSV file with advertiser data')
+parser.add_argument('--parquet', type=str, default=None,
+                    help='Read advertiser from staged pixel Parquet dataset (convert_pixels_to_parquet.py) instead of --csv')
+parser.add_argument('--start-date', type=str, default=None, help='With --parquet: first event day to read (YYYY-MM-DD)')
+parser.add_argument('--end-date', type=str, default=None, help='With --parquet: last event day to read (YYYY-MM-DD)')
 parser.add_argument('--link-column', type=str, default='event_id', 
                     help='Column name in CSV to link with user_events (default: event_id). Options: event_id, external_user_id, ubidex_id')
 parser.add_argument('--advertiser-column', type=str, default='Advertiser',
@@ -28,20 +33,41 @@ parser.add_argument('--date-column', type=str, default=None,
                     help='Optional: Column name in CSV for event_date (if linking by external_user_id + date)')
 args = parser.parse_args()
 
-# Check CSV file
-if not os.path.exists(args.csv):
-    print(f"ОШИБКА: CSV файл не найден: {args.csv}")
-    sys.exit(1)
+if args.parquet:
+    # В датасете advertiser уже смаплен из ADVERTISER_ID, даты распарсены
+    args.advertiser_column = 'advertiser'
+    if args.date_column:
+        args.date_column = 'event_date'
+
+    print(f"1. Загружаю Parquet датасет: {args.parquet}")
+    read_columns = [args.link_column, 'advertiser'] + (['event_date'] if args.date_column else [])
+    try:
+        # Читаются только нужные колонки и партиции за указанный период
+        df = read_pixel_dataset(args.parquet, columns=read_columns, start_date=args.start_date, end_date=args.end_date)
+        print(f"   Загружено строк: {len(df)}")
+        print(f"   Колонки: {', '.join(df.columns)}")
+        print()
+    except Exception as e:
+        print(f"   ✗ Ошибка при чтении Parquet датасета: {e}")
+        sys.exit(1)
+else:
+    # Check CSV file
+    if not args.csv:
+        print("ОШИБКА: укажите --csv или --parquet")
+        sys.exit(1)
+    if not os.path.exists(args.csv):
+        print(f"ОШИБКА: CSV файл не найден: {args.csv}")
+        sys.exit(1)
 
-print(f"1. Загружаю CSV файл: {args.csv}")
-try:
-    df = pd.read_csv(args.csv)
-    print(f"   Загружено строк: {len(df)}")
-    print(f"   Колонки: {', '.join(df.columns)}")
-    print()
-except Exception as e:
-    print(f"   ✗ Ошибка при чтении CSV: {e}")
-    sys.exit(1)
+    print(f"1. Загружаю CSV файл: {args.csv}")
+    try:
+        df = pd.read_csv(args.csv)
+        print(f"   Загружено строк: {len(df)}")
+        print(f"   Колонки: {', '.join(df.columns)}")
+        print()
+    except Exception as e:
+        print(f"   ✗ Ошибка при чтении CSV: {e}")
+        sys.exit(1)
 
 # Check required columns
 if args.advertiser_column not in df.columns:
@@ -56,10 +82,13 @@ if args.link_column not in df.columns:
 
 # Prepare data
 print("2. Подготовка данных...")
-df = df[[args.link_column, args.advertiser_column]].copy()
 if args.date_column and args.date_column in df.columns:
-    df[args.date_column] = pd.to_datetime(df[args.date_column], errors='coerce')
     df = df[[args.link_column, args.date_column, args.advertiser_column]].copy()
+    df[args.date_column] = pd.to_datetime(df[args.date_column], errors='coerce')
+    if df[args.date_column].dt.tz is not None:
+        df[args.date_column] = df[args.date_column].dt.tz_localize(None)
+else:
+    df = df[[args.link_column, args.advertiser_column]].copy()
 
 # Remove rows with missing values
 df = df.dropna(subset=[args.link_column, args.advertiser_column])
@@ -113,24 +142,14 @@ with engine.connect() as conn:
     conn.commit()
     
     # Prepare data for temp table
-    temp_data = []
-    for _, row in df.iterrows():
-        if args.date_column and args.date_column in df.columns:
-            temp_data.append({
-                'link_value': str(row[args.link_column]),
-                'event_date': row[args.date_column],
-                'advertiser': row[args.advertiser_column]
-            })
-        else:
-            temp_data.append({
-                'link_value': str(row[args.link_column]),
-                'event_date': None,
-                'advertiser': row[args.advertiser_column]
-            })
+    temp_df = pd.DataFrame({
+        'link_value': df[args.link_column].astype(str),
+        'event_date': df[args.date_column] if args.date_column and args.date_column in df.columns else None,
+        'advertiser': df[args.advertiser_column],
+    })
     
-    # Insert into temp table
-    temp_df = pd.DataFrame(temp_data)
-    temp_df.to_sql('temp_advertiser_data', engine, if_exists='append', index=False, method='multi')
+    # Insert into temp table (same connection - TEMP table is only visible here)
+    copy_dataframe(conn, temp_df, 'temp_advertiser_data')
     
     # Update user_events using JOIN with temp table
     if args.link_column == 'event_id':
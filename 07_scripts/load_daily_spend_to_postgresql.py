@@ -2,62 +2,33 @@
 """
 Загрузка дневных данных о расходах (spend) из CSV в PostgreSQL для использования в Superset
 Поддерживает несколько CSV файлов и автоматическое определение дат
+Файлы разбираются параллельно (--workers), строки дедуплицируются по
+(publisher_id, date) и загружаются одним COPY в одной транзакции. Хэши
+содержимого загруженных файлов вместе с датой загрузки хранятся в
+spend_loaded_files: повторный запуск по той же директории пропускает уже
+загруженные файлы, а тот же файл с другой --date загружается заново.
+День, уже загруженный из другого файла, заменяется только с --replace:
+иначе данные того файла были бы удалены, а сам он навсегда пропускался.
 """
 import pandas as pd
 import sys
 import io
 import re
 import os
+import glob
+import hashlib
 import argparse
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 from sqlalchemy import create_engine, text
-from db_utils import get_postgres_connection_string
+from db_utils import get_postgres_connection_string, copy_dataframe
+from publisher_parsing import parse_publishers
+from publisher_dimension import ensure_publishers, publishers_from_spend, upsert_publishers, warn_legacy_spend_tables
 
 # Fix encoding for Windows console
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
-print("=" * 80)
-print("ЗАГРУЗКА ДНЕВНЫХ ДАННЫХ О РАСХОДАХ В POSTGRESQL")
-print("=" * 80)
-print()
-
-# Function to extract publisher_id and format
-def extract_publisher_id(publisher_str):
-    match = re.match(r'\((\d+)\)', str(publisher_str))
-    if match:
-        return int(match.group(1))
-    return None
-
-def extract_format(publisher_str):
-    """Extract ad format from publisher name with improved logic"""
-    name_upper = str(publisher_str).upper()
-    
-    # Используем регулярные выражения для более точного определения формата
-    # Ищем формат после дефиса или в конце названия (например, "-PUSH", "PUSH-Premium", "UGW-VIDEO")
-    
-    # Используем более строгие паттерны - формат должен быть отдельным словом
-    # после дефиса, перед дефисом, или в конце, но НЕ внутри другого слова
-    # Проверяем форматы в правильном порядке - сначала более специфичные
-    
-    # POP - проверяем перед PUSH, чтобы перехватить "-POP" раньше
-    if re.search(r'-POP\b|POP-|POP\s|POP$', name_upper):
-        return 'POP'
-    # BANNER - проверяем первым среди остальных, так как может быть в конце названия
-    elif re.search(r'-BANNER\b|BANNER-|BANNER\s|BANNER$', name_upper):
-        return 'BANNER'
-    # VIDEO - проверяем перед PUSH
-    elif re.search(r'-VIDEO\b|VIDEO-|VIDEO\s|VIDEO$', name_upper):
-        return 'VIDEO'
-    # PUSH - проверяем последним, исключая случаи где PUSH внутри слова
-    # Ищем PUSH только как отдельное слово (после/перед дефисом или пробелом)
-    elif (re.search(r'-PUSH\b|PUSH-|PUSH\s|PUSH$|IN-PAGE|INPAGE', name_upper) and 
-          not re.search(r'[A-Z]PUSH[A-Z]', name_upper)):  # Исключаем PUSH внутри слова
-        return 'PUSH'
-    # NATIVE
-    elif re.search(r'-NATIVE\b|NATIVE-|NATIVE\s|NATIVE$', name_upper):
-        return 'NATIVE'
-    else:
-        return 'OTHER'
+LOADED_FILES_TABLE = 'spend_loaded_files'
 
 def parse_date_from_filename(filename):
     """Пытается извлечь дату из имени файла"""
@@ -115,13 +86,12 @@ def load_csv_file(csv_path, date_override=None):
         print(f"   Найденные колонки: {list(df.columns)}")
         return None
     
-    # Извлекаем publisher_id и format
-    df['publisher_id'] = df['Publisher'].apply(extract_publisher_id)
-    df['format'] = df['Publisher'].apply(extract_format)
+    # Извлекаем publisher_id (формат считается по названию в таблице publishers)
+    df['publisher_id'] = parse_publishers(df['Publisher'])['publisher_id']
     
     # Оставляем только нужные колонки
-    df = df[['publisher_id', 'Publisher', 'format', 'Deposit', 'Spend']].copy()
-    df.columns = ['publisher_id', 'publisher_name', 'format', 'deposits_reported', 'spend']
+    df = df[['publisher_id', 'Publisher', 'Deposit', 'Spend']].copy()
+    df.columns = ['publisher_id', 'publisher_name', 'deposits_reported', 'spend']
     
     # Удаляем строки без publisher_id
     df = df.dropna(subset=['publisher_id'])
@@ -140,11 +110,20 @@ def load_csv_file(csv_path, date_override=None):
     
     return df
 
-# Парсинг аргументов
-parser = argparse.ArgumentParser(
-    description='Load daily spend data from CSV to PostgreSQL',
-    formatter_class=argparse.RawDescriptionHelpFormatter,
-    epilog="""
+def file_sha256(path):
+    """SHA-256 of the file content (идентифицирует файл независимо от имени)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def parse_args():
+    # Парсинг аргументов
+    parser = argparse.ArgumentParser(
+        description='Load daily spend data from CSV to PostgreSQL',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
 Примеры использования:
   # Загрузить один файл с автоматическим определением даты
   python load_daily_spend_to_postgresql.py --csv data/spend_2025-11-01.csv
@@ -155,157 +134,296 @@ parser = argparse.ArgumentParser(
   # Указать дату вручную
   python load_daily_spend_to_postgresql.py --csv data/spend.csv --date 2025-11-01
   
-  # Загрузить все CSV из директории
+  # Загрузить все CSV из директории (уже загруженные файлы пропускаются)
   python load_daily_spend_to_postgresql.py --dir data/spend_daily/
-    """
-)
-parser.add_argument('--csv', type=str, nargs='+', help='Path(s) to CSV file(s)', default=None)
-parser.add_argument('--dir', type=str, help='Directory with CSV files', default=None)
-parser.add_argument('--date', type=str, help='Date in format YYYY-MM-DD (if not in filename)', default=None)
-parser.add_argument('--pattern', type=str, help='File pattern for directory scan (e.g., "spend_*.csv")', default='*.csv')
-args = parser.parse_args()
-
-# Определяем список файлов для обработки
-csv_files = []
-
-if args.csv:
-    csv_files = args.csv
-elif args.dir:
-    import glob
-    pattern = os.path.join(args.dir, args.pattern)
-    csv_files = glob.glob(pattern)
-    if not csv_files:
-        print(f"ERROR: Не найдено файлов по паттерну: {pattern}")
+
+  # Заменить день, ранее загруженный из другого файла (исправленная выгрузка)
+  python load_daily_spend_to_postgresql.py --csv data/spend_2025-11-01_fixed.csv --replace
+
+  # Бэкфилл за месяц: разбор файлов в 8 процессах
+  python load_daily_spend_to_postgresql.py --dir data/spend_daily/ --pattern "spend_2025-11-*.csv" --workers 8
+        """
+    )
+    parser.add_argument('--csv', type=str, nargs='+', help='Path(s) to CSV file(s)', default=None)
+    parser.add_argument('--dir', type=str, help='Directory with CSV files', default=None)
+    parser.add_argument('--date', type=str, help='Date in format YYYY-MM-DD (if not in filename)', default=None)
+    parser.add_argument('--pattern', type=str, help='File pattern for directory scan (e.g., "spend_*.csv")', default='*.csv')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes parsing CSV files in parallel (default: 1)')
+    parser.add_argument('--force', action='store_true',
+                        help='Reload files even if their content was already loaded')
+    parser.add_argument('--replace', action='store_true',
+                        help='Replace days already loaded from other files (their ledger entries are removed)')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.workers < 1:
+        print("ОШИБКА: --workers должен быть >= 1")
         sys.exit(1)
-else:
-    print("ERROR: Укажите --csv или --dir")
-    parser.print_help()
-    sys.exit(1)
 
-if not csv_files:
-    print("ERROR: Не найдено файлов для обработки")
-    sys.exit(1)
+    print("=" * 80)
+    print("ЗАГРУЗКА ДНЕВНЫХ ДАННЫХ О РАСХОДАХ В POSTGRESQL")
+    print("=" * 80)
+    print()
 
-print(f"Найдено файлов для обработки: {len(csv_files)}")
-print()
+    # Определяем список файлов для обработки
+    csv_files = []
 
-# Парсим дату, если указана вручную
-date_override = None
-if args.date:
-    try:
-        date_override = datetime.strptime(args.date, '%Y-%m-%d').date()
-        print(f"Используется дата из параметра: {date_override}")
-    except:
-        print(f"ERROR: Неверный формат даты: {args.date}. Используйте YYYY-MM-DD")
+    if args.csv:
+        csv_files = args.csv
+    elif args.dir:
+        pattern = os.path.join(args.dir, args.pattern)
+        csv_files = glob.glob(pattern)
+        if not csv_files:
+            print(f"ERROR: Не найдено файлов по паттерну: {pattern}")
+            sys.exit(1)
+    else:
+        print("ERROR: Укажите --csv или --dir")
         sys.exit(1)
 
-# Загружаем все CSV файлы
-all_data = []
-for csv_path in csv_files:
-    if not os.path.exists(csv_path):
-        print(f"WARNING: Файл не найден: {csv_path}")
-        continue
-    
-    df = load_csv_file(csv_path, date_override)
-    if df is not None:
-        all_data.append(df)
+    # Existing files only, sorted: later files win when deduplicating
+    for csv_path in csv_files:
+        if not os.path.exists(csv_path):
+            print(f"WARNING: Файл не найден: {csv_path}")
+    csv_files = sorted(path for path in csv_files if os.path.exists(path))
+
+    if not csv_files:
+        print("ERROR: Не найдено файлов для обработки")
+        sys.exit(1)
+
+    print(f"Найдено файлов для обработки: {len(csv_files)}")
     print()
 
-if not all_data:
-    print("ERROR: Не удалось загрузить данные из файлов")
-    sys.exit(1)
-
-# Объединяем все данные
-combined_data = pd.concat(all_data, ignore_index=True)
-print(f"Всего загружено записей: {len(combined_data)}")
-print(f"Период: {combined_data['date'].min()} - {combined_data['date'].max()}")
-print()
-
-# Подключение к PostgreSQL
-print("2. Подключение к PostgreSQL...")
-pg_uri = get_postgres_connection_string()
-engine = create_engine(pg_uri)
-
-# Создание таблицы для дневных данных
-print("3. Создание/проверка таблицы publisher_spend_daily...")
-create_table_sql = """
-CREATE TABLE IF NOT EXISTS publisher_spend_daily (
-    id SERIAL PRIMARY KEY,
-    publisher_id BIGINT NOT NULL,
-    publisher_name VARCHAR(255),
-    format VARCHAR(50),
-    date DATE NOT NULL,
-    deposits_reported INTEGER,
-    spend NUMERIC(15, 2),
-    current_cpa NUMERIC(10, 3),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE(publisher_id, date)
-);
-
-CREATE INDEX IF NOT EXISTS idx_publisher_spend_daily_publisher_id ON publisher_spend_daily(publisher_id);
-CREATE INDEX IF NOT EXISTS idx_publisher_spend_daily_format ON publisher_spend_daily(format);
-CREATE INDEX IF NOT EXISTS idx_publisher_spend_daily_date ON publisher_spend_daily(date);
-"""
+    # Парсим дату, если указана вручную
+    date_override = None
+    if args.date:
+        try:
+            date_override = datetime.strptime(args.date, '%Y-%m-%d').date()
+            print(f"Используется дата из параметра: {date_override}")
+        except:
+            print(f"ERROR: Неверный формат даты: {args.date}. Используйте YYYY-MM-DD")
+            sys.exit(1)
 
-with engine.connect() as conn:
-    conn.execute(text(create_table_sql))
-    conn.commit()
+    # Подключение к PostgreSQL
+    print("1. Подключение к PostgreSQL...")
+    pg_uri = get_postgres_connection_string()
+    engine = create_engine(pg_uri)
 
-print("   Таблица создана/обновлена")
-print()
+    # Создание таблицы для дневных данных
+    print("2. Создание/проверка таблицы publisher_spend_daily...")
+    create_table_sql = f"""
+    CREATE TABLE IF NOT EXISTS publisher_spend_daily (
+        id SERIAL PRIMARY KEY,
+        publisher_id BIGINT NOT NULL,
+        date DATE NOT NULL,
+        deposits_reported INTEGER,
+        spend NUMERIC(15, 2),
+        current_cpa NUMERIC(10, 3),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(publisher_id, date)
+    );
 
-# Загрузка данных в PostgreSQL
-print("4. Загрузка данных в PostgreSQL...")
+    CREATE INDEX IF NOT EXISTS idx_publisher_spend_daily_publisher_id ON publisher_spend_daily(publisher_id);
+    CREATE INDEX IF NOT EXISTS idx_publisher_spend_daily_date ON publisher_spend_daily(date);
 
-# Подготавливаем данные для загрузки
-data_to_load = combined_data[['publisher_id', 'publisher_name', 'format', 'date', 'deposits_reported', 'spend', 'current_cpa']].copy()
+    -- Загруженные файлы по хэшу содержимого и дате (для пропуска повторных загрузок)
+    CREATE TABLE IF NOT EXISTS {LOADED_FILES_TABLE} (
+        file_hash CHAR(64) NOT NULL,
+        load_date DATE NOT NULL,
+        file_name TEXT NOT NULL,
+        rows INTEGER NOT NULL,
+        loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (file_hash, load_date)
+    );
 
-# Удаляем дубликаты (если файлы загружались несколько раз)
-date_range = (data_to_load['date'].min(), data_to_load['date'].max())
-print(f"   Удаление существующих данных за период: {date_range[0]} - {date_range[1]}")
+    CREATE INDEX IF NOT EXISTS idx_{LOADED_FILES_TABLE}_load_date ON {LOADED_FILES_TABLE}(load_date);
+    """
 
-with engine.connect() as conn:
-    # Удаляем существующие данные за этот период
-    delete_sql = text("""
-        DELETE FROM publisher_spend_daily 
-        WHERE date >= :start_date AND date <= :end_date
-    """)
-    conn.execute(delete_sql, {'start_date': date_range[0], 'end_date': date_range[1]})
-    conn.commit()
-    
-    # Вставляем новые данные
-    print(f"   Загрузка {len(data_to_load)} записей...")
-    data_to_load.to_sql('publisher_spend_daily', engine, if_exists='append', index=False)
-    
-    # Получаем статистику
-    stats_sql = text("""
-        SELECT 
-            COUNT(*) as total_records,
-            COUNT(DISTINCT date) as days,
-            COUNT(DISTINCT publisher_id) as publishers,
-            MIN(date) as min_date,
-            MAX(date) as max_date,
-            SUM(spend) as total_spend
-        FROM publisher_spend_daily
-        WHERE date >= :start_date AND date <= :end_date
+    with engine.connect() as conn:
+        conn.execute(text(create_table_sql))
+        conn.commit()
+        # Справочник паблишеров (миграция старых таблиц - migrate_publishers_dimension.py)
+        ensure_publishers(conn)
+        warn_legacy_spend_tables(conn)
+        loaded_keys = {
+            (row[0], row[1])
+            for row in conn.execute(text(f"SELECT file_hash, load_date FROM {LOADED_FILES_TABLE}"))
+        }
+
+    print("   Таблица создана/обновлена")
+    print()
+
+    # Пропускаем файлы, содержимое которых уже загружено
+    print("3. Проверка уже загруженных файлов...")
+    # Ключ файла - хэш содержимого и дата, за которую он загружается (--date или имя файла)
+    file_keys = {
+        csv_path: (file_sha256(csv_path), date_override or parse_date_from_filename(csv_path))
+        for csv_path in csv_files
+    }
+    if not args.force:
+        new_dates = {file_keys[path][1] for path in csv_files if file_keys[path] not in loaded_keys}
+        # Загруженный файл перечитывается, если его день заменяется другим файлом из этой загрузки
+        skipped = [path for path in csv_files
+                   if file_keys[path] in loaded_keys and file_keys[path][1] not in new_dates]
+        for csv_path in skipped:
+            print(f"   Пропуск (уже загружен за {file_keys[csv_path][1]}): {os.path.basename(csv_path)}")
+        csv_files = [path for path in csv_files if path not in skipped]
+    # Один и тот же файл под разными именами разбирается один раз
+    csv_files = list({file_keys[path]: path for path in csv_files}.values())
+    print(f"   Новых файлов: {len(csv_files)}")
+    print()
+
+    if not csv_files:
+        print("Все файлы уже загружены, изменений нет")
+        sys.exit(0)
+
+    # Разбор CSV: последовательно или в пуле процессов
+    print(f"4. Разбор файлов (процессов: {min(args.workers, len(csv_files))})...")
+    if args.workers == 1 or len(csv_files) == 1:
+        parsed = [load_csv_file(csv_path, date_override) for csv_path in csv_files]
+    else:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(csv_files))) as executor:
+            parsed = list(executor.map(load_csv_file, csv_files, [date_override] * len(csv_files)))
+    print()
+
+    loaded_files = []
+    all_data = []
+    for csv_path, df in zip(csv_files, parsed):
+        if df is None:
+            print(f"WARNING: Файл пропущен: {csv_path}")
+            continue
+        all_data.append(df)
+        file_hash, load_date = file_keys[csv_path]
+        loaded_files.append({
+            'file_hash': file_hash,
+            'load_date': load_date,
+            'file_name': os.path.basename(csv_path),
+            'rows': len(df),
+        })
+
+    if not all_data:
+        print("ERROR: Не удалось загрузить данные из файлов")
+        sys.exit(1)
+
+    # Объединяем все данные; дубликаты (publisher_id, date) - берется строка из последнего файла
+    combined_data = pd.concat(all_data, ignore_index=True)
+    total_rows = len(combined_data)
+    combined_data = combined_data.drop_duplicates(subset=['publisher_id', 'date'], keep='last')
+    print(f"Всего загружено записей: {total_rows}")
+    if total_rows > len(combined_data):
+        print(f"Удалено дубликатов (publisher_id, date): {total_rows - len(combined_data)}")
+    print(f"Период: {combined_data['date'].min()} - {combined_data['date'].max()}")
+    print()
+
+    # Загрузка данных в PostgreSQL
+    print("5. Загрузка данных в PostgreSQL...")
+
+    # Подготавливаем данные для загрузки
+    data_to_load = combined_data[['publisher_id', 'date', 'deposits_reported', 'spend', 'current_cpa']].copy()
+
+    # Заменяются только дни, которые есть в загружаемых файлах
+    load_dates = sorted(data_to_load['date'].unique())
+    print(f"   Замена данных за дней: {len(load_dates)}")
+
+    # Дни, уже загруженные из других файлов: их данные будут удалены при замене дня
+    conflicts_sql = text(f"""
+        SELECT l.file_name, l.load_date, l.file_hash
+        FROM {LOADED_FILES_TABLE} l
+        WHERE l.load_date = ANY(:dates)
+          AND NOT EXISTS (
+              SELECT 1
+              FROM UNNEST(CAST(:hashes AS TEXT[]), CAST(:file_dates AS DATE[])) AS batch(file_hash, load_date)
+              WHERE batch.file_hash = l.file_hash AND batch.load_date = l.load_date
+          )
+        ORDER BY l.load_date, l.file_name
     """)
-    result = conn.execute(stats_sql, {'start_date': date_range[0], 'end_date': date_range[1]})
-    stats = result.fetchone()
-    
-    print(f"   Загружено записей: {stats[0]}")
-    print(f"   Дней: {stats[1]}")
-    print(f"   Паблишеров: {stats[2]}")
-    print(f"   Период: {stats[3]} - {stats[4]}")
-    print(f"   Общие расходы: ${stats[5]:,.2f}")
+    batch_keys = {
+        'dates': load_dates,
+        'hashes': [f['file_hash'] for f in loaded_files],
+        'file_dates': [f['load_date'] for f in loaded_files],
+    }
+
+    with engine.connect() as conn:
+        try:
+            conflicts = conn.execute(conflicts_sql, batch_keys).fetchall()
+            if conflicts:
+                for row in conflicts:
+                    print(f"   Дата {row.load_date} уже загружена из файла {row.file_name}")
+                if not args.replace:
+                    conn.rollback()
+                    print("   ✗ Загрузка отменена: эти дни будут заменены новыми файлами, а данные старых файлов удалены.")
+                    print("   Добавьте старые файлы в ту же загрузку (их строки загрузятся снова)")
+                    print("   или запустите с --replace, чтобы заменить эти дни целиком")
+                    sys.exit(1)
+                # Замененные файлы больше не считаются загруженными
+                conn.execute(text(f"""
+                    DELETE FROM {LOADED_FILES_TABLE}
+                    WHERE file_hash = :file_hash AND load_date = :load_date
+                """), [{'file_hash': row.file_hash, 'load_date': row.load_date} for row in conflicts])
+                print(f"   Заменяются дни из других файлов: {len(conflicts)} (--replace)")
+
+            # Справочник паблишеров обновляется в той же транзакции, что и факты
+            upsert_publishers(conn, publishers_from_spend(combined_data, 'date'))
+
+            # Удаляем существующие данные за эти дни
+            conn.execute(
+                text("DELETE FROM publisher_spend_daily WHERE date = ANY(:dates)"),
+                {'dates': load_dates},
+            )
+
+            # Вставляем новые данные через COPY в той же транзакции, что и удаление
+            print(f"   Загрузка {len(data_to_load)} записей...")
+            copy_dataframe(conn, data_to_load, 'publisher_spend_daily')
+
+            # Файлы отмечаются загруженными только вместе с данными
+            conn.execute(text(f"""
+                INSERT INTO {LOADED_FILES_TABLE} (file_hash, load_date, file_name, rows, loaded_at)
+                VALUES (:file_hash, :load_date, :file_name, :rows, CURRENT_TIMESTAMP)
+                ON CONFLICT (file_hash, load_date) DO UPDATE
+                SET file_name = EXCLUDED.file_name,
+                    rows = EXCLUDED.rows,
+                    loaded_at = EXCLUDED.loaded_at
+            """), loaded_files)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"   ✗ Ошибка, изменения отменены: {e}")
+            sys.exit(1)
+
+        # Получаем статистику
+        stats_sql = text("""
+            SELECT 
+                COUNT(*) as total_records,
+                COUNT(DISTINCT date) as days,
+                COUNT(DISTINCT publisher_id) as publishers,
+                MIN(date) as min_date,
+                MAX(date) as max_date,
+                SUM(spend) as total_spend
+            FROM publisher_spend_daily
+            WHERE date = ANY(:dates)
+        """)
+        result = conn.execute(stats_sql, {'dates': load_dates})
+        stats = result.fetchone()
+
+        print(f"   Загружено записей: {stats[0]}")
+        print(f"   Дней: {stats[1]}")
+        print(f"   Паблишеров: {stats[2]}")
+        print(f"   Период: {stats[3]} - {stats[4]}")
+        print(f"   Общие расходы: ${stats[5]:,.2f}")
+        print(f"   Файлов: {len(loaded_files)}")
+        print()
+
+    print("=" * 80)
+    print("ДНЕВНЫЕ ДАННЫЕ О РАСХОДАХ УСПЕШНО ЗАГРУЖЕНЫ В POSTGRESQL!")
+    print("=" * 80)
+    print()
+    print("Таблица: publisher_spend_daily")
+    print(f"Период: {load_dates[0]} - {load_dates[-1]}")
+    print()
+    print("Теперь можно использовать SQL-запрос publisher_coefficients_by_day.sql в Superset")
     print()
 
-print("=" * 80)
-print("ДНЕВНЫЕ ДАННЫЕ О РАСХОДАХ УСПЕШНО ЗАГРУЖЕНЫ В POSTGRESQL!")
-print("=" * 80)
-print()
-print("Таблица: publisher_spend_daily")
-print(f"Период: {date_range[0]} - {date_range[1]}")
-print()
-print("Теперь можно использовать SQL-запрос publisher_coefficients_by_day.sql в Superset")
-print()
 
+if __name__ == '__main__':
+    main()
@@ -6,10 +6,20 @@ import pandas as pd
 import sys
 import io
 import os
+import time
 from datetime import datetime
 from datetime import timezone
 from sqlalchemy import create_engine, text
-from db_utils import get_postgres_connection_string
+from db_utils import (
+    get_postgres_connection_string, copy_dataframe, load_stats, parse_pixel_ts, ensure_month_partitions,
+    create_staging_table, ensure_unique_index, merge_staging_table, ensure_loaded_at,
+)
+from ingest_pipeline import run_pipeline
+from csv_checkpoint import load_checkpoint, save_checkpoint, checkpoint_path, iter_csv_chunks
+from pixel_parquet import get_pixels_parquet_dir, iter_pixel_batches, count_pixel_rows
+from pixel_schema import ADVERTISER_MAPPING, pixel_read_csv_kwargs, coerce_pixel_ids
+from reactivations_refresh import refresh_reactivations
+from deposit_summary import refresh_deposit_summary
 
 # Fix encoding for Windows console
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -22,13 +32,20 @@ print()
 # CSV file path
 CSV_FILE = r"C:\Users\Nalivator3000\Downloads\pixels-019b375b-b97e-7560-8e6a-35d27c7cb891-12-19-2025-16-05-16-01.csv"
 CHUNK_SIZE = 50000
+TRANSFORM_WORKERS = 2  # Потоки process_chunk, работающие параллельно с записью в БД
+QUEUE_SIZE = 4  # Максимум чанков в очередях между стадиями (ограничивает память)
 END_DATE = datetime(2025, 12, 18, 23, 59, 59, tzinfo=timezone.utc)  # До 18.12.2025 включительно
 
-if not os.path.exists(CSV_FILE):
+# Если задан PIXELS_PARQUET_DIR, читаем уже типизированный Parquet датасет вместо CSV
+PARQUET_DIR = get_pixels_parquet_dir()
+
+if PARQUET_DIR:
+    print(f"Parquet датасет: {PARQUET_DIR}")
+elif not os.path.exists(CSV_FILE):
     print(f"ОШИБКА: CSV файл не найден: {CSV_FILE}")
     sys.exit(1)
-
-print(f"CSV файл: {CSV_FILE}")
+else:
+    print(f"CSV файл: {CSV_FILE}")
 print(f"Размер чанка: {CHUNK_SIZE:,} строк")
 print(f"Фильтр по дате: до {END_DATE.strftime('%Y-%m-%d %H:%M:%S')} включительно")
 print()
@@ -39,44 +56,13 @@ pg_uri = get_postgres_connection_string()
 engine = create_engine(pg_uri)
 
 def process_chunk(chunk_df):
-    """Обработка чанка данных"""
-    # Выбираем нужные колонки
-    columns_mapping = {
-        'EVENT_ID': 'event_id',
-        'EXTERNAL_USER_ID': 'external_user_id',
-        'UBIDEX_ID': 'ubidex_id',
-        'TYPE': 'event_type',
-        'PIXEL_TS': 'event_date',  # Используем PIXEL_TS как основную дату
-        'PUBLISHER_ID': 'publisher_id',
-        'CAMPAIGN_ID': 'campaign_id',
-        'SUB_ID': 'sub_id',
-        'AFFILIATE_ID': 'affiliate_id',
-        'DEPOSIT_AMOUNT': 'deposit_amount',
-        'CURRENCY': 'currency',
-        'CONVERTED_AMOUNT': 'converted_amount',
-        'CONVERTED_CURRENCY': 'converted_currency',
-        'WEBSITE': 'website',
-        'COUNTRY': 'country',
-        'TRANSACTION_ID': 'transaction_id',
-        'ADVERTISER_ID': 'advertiser_id'  # Для маппинга в advertiser
-    }
-    
-    # Выбираем только существующие колонки
-    available_cols = {k: v for k, v in columns_mapping.items() if k in chunk_df.columns}
-    chunk_df = chunk_df[list(available_cols.keys())].copy()
-    chunk_df.columns = [available_cols[col] for col in chunk_df.columns]
-    
-    # Обрабатываем дату
-    # Сначала проверяем, есть ли EVENT_TS в исходных данных
-    if 'EVENT_TS' in chunk_df.columns and chunk_df['event_date'].isna().any():
-        # Заполняем пустые PIXEL_TS из EVENT_TS
-        chunk_df['event_date'] = chunk_df['event_date'].fillna(chunk_df['EVENT_TS'])
-    
+    """Обработка чанка данных (колонки уже переименованы и типизированы схемой при чтении)"""
+    slow_ts_rows = 0
+    # ID читаются строками: некорректные значения становятся NA, а не ошибкой
+    chunk_df = coerce_pixel_ids(chunk_df)
     if 'event_date' in chunk_df.columns:
-        # Убираем ' UTC' из строки даты
-        chunk_df['event_date'] = chunk_df['event_date'].astype(str).str.replace(' UTC', '', regex=False)
-        # Парсим дату (поддерживаем разные форматы)
-        chunk_df['event_date'] = pd.to_datetime(chunk_df['event_date'], errors='coerce', utc=True)
+        # Парсим дату: формат 'YYYY-MM-DD HH:MM:SS UTC' векторно, остальные форматы - медленным путем
+        chunk_df['event_date'], slow_ts_rows = parse_pixel_ts(chunk_df['event_date'])
         # Фильтруем по дате (до 18.12.2025 включительно)
         chunk_df = chunk_df[chunk_df['event_date'] <= END_DATE]
         # Удаляем записи без даты
@@ -84,24 +70,12 @@ def process_chunk(chunk_df):
     
     # Маппим ADVERTISER_ID в advertiser (1 = 4rabet, 2 = Crorebet)
     if 'advertiser_id' in chunk_df.columns:
-        chunk_df['advertiser'] = chunk_df['advertiser_id'].map({1: '4rabet', 2: 'Crorebet'})
+        chunk_df['advertiser'] = chunk_df['advertiser_id'].map(ADVERTISER_MAPPING)
         chunk_df = chunk_df.drop(columns=['advertiser_id'])
     else:
         chunk_df['advertiser'] = None
     
-    # Удаляем временные колонки, если они есть
-    if 'EVENT_TS' in chunk_df.columns:
-        chunk_df = chunk_df.drop(columns=['EVENT_TS'])
-    
-    # Конвертируем числовые поля
-    if 'publisher_id' in chunk_df.columns:
-        chunk_df['publisher_id'] = pd.to_numeric(chunk_df['publisher_id'], errors='coerce').astype('Int64')
-    if 'campaign_id' in chunk_df.columns:
-        chunk_df['campaign_id'] = pd.to_numeric(chunk_df['campaign_id'], errors='coerce').astype('Int64')
-    if 'deposit_amount' in chunk_df.columns:
-        chunk_df['deposit_amount'] = pd.to_numeric(chunk_df['deposit_amount'], errors='coerce')
-    if 'converted_amount' in chunk_df.columns:
-        chunk_df['converted_amount'] = pd.to_numeric(chunk_df['converted_amount'], errors='coerce')
+    # Суммы (float64) типизированы в read_csv, ID (Int64) - в coerce_pixel_ids
     
     # Конвертируем ubidex_id в строку
     if 'ubidex_id' in chunk_df.columns:
@@ -114,113 +88,182 @@ def process_chunk(chunk_df):
     if 'event_id' in chunk_df.columns:
         chunk_df = chunk_df[chunk_df['event_id'].notna()]
     
-    return chunk_df
+    return chunk_df, slow_ts_rows
 
-# Проверяем количество строк в CSV
-print("Подсчет строк в CSV...")
-total_rows = sum(1 for _ in open(CSV_FILE, 'r', encoding='utf-8')) - 1  # Минус заголовок
-print(f"Всего строк в CSV: {total_rows:,}")
-print()
+def prepare_parquet_batch(batch_df):
+    """Батч из Parquet уже типизирован (даты, ID, advertiser) - остается только NULL и event_id"""
+    batch_df = batch_df.where(pd.notnull(batch_df), None)
+    return batch_df[batch_df['event_id'].notna()]
+
+# Колонки user_events, которые загружаются из pixels (и читаются из Parquet)
+BASE_COLUMNS = [
+    'event_id', 'external_user_id', 'ubidex_id', 'event_type', 'event_date',
+    'publisher_id', 'campaign_id', 'sub_id', 'affiliate_id',
+    'deposit_amount', 'currency', 'converted_amount', 'converted_currency',
+    'website', 'country', 'transaction_id', 'advertiser'
+]
+
+STAGING_TABLE = 'public.user_events_staging'
+# Уникальный ключ события; в секционированной таблице он обязан включать event_date
+EVENT_KEY = ['event_id', 'event_date']
+EVENT_KEY_INDEX = 'idx_user_events_event_id_date'
+
+if PARQUET_DIR:
+    # Фильтр по дате проталкивается в Parquet: лишние партиции не читаются
+    total_rows = count_pixel_rows(PARQUET_DIR, end_date=END_DATE)
+    print(f"Строк в датасете до {END_DATE.strftime('%Y-%m-%d')}: {total_rows:,}")
+    print()
+    resume_offset = None
+    resume_rows = 0
+else:
+    # Проверяем количество строк в CSV
+    print("Подсчет строк в CSV...")
+    total_rows = sum(1 for _ in open(CSV_FILE, 'r', encoding='utf-8')) - 1  # Минус заголовок
+    print(f"Всего строк в CSV: {total_rows:,}")
+    print()
+
+    # Чекпоинт по смещению в байтах: пишется после каждого закоммиченного чанка
+    checkpoint = load_checkpoint(CSV_FILE)
+    if checkpoint and checkpoint.get('completed'):
+        # Та же версия файла (размер и mtime совпадают) уже загружена и слита в user_events
+        print(f"Файл уже полностью загружен: {checkpoint['rows_committed']:,} строк, повторная загрузка не нужна.")
+        print(f"Чтобы загрузить его заново, удалите файл чекпоинта: {checkpoint_path(CSV_FILE)}")
+        sys.exit(0)
+    if checkpoint:
+        resume_offset = checkpoint['byte_offset']
+        resume_rows = checkpoint['rows_committed']
+        print(f"Продолжаю с чекпоинта: уже загружено {resume_rows:,} строк (смещение {resume_offset:,} байт)")
+    else:
+        resume_offset = None
+        resume_rows = 0
+    print(f"Файл чекпоинта: {checkpoint_path(CSV_FILE)}")
+    print()
+
+    # usecols/dtype/переименование по схеме pixel-экспорта: лишние колонки не читаются
+    csv_read_kwargs = pixel_read_csv_kwargs(CSV_FILE)
 
-# Начинаем загрузку
 print("Начинаю загрузку данных...")
 print("Прогресс обновляется каждые 100k строк.\n")
 
-rows_processed = 0
+# Чанки копируются в UNLOGGED staging-таблицу, в конце - одно слияние в user_events.
+# Staging очищается только при загрузке с начала: при продолжении с чекпоинта
+# в ней уже лежат закоммиченные чанки.
+with engine.connect() as conn:
+    # Настройка схемы: loaded_at (watermark инкрементальных пересчетов) создается здесь, до загрузки
+    ensure_loaded_at(conn)
+    conn.commit()
+    create_staging_table(conn, STAGING_TABLE, 'public.user_events')
+    if resume_offset is None:
+        conn.execute(text(f"TRUNCATE {STAGING_TABLE}"))
+    conn.commit()
+
+rows_processed = resume_rows
 rows_inserted = 0
 rows_updated = 0
+rows_copied = 0
+copy_seconds = 0.0
+chunk_num = 0
+slow_ts_rows = 0  # Строки с PIXEL_TS не в стандартном формате (медленный парсинг)
 start_time = datetime.now()
 
+def transform(chunk):
+    """Стадия пайплайна: обработка сырого чанка CSV (выполняется в потоках-воркерах)"""
+    chunk_df, end_offset = chunk
+    if PARQUET_DIR:
+        return prepare_parquet_batch(chunk_df), len(chunk_df), end_offset, 0
+    processed_chunk, slow_rows = process_chunk(chunk_df)
+    return processed_chunk, len(chunk_df), end_offset, slow_rows
+
+def write_chunk(item):
+    """Стадия пайплайна: COPY обработанного чанка в staging (основной поток, владеет соединением)"""
+    global rows_processed, rows_copied, copy_seconds, chunk_num, slow_ts_rows
+    processed_chunk, raw_rows, end_offset, slow_rows = item
+    chunk_num += 1
+    slow_ts_rows += slow_rows
+    
+    if len(processed_chunk) == 0:
+        rows_processed += raw_rows
+        if end_offset is not None:
+            save_checkpoint(CSV_FILE, end_offset, rows_processed)
+        return
+    
+    # Выбираем только существующие колонки
+    insert_columns = [col for col in BASE_COLUMNS if col in processed_chunk.columns]
+    
+    # Чанк и чекпоинт фиксируются вместе: staging переживает перезапуск,
+    # а слияние в user_events идемпотентно
+    copy_start = time.perf_counter()
+    copy_dataframe(conn, processed_chunk, STAGING_TABLE, columns=insert_columns)
+    conn.commit()
+    copy_seconds += time.perf_counter() - copy_start
+    rows_copied += len(processed_chunk)
+    
+    rows_processed += raw_rows
+    if end_offset is not None:
+        save_checkpoint(CSV_FILE, end_offset, rows_processed)
+    
+    # Прогресс
+    if rows_processed % 100000 == 0 or chunk_num == 1:
+        elapsed = (datetime.now() - start_time).total_seconds()
+        rate = (rows_processed - resume_rows) / elapsed if elapsed > 0 else 0
+        remaining = total_rows - rows_processed
+        eta = remaining / rate / 60 if rate > 0 else 0
+        
+        print(f"Прогресс: {rows_processed:,} / {total_rows:,} ({rows_processed/total_rows*100:.1f}%) | "
+              f"Скорость: {rate:.0f} строк/сек | ETA: {eta:.0f} мин | "
+              f"В staging: {rows_copied:,}")
+
 try:
     with engine.connect() as conn:
-        for chunk_num, chunk in enumerate(pd.read_csv(
-            CSV_FILE,
-            chunksize=CHUNK_SIZE,
-            low_memory=False
-        ), 1):
-            # Обрабатываем чанк
-            processed_chunk = process_chunk(chunk)
-            
-            if len(processed_chunk) == 0:
-                rows_processed += len(chunk)
-                continue
-            
-            # Подготавливаем данные для вставки
-            # Определяем колонки для вставки
-            base_columns = [
-                'event_id', 'external_user_id', 'ubidex_id', 'event_type', 'event_date',
-                'publisher_id', 'campaign_id', 'sub_id', 'affiliate_id',
-                'deposit_amount', 'currency', 'converted_amount', 'converted_currency',
-                'website', 'country', 'transaction_id', 'advertiser'
-            ]
-            
-            # Выбираем только существующие колонки
-            insert_columns = [col for col in base_columns if col in processed_chunk.columns]
-            chunk_data = processed_chunk[insert_columns].copy()
-            
-            # Используем временную таблицу для эффективного UPSERT
-            columns_str = ', '.join(insert_columns)
-            
-            try:
-                # Создаем временную таблицу
-                chunk_data.to_sql('temp_user_events_load', conn, if_exists='replace', index=False, method='multi')
-                
-                # Обновляем существующие записи
-                update_columns = [col for col in insert_columns if col != 'event_id']
-                update_set = ', '.join([f'{col} = t.{col}' for col in update_columns])
-                
-                update_sql = f"""
-                    UPDATE public.user_events ue
-                    SET {update_set}
-                    FROM temp_user_events_load t
-                    WHERE ue.event_id = t.event_id
-                """
-                result_update = conn.execute(text(update_sql))
-                rows_updated += result_update.rowcount
-                
-                # Вставляем новые записи (которых еще нет)
-                insert_sql = f"""
-                    INSERT INTO public.user_events ({columns_str})
-                    SELECT {columns_str} FROM temp_user_events_load t
-                    WHERE NOT EXISTS (
-                        SELECT 1 FROM public.user_events ue WHERE ue.event_id = t.event_id
-                    )
-                """
-                result_insert = conn.execute(text(insert_sql))
-                rows_inserted += result_insert.rowcount
-                
-                # Удаляем временную таблицу
-                conn.execute(text("DROP TABLE temp_user_events_load"))
-                conn.commit()
-                
-            except Exception as e:
-                # Если ошибка, используем простую вставку
-                print(f"   ⚠ Предупреждение при UPSERT: {e}")
-                print("   Использую простую вставку...")
-                
-                # Удаляем временную таблицу если она есть
-                try:
-                    conn.execute(text("DROP TABLE IF EXISTS temp_user_events_load"))
-                except:
-                    pass
-                
-                # Простая вставка (дубликаты будут пропущены)
-                chunk_data.to_sql('user_events', conn, if_exists='append', index=False, method='multi')
-                conn.commit()
-                rows_inserted += len(chunk_data)
-            
-            rows_processed += len(chunk)
-            
-            # Прогресс
-            if rows_processed % 100000 == 0 or chunk_num == 1:
-                elapsed = (datetime.now() - start_time).total_seconds()
-                rate = rows_processed / elapsed if elapsed > 0 else 0
-                remaining = total_rows - rows_processed
-                eta = remaining / rate / 60 if rate > 0 else 0
-                
-                print(f"Прогресс: {rows_processed:,} / {total_rows:,} ({rows_processed/total_rows*100:.1f}%) | "
-                      f"Скорость: {rate:.0f} строк/сек | ETA: {eta:.0f} мин | "
-                      f"Вставлено: {rows_inserted:,}")
+        if PARQUET_DIR:
+            reader = (
+                (batch_df, None)
+                for batch_df in iter_pixel_batches(
+                    PARQUET_DIR, columns=BASE_COLUMNS, end_date=END_DATE, batch_size=CHUNK_SIZE
+                )
+            )
+        else:
+            reader = iter_csv_chunks(
+                CSV_FILE,
+                CHUNK_SIZE,
+                start_offset=resume_offset,  # seek() сразу к первой незагруженной строке
+                **csv_read_kwargs
+            )
+        pipeline_stats = run_pipeline(reader, transform, write_chunk, workers=TRANSFORM_WORKERS, queue_size=QUEUE_SIZE)
+        
+        # Одно множественное слияние staging -> user_events по (event_id, event_date):
+        # повторная загрузка пересекающихся выгрузок не создает дубликатов
+        print("\nСлияние staging с user_events...")
+        merge_start = time.perf_counter()
+        staged_range = conn.execute(text(f"SELECT MIN(event_date), MAX(event_date) FROM {STAGING_TABLE}")).fetchone()
+        if ensure_month_partitions(conn, staged_range[0], staged_range[1]):
+            conn.commit()
+        removed_duplicates = ensure_unique_index(conn, 'public.user_events', EVENT_KEY, EVENT_KEY_INDEX, dedupe=True)
+        if removed_duplicates:
+            print(f"   Удалено дубликатов event_id в user_events перед созданием уникального индекса: {removed_duplicates:,}")
+        conn.commit()
+        rows_inserted, rows_updated = merge_staging_table(
+            conn, STAGING_TABLE, 'public.user_events', EVENT_KEY, BASE_COLUMNS,
+            loaded_at_column='loaded_at',  # измененные события тоже попадают в инкрементальные пересчеты
+        )
+        conn.execute(text(f"TRUNCATE {STAGING_TABLE}"))
+        conn.commit()
+        if not PARQUET_DIR:
+            # Файл загружен целиком: повторный запуск по той же версии файла сообщит об этом,
+            # а замененный файл (другие размер/mtime) загрузится заново
+            save_checkpoint(CSV_FILE, os.path.getsize(CSV_FILE), rows_processed, completed=True)
+        merge_seconds = time.perf_counter() - merge_start
+        print(f"   ✓ Вставлено: {rows_inserted:,}, обновлено: {rows_updated:,} ({merge_seconds:.1f} сек)")
+        
+        # Сводка депозитов и реактивации пересчитываются только для пользователей с новыми депозитами
+        print("\nОбновление user_deposit_summary...")
+        summary_stats = refresh_deposit_summary(conn)
+        print(f"   ✓ Режим: {summary_stats['mode']}, пользователей обновлено: {summary_stats['users']:,}")
+        
+        print("\nОбновление reactivations_materialized...")
+        reactivation_stats = refresh_reactivations(conn)
+        print(f"   ✓ Режим: {reactivation_stats['mode']}, пользователей: {reactivation_stats['affected_users']:,}, "
+              f"вставлено реактиваций: {reactivation_stats['inserted']:,}")
 
 except KeyboardInterrupt:
     print("\n\nЗагрузка прервана пользователем.")
@@ -236,9 +279,16 @@ print("\n" + "=" * 80)
 print("ЗАГРУЗКА ЗАВЕРШЕНА!")
 print("=" * 80)
 print(f"Обработано строк: {rows_processed:,}")
-print(f"Вставлено/обновлено записей: {rows_inserted:,}")
+print(f"Вставлено новых записей: {rows_inserted:,}")
+print(f"Обновлено существующих записей: {rows_updated:,}")
 print(f"Время: {elapsed_total/60:.1f} минут")
-print(f"Средняя скорость: {rows_processed/elapsed_total:.0f} строк/сек")
+print(f"Средняя скорость: {(rows_processed - resume_rows)/elapsed_total:.0f} строк/сек")
+copy_stats = load_stats(rows_copied, copy_seconds)
+print(f"Скорость COPY в staging: {copy_stats['rows_per_sec']:,.0f} строк/сек "
+      f"({copy_stats['rows']:,} строк за {copy_stats['seconds']:.1f} сек)")
+print(f"Время записи в БД: {pipeline_stats['write_seconds']/60:.1f} минут "
+      f"({pipeline_stats['write_seconds']/elapsed_total*100:.0f}% от общего)")
+print(f"PIXEL_TS вне формата 'YYYY-MM-DD HH:MM:SS UTC' (медленный парсинг): {slow_ts_rows:,} строк")
 print()
 
 # Финальная проверка
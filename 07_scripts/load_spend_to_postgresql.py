@@ -5,12 +5,13 @@
 import pandas as pd
 import sys
 import io
-import re
 import os
 import argparse
 from datetime import datetime
 from sqlalchemy import create_engine, text
-from db_utils import get_postgres_connection_string
+from db_utils import get_postgres_connection_string, copy_dataframe
+from publisher_parsing import parse_publishers
+from publisher_dimension import ensure_publishers, publishers_from_spend, upsert_publishers, warn_legacy_spend_tables
 
 # Fix encoding for Windows console
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -20,44 +21,6 @@ print("ЗАГРУЗКА ДАННЫХ О РАСХОДАХ В POSTGRESQL")
 print("=" * 80)
 print()
 
-# Function to extract publisher_id and format
-def extract_publisher_id(publisher_str):
-    match = re.match(r'\((\d+)\)', str(publisher_str))
-    if match:
-        return int(match.group(1))
-    return None
-
-def extract_format(publisher_str):
-    """Extract ad format from publisher name with improved logic"""
-    name_upper = str(publisher_str).upper()
-    
-    # Используем регулярные выражения для более точного определения формата
-    # Ищем формат после дефиса или в конце названия (например, "-PUSH", "PUSH-Premium", "UGW-VIDEO")
-    
-    # Используем более строгие паттерны - формат должен быть отдельным словом
-    # после дефиса, перед дефисом, или в конце, но НЕ внутри другого слова
-    # Проверяем форматы в правильном порядке - сначала более специфичные
-    
-    # POP - проверяем перед PUSH, чтобы перехватить "-POP" раньше
-    if re.search(r'-POP\b|POP-|POP\s|POP$', name_upper):
-        return 'POP'
-    # BANNER - проверяем первым среди остальных, так как может быть в конце названия
-    elif re.search(r'-BANNER\b|BANNER-|BANNER\s|BANNER$', name_upper):
-        return 'BANNER'
-    # VIDEO - проверяем перед PUSH
-    elif re.search(r'-VIDEO\b|VIDEO-|VIDEO\s|VIDEO$', name_upper):
-        return 'VIDEO'
-    # PUSH - проверяем последним, исключая случаи где PUSH внутри слова
-    # Ищем PUSH только как отдельное слово (после/перед дефисом или пробелом)
-    elif (re.search(r'-PUSH\b|PUSH-|PUSH\s|PUSH$|IN-PAGE|INPAGE', name_upper) and 
-          not re.search(r'[A-Z]PUSH[A-Z]', name_upper)):  # Исключаем PUSH внутри слова
-        return 'PUSH'
-    # NATIVE
-    elif re.search(r'-NATIVE\b|NATIVE-|NATIVE\s|NATIVE$', name_upper):
-        return 'NATIVE'
-    else:
-        return 'OTHER'
-
 # Load spend data
 print("1. Загружаю данные по расходам...")
 print()
@@ -96,12 +59,12 @@ if csv_path is None:
     sys.exit(1)
 
 spend_data = pd.read_csv(csv_path, skiprows=1)
-spend_data['publisher_id'] = spend_data['Publisher'].apply(extract_publisher_id)
-spend_data['format'] = spend_data['Publisher'].apply(extract_format)
+# Format is derived from the name in the publishers table
+spend_data['publisher_id'] = parse_publishers(spend_data['Publisher'])['publisher_id']
 
 # Keep only relevant columns
-spend_data = spend_data[['publisher_id', 'Publisher', 'format', 'Deposit', 'Spend']].copy()
-spend_data.columns = ['publisher_id', 'publisher_name', 'format', 'deposits_reported', 'spend']
+spend_data = spend_data[['publisher_id', 'Publisher', 'Deposit', 'Spend']].copy()
+spend_data.columns = ['publisher_id', 'publisher_name', 'deposits_reported', 'spend']
 
 # Remove rows with missing publisher_id
 spend_data = spend_data.dropna(subset=['publisher_id'])
@@ -124,6 +87,8 @@ else:
     month = '2025-11'  # Default
 
 spend_data['month'] = month
+# Дата, когда паблишер встречался (для справочника publishers)
+spend_data['seen'] = datetime.strptime(month, '%Y-%m').date()
 
 print(f"   Загружено: {len(spend_data)} записей")
 print(f"   Месяц: {month}")
@@ -141,8 +106,6 @@ if args.daily:
     CREATE TABLE IF NOT EXISTS publisher_spend_daily (
         id SERIAL PRIMARY KEY,
         publisher_id BIGINT NOT NULL,
-        publisher_name VARCHAR(255),
-        format VARCHAR(50),
         date DATE NOT NULL,
         deposits_reported INTEGER,
         spend NUMERIC(15, 2),
@@ -152,13 +115,15 @@ if args.daily:
     );
 
     CREATE INDEX IF NOT EXISTS idx_publisher_spend_daily_publisher_id ON publisher_spend_daily(publisher_id);
-    CREATE INDEX IF NOT EXISTS idx_publisher_spend_daily_format ON publisher_spend_daily(format);
     CREATE INDEX IF NOT EXISTS idx_publisher_spend_daily_date ON publisher_spend_daily(date);
     """
     
     with engine.connect() as conn:
         conn.execute(text(create_table_sql))
         conn.commit()
+        # Справочник паблишеров (миграция старых таблиц - migrate_publishers_dimension.py)
+        ensure_publishers(conn)
+        warn_legacy_spend_tables(conn)
     
     print("   Таблица создана/обновлена")
     print()
@@ -175,16 +140,15 @@ if args.daily:
     
     # Load data to PostgreSQL
     print("4. Загрузка дневных данных в PostgreSQL...")
-    spend_data_db = spend_data[['publisher_id', 'publisher_name', 'format', 'date', 'deposits_reported', 'spend', 'current_cpa']].copy()
+    spend_data_db = spend_data[['publisher_id', 'date', 'deposits_reported', 'spend', 'current_cpa']].copy()
     
     with engine.connect() as conn:
-        # Delete existing data for this month
+        # Publishers, delete and insert in one transaction
+        upsert_publishers(conn, publishers_from_spend(spend_data, 'seen'))
         conn.execute(text(f"DELETE FROM publisher_spend_daily WHERE date >= '{month}-01' AND date < '{month}-01'::date + INTERVAL '1 month'"))
+        copy_dataframe(conn, spend_data_db, 'publisher_spend_daily')
         conn.commit()
         
-        # Insert new data
-        spend_data_db.to_sql('publisher_spend_daily', engine, if_exists='append', index=False)
-        
         # Get count
         result = conn.execute(text(f"SELECT COUNT(*) as cnt FROM publisher_spend_daily WHERE date >= '{month}-01' AND date < '{month}-01'::date + INTERVAL '1 month'"))
         count = result.fetchone()[0]
@@ -205,8 +169,6 @@ else:
     CREATE TABLE IF NOT EXISTS publisher_spend (
         id SERIAL PRIMARY KEY,
         publisher_id BIGINT NOT NULL,
-        publisher_name VARCHAR(255),
-        format VARCHAR(50),
         month VARCHAR(7),
         deposits_reported INTEGER,
         spend NUMERIC(15, 2),
@@ -216,30 +178,31 @@ else:
     );
 
     CREATE INDEX IF NOT EXISTS idx_publisher_spend_publisher_id ON publisher_spend(publisher_id);
-    CREATE INDEX IF NOT EXISTS idx_publisher_spend_format ON publisher_spend(format);
     CREATE INDEX IF NOT EXISTS idx_publisher_spend_month ON publisher_spend(month);
     """
 
     with engine.connect() as conn:
         conn.execute(text(create_table_sql))
         conn.commit()
+        # Справочник паблишеров (миграция старых таблиц - migrate_publishers_dimension.py)
+        ensure_publishers(conn)
+        warn_legacy_spend_tables(conn)
 
     print("   Таблица создана/обновлена")
     print()
 
     # Load data to PostgreSQL
     print("4. Загрузка данных в PostgreSQL...")
-    spend_data_db = spend_data[['publisher_id', 'publisher_name', 'format', 'month', 'deposits_reported', 'spend', 'current_cpa']].copy()
+    spend_data_db = spend_data[['publisher_id', 'month', 'deposits_reported', 'spend', 'current_cpa']].copy()
 
     # Replace existing data for the specified month
     with engine.connect() as conn:
-        # Delete existing data for this month
+        # Publishers, delete and insert in one transaction
+        upsert_publishers(conn, publishers_from_spend(spend_data, 'seen'))
         conn.execute(text(f"DELETE FROM publisher_spend WHERE month = '{month}'"))
+        copy_dataframe(conn, spend_data_db, 'publisher_spend')
         conn.commit()
         
-        # Insert new data
-        spend_data_db.to_sql('publisher_spend', engine, if_exists='append', index=False)
-        
         # Get count
         result = conn.execute(text(f"SELECT COUNT(*) as cnt FROM publisher_spend WHERE month = '{month}'"))
         count = result.fetchone()[0]
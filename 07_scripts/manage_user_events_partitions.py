@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Управление месячными партициями user_events:
+список партиций с размерами, создание партиций на будущие месяцы
+и отсоединение (DETACH) старых месяцев
+"""
+import sys
+import io
+import argparse
+import pandas as pd
+from sqlalchemy import create_engine
+from db_utils import (
+    get_postgres_connection_string, is_partitioned_table, ensure_month_partitions,
+    list_month_partitions, month_partition_name, detach_month_partition,
+)
+
+# Fix encoding for Windows console
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+parser = argparse.ArgumentParser(description='Manage monthly partitions of user_events')
+parser.add_argument('--create-ahead', type=int, default=0,
+                    help='Create partitions for the current month and N months ahead')
+parser.add_argument('--detach-before', type=str, default=None,
+                    help='Detach partitions for months before YYYY-MM (they stay as standalone tables)')
+parser.add_argument('--yes', action='store_true', help='Do not ask for confirmation')
+args = parser.parse_args()
+
+print("=" * 80)
+print("ПАРТИЦИИ USER_EVENTS")
+print("=" * 80)
+print()
+
+pg_uri = get_postgres_connection_string()
+engine = create_engine(pg_uri)
+
+with engine.connect() as conn:
+    if not is_partitioned_table(conn, 'user_events'):
+        print("Таблица user_events не секционирована.")
+        print("Пересоздайте ее через migrate_to_postgresql.py, чтобы включить месячные партиции.")
+        sys.exit(1)
+
+    if args.create_ahead > 0:
+        current_month = pd.Timestamp.now().to_period('M').to_timestamp()
+        last_month = current_month + pd.offsets.MonthBegin(args.create_ahead)
+        try:
+            created = ensure_month_partitions(conn, current_month, last_month)
+        except RuntimeError as e:
+            conn.rollback()
+            print(f"ОШИБКА: {e}")
+            sys.exit(1)
+        conn.commit()
+        print(f"Создано партиций: {len(created)}")
+        for partition in created:
+            print(f"  + {partition}")
+        print()
+
+    if args.detach_before:
+        cutoff = pd.Timestamp(args.detach_before + '-01')
+        partitions = list_month_partitions(conn)
+        cutoff_name = month_partition_name('user_events', cutoff)
+        to_detach = [
+            p for p in partitions['partition']
+            if p.startswith('user_events_') and p < cutoff_name
+        ]
+        if not to_detach:
+            print(f"Нет партиций раньше {args.detach_before}")
+        else:
+            print(f"Будут отсоединены партиции ({len(to_detach)}):")
+            for partition in to_detach:
+                print(f"  - {partition}")
+            if not args.yes:
+                confirm = input("Продолжить? (y/N): ")
+                if confirm.lower() != 'y':
+                    print("Отменено")
+                    sys.exit(0)
+            for partition in to_detach:
+                # Отсоединенная партиция остается обычной таблицей: ее можно выгрузить (pg_dump) и удалить
+                detach_month_partition(conn, partition)
+                conn.commit()
+                print(f"  ✓ {partition} отсоединена")
+        print()
+
+    partitions = list_month_partitions(conn)
+    print(f"Партиции user_events ({len(partitions)}):")
+    for _, row in partitions.iterrows():
+        print(f"  {row['partition']:<24} {row['total_bytes'] / (1024**2):>10.1f} MB  {row['bounds']}")
+    if len(partitions) > 0:
+        print(f"  Всего: {partitions['total_bytes'].sum() / (1024**3):.2f} GB")
+
+print()
+print("=" * 80)
+print("ГОТОВО!")
+print("=" * 80)
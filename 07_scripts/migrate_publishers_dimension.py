@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Одноразовая миграция таблиц расходов на справочник publishers
+Заполняет publishers из publisher_name, сохраненного в строках
+publisher_spend / publisher_spend_daily, и удаляет из этих таблиц
+денормализованные колонки publisher_name и format. Выполняется в одной
+транзакции; без --yes только показывает, что будет сделано.
+"""
+import sys
+import io
+import argparse
+from sqlalchemy import create_engine
+from db_utils import get_postgres_connection_string
+from publisher_dimension import PUBLISHERS_TABLE, legacy_spend_tables, migrate_spend_tables
+
+# Fix encoding for Windows console
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+parser = argparse.ArgumentParser(description='Migrate spend tables to the publishers dimension (one-time)')
+parser.add_argument('--yes', '-y', action='store_true', help='Apply the migration (default: only show the plan)')
+args = parser.parse_args()
+
+print("=" * 80)
+print("МИГРАЦИЯ ТАБЛИЦ РАСХОДОВ НА СПРАВОЧНИК PUBLISHERS")
+print("=" * 80)
+print()
+
+pg_uri = get_postgres_connection_string()
+engine = create_engine(pg_uri)
+
+with engine.connect() as conn:
+    legacy = legacy_spend_tables(conn)
+    if not legacy:
+        print("   ✓ Миграция не требуется: таблицы расходов уже хранят только publisher_id")
+        print()
+        sys.exit(0)
+
+    for table_name, columns in legacy.items():
+        print(f"   {table_name}: будут удалены колонки {', '.join(columns)}")
+    print()
+
+    if not args.yes:
+        print("База данных не изменена. Для применения миграции запустите с --yes")
+        print()
+        sys.exit(0)
+
+    try:
+        migrated = migrate_spend_tables(conn)
+    except Exception as e:
+        conn.rollback()
+        print(f"   ✗ Ошибка, изменения отменены: {e}")
+        sys.exit(1)
+
+    for table_name, count in migrated.items():
+        print(f"   ✓ {table_name}: перенесено паблишеров в {PUBLISHERS_TABLE}: {count:,}")
+    print()
+
+print("=" * 80)
+print("МИГРАЦИЯ ЗАВЕРШЕНА!")
+print("=" * 80)
+print()
@@ -3,97 +3,36 @@
 """
 import os
 import sys
+import time
+import queue
 import sqlite3
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from sqlalchemy import create_engine, text, inspect
 from sqlalchemy.engine import Engine
-import pandas as pd
 from tqdm import tqdm
-from db_utils import get_sqlite_path, get_postgres_connection_string
-
-# Parse arguments
-parser = argparse.ArgumentParser(description='Migrate data from SQLite to PostgreSQL')
-parser.add_argument('--yes', '-y', action='store_true', help='Automatically answer yes to all prompts')
-parser.add_argument(
-    '--resume',
-    action='store_true',
-    help='Resume into existing user_events table without dropping it (use if previous run stopped part-way)',
+from deposit_summary import refresh_deposit_summary
+from db_utils import (
+    get_sqlite_path, get_postgres_connection_string, copy_dataframe, load_stats, iter_sqlite_table,
+    ensure_month_partitions, ensure_loaded_at,
 )
-args = parser.parse_args()
-
-print("=" * 80)
-print("МИГРАЦИЯ ДАННЫХ ИЗ SQLITE В POSTGRESQL")
-print("=" * 80)
-print()
-
-# Get SQLite database path
-sqlite_path = get_sqlite_path()
-if not os.path.exists(sqlite_path):
-    print(f"ОШИБКА: SQLite база данных не найдена: {sqlite_path}")
-    sys.exit(1)
-
-print(f"SQLite база: {sqlite_path}")
-print(f"Размер файла: {os.path.getsize(sqlite_path) / (1024**3):.2f} GB")
-print()
-
-# Connect to SQLite
-print("Подключение к SQLite...")
-sqlite_conn = sqlite3.connect(sqlite_path)
-print("✓ Подключено")
-print()
-
-# Get PostgreSQL connection
-print("Подключение к PostgreSQL...")
-postgres_uri = get_postgres_connection_string()
-postgres_engine = create_engine(postgres_uri, pool_pre_ping=True)
-
-try:
-    with postgres_engine.connect() as conn:
-        result = conn.execute(text("SELECT version()"))
-        version = result.fetchone()[0]
-        print(f"✓ Подключено к PostgreSQL: {version}")
-except Exception as e:
-    print(f"✗ Ошибка подключения к PostgreSQL: {e}")
-    print(f"  URI: {postgres_uri.replace(postgres_uri.split('@')[0].split('://')[1], '***')}")
-    sys.exit(1)
-
-print()
-
-# Get table schema from SQLite
-print("Анализ структуры таблиц...")
-sqlite_cursor = sqlite_conn.cursor()
-sqlite_cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-tables = [row[0] for row in sqlite_cursor.fetchall()]
-
-if 'user_events' not in tables:
-    print("ОШИБКА: Таблица 'user_events' не найдена в SQLite")
-    sys.exit(1)
-
-print(f"Найдено таблиц: {len(tables)}")
-print(f"Основная таблица: user_events")
-print()
-
-# Get table info
-sqlite_cursor.execute("PRAGMA table_info(user_events)")
-columns_info = sqlite_cursor.fetchall()
-
-print("Структура таблицы user_events:")
-for col in columns_info:
-    print(f"  - {col[1]} ({col[2]})")
-print()
-
-# Count rows
-print("Подсчет записей...")
-sqlite_cursor.execute("SELECT COUNT(*) FROM user_events")
-total_rows = sqlite_cursor.fetchone()[0]
-print(f"Всего записей: {total_rows:,}")
-print()
-
-# Create table in PostgreSQL
-print("Создание таблицы в PostgreSQL...")
-# В PostgreSQL не будем задавать PRIMARY KEY по event_id, чтобы избежать
-# ошибок при возможных дубликатах идентификаторов событий. Для аналитики
-# нам важнее полнота данных и корректная агрегация по пользователям/датам.
+
+# Migrate data in chunks
+CHUNK_SIZE = 100000
+
+# Сколько диапазонов rowid планировать на одного воркера: мелкие диапазоны
+# выравнивают нагрузку и уменьшают объем повторной загрузки при сбое
+RANGES_PER_WORKER = 4
+
+# Ключ события - уникальный индекс (event_id, event_date) из create_indexes_sql,
+# а не PRIMARY KEY по event_id: на секционированной таблице уникальный ключ
+# обязан включать ключ секционирования. Повторные загрузки pixels сливаются
+# по этому индексу через ON CONFLICT.
+# Таблица секционирована по месяцам event_date: запросы за период читают
+# только свои партиции (partition pruning), а старые месяцы можно отсоединить
+# (DETACH PARTITION) без перезаписи таблицы. Партиции создаются по мере
+# необходимости (db_utils.ensure_month_partitions).
 create_table_sql = """
 CREATE TABLE IF NOT EXISTS user_events (
     event_id TEXT,
@@ -111,179 +50,518 @@ CREATE TABLE IF NOT EXISTS user_events (
     converted_currency TEXT,
     website TEXT,
     country TEXT,
-    transaction_id TEXT
-);
+    transaction_id TEXT,
+    loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP  -- Время загрузки (watermark для инкрементальных пересчетов)
+) PARTITION BY RANGE (event_date);
 """
 
 # Индексы для ускорения аналитических запросов
 create_indexes_sql = [
-    "CREATE INDEX IF NOT EXISTS idx_event_id ON user_events(event_id);",
+    # Уникальный ключ события (в SQLite event_id - PRIMARY KEY, дубликатов нет):
+    # повторные загрузки pixels сливаются через ON CONFLICT (event_id, event_date)
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_user_events_event_id_date ON user_events(event_id, event_date);",
     "CREATE INDEX IF NOT EXISTS idx_external_user_id ON user_events(external_user_id);",
     "CREATE INDEX IF NOT EXISTS idx_event_type ON user_events(event_type);",
     "CREATE INDEX IF NOT EXISTS idx_event_date ON user_events(event_date);",
     "CREATE INDEX IF NOT EXISTS idx_publisher_id ON user_events(publisher_id);",
     "CREATE INDEX IF NOT EXISTS idx_event_type_date ON user_events(event_type, event_date);",
+    "CREATE INDEX IF NOT EXISTS idx_user_events_loaded_at ON user_events(loaded_at);",
 ]
 
-with postgres_engine.connect() as conn:
-    inspector = inspect(postgres_engine)
-    table_names = inspector.get_table_names()
-    table_exists = 'user_events' in table_names
-
-    if args.resume:
-        # Режим возобновления: не трогаем существующую таблицу, только убеждаемся, что она есть
-        if not table_exists:
-            print("⚠ Режим --resume, но таблица user_events в PostgreSQL не найдена.")
-            print("  Будет создана новая таблица и миграция начнется с нуля.")
-            conn.execute(text(create_table_sql))
-            conn.commit()
-            print("✓ Таблица создана")
-    else:
-        # Обычный режим: можно удалить старую таблицу
-        if args.yes:
-            if table_exists:
-                conn.execute(text("DROP TABLE IF EXISTS user_events CASCADE;"))
-                conn.commit()
-                print("✓ Старая таблица удалена")
-            conn.execute(text(create_table_sql))
-            conn.commit()
-            print("✓ Таблица создана")
-        else:
-            if table_exists:
-                drop_existing = input("Удалить существующую таблицу user_events в PostgreSQL? (y/N): ")
-                if drop_existing.lower() == 'y':
-                    conn.execute(text("DROP TABLE IF EXISTS user_events CASCADE;"))
-                    conn.commit()
-                    print("✓ Старая таблица удалена")
-                    conn.execute(text(create_table_sql))
+# Чекпоинты миграции: диапазоны rowid из SQLite и последний закоммиченный
+# rowid внутри каждого. Чекпоинт обновляется в той же транзакции, что и запись
+# чанка, поэтому --resume продолжает ровно с того места, где остановился
+# каждый диапазон, а упавший диапазон перезапускается отдельно от остальных.
+CHECKPOINT_TABLE = 'migration_checkpoints'
+CHECKPOINT_SOURCE = 'user_events'
+create_checkpoint_table_sql = f"""
+CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+    source TEXT NOT NULL,
+    range_id INTEGER NOT NULL,
+    start_rowid BIGINT NOT NULL,
+    end_rowid BIGINT NOT NULL,
+    last_rowid BIGINT NOT NULL,
+    rows_migrated BIGINT NOT NULL DEFAULT 0,
+    completed BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source, range_id)
+);
+"""
+update_checkpoint_sql = f"""
+UPDATE {CHECKPOINT_TABLE}
+SET last_rowid = :last_rowid,
+    rows_migrated = rows_migrated + :rows,
+    updated_at = CURRENT_TIMESTAMP
+WHERE source = :source AND range_id = :range_id;
+"""
+complete_checkpoint_sql = f"""
+UPDATE {CHECKPOINT_TABLE}
+SET completed = TRUE, updated_at = CURRENT_TIMESTAMP
+WHERE source = :source AND range_id = :range_id;
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Migrate data from SQLite to PostgreSQL')
+    parser.add_argument('--yes', '-y', action='store_true', help='Automatically answer yes to all prompts')
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Resume into existing user_events table without dropping it (use if previous run stopped part-way)',
+    )
+    parser.add_argument(
+        '--load-method',
+        choices=['copy', 'insert'],
+        default='copy',
+        help='How to write chunks to PostgreSQL: COPY FROM STDIN (default) or legacy multi-row INSERT via to_sql',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of parallel worker processes, each loading its own rowid ranges (default: 1)',
+    )
+    return parser.parse_args()
+
+
+def plan_ranges(min_rowid, max_rowid, num_ranges):
+    """Split (min_rowid - 1, max_rowid] into num_ranges disjoint rowid ranges"""
+    span = max_rowid - min_rowid + 1
+    num_ranges = max(1, min(num_ranges, span))
+    step = -(-span // num_ranges)  # ceil division
+    ranges = []
+    start = min_rowid - 1
+    range_id = 0
+    while start < max_rowid:
+        end = min(start + step, max_rowid)
+        ranges.append({'range_id': range_id, 'start_rowid': start, 'end_rowid': end, 'last_rowid': start})
+        start = end
+        range_id += 1
+    return ranges
+
+
+def migrate_range(sqlite_path, postgres_uri, rowid_range, load_method, progress_queue=None):
+    """
+    Migrate one rowid range (last_rowid, end_rowid] into PostgreSQL.
+    Opens its own SQLite connection and a single PostgreSQL connection, so it
+    can run in a worker process. Returns (range_id, rows, write_seconds).
+    """
+    range_id = rowid_range['range_id']
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    engine = create_engine(postgres_uri, pool_pre_ping=True, pool_size=1, max_overflow=0)
+
+    rows = 0
+    write_seconds = 0.0
+    try:
+        with engine.connect() as conn:
+            for chunk_df, chunk_last_rowid in iter_sqlite_table(
+                sqlite_conn,
+                'user_events',
+                chunk_size=CHUNK_SIZE,
+                after_rowid=rowid_range['last_rowid'],
+                max_rowid=rowid_range['end_rowid'],
+            ):
+                # Write to PostgreSQL together with the checkpoint (one transaction)
+                write_start = time.perf_counter()
+                if ensure_month_partitions(conn, chunk_df['event_date'].min(), chunk_df['event_date'].max()):
                     conn.commit()
-                    print("✓ Таблица создана")
+                if load_method == 'copy':
+                    copy_dataframe(conn, chunk_df, 'user_events')
                 else:
-                    print("Используем уже существующую таблицу user_events")
-            else:
-                conn.execute(text(create_table_sql))
+                    # pandas пишет в уже начатую транзакцию соединения; без нее to_sql
+                    # открыл бы и закоммитил собственную, отдельно от чекпоинта
+                    if not conn.in_transaction():
+                        conn.begin()
+                    chunk_df.to_sql(
+                        'user_events',
+                        conn,
+                        if_exists='append',
+                        index=False,
+                        method='multi',
+                        chunksize=10000
+                    )
+                conn.execute(text(update_checkpoint_sql), {
+                    'source': CHECKPOINT_SOURCE,
+                    'range_id': range_id,
+                    'last_rowid': chunk_last_rowid,
+                    'rows': len(chunk_df),
+                })
                 conn.commit()
-                print("✓ Таблица создана")
+                write_seconds += time.perf_counter() - write_start
+                rows += len(chunk_df)
 
-    # Create indexes (will be created after data import for better performance)
-    print("  (Индексы будут созданы после импорта данных)")
+                if progress_queue is not None:
+                    progress_queue.put(len(chunk_df))
 
-print()
+            conn.execute(text(complete_checkpoint_sql), {'source': CHECKPOINT_SOURCE, 'range_id': range_id})
+            conn.commit()
+    finally:
+        sqlite_conn.close()
+        engine.dispose()
 
-# Migrate data in chunks
-CHUNK_SIZE = 100000
-print(f"Начало миграции данных (чанки по {CHUNK_SIZE:,} записей)...")
-print()
-
-total_migrated = 0
-offset = 0
-
-# Check if table already has data
-with postgres_engine.connect() as conn:
-    result = conn.execute(text("SELECT COUNT(*) FROM user_events"))
-    existing_count = result.fetchone()[0]
-    if existing_count > 0:
-        print(f"В PostgreSQL уже есть {existing_count:,} записей")
-        if args.yes or args.resume:
-            # Автоматически продолжаем миграцию без вопросов
-            offset = existing_count
-            print(f"Продолжаем миграцию с OFFSET={offset:,}")
-        else:
-            resume = input("Продолжить миграцию? (y/N): ")
-            if resume.lower() != 'y':
-                print("Миграция отменена")
-                sys.exit(0)
-            offset = existing_count
-
-# Use pandas for efficient chunking
-query = "SELECT * FROM user_events ORDER BY event_date LIMIT ? OFFSET ?"
-
-print("Импорт данных...")
-with tqdm(total=total_rows, initial=offset, unit="rows", unit_scale=True) as pbar:
-    while offset < total_rows:
-        # Read chunk from SQLite
-        chunk_query = f"SELECT * FROM user_events ORDER BY event_date LIMIT {CHUNK_SIZE} OFFSET {offset}"
-        chunk_df = pd.read_sql_query(chunk_query, sqlite_conn)
-        
-        if len(chunk_df) == 0:
-            break
-        
-        # Write to PostgreSQL
+    return range_id, rows, write_seconds
+
+
+def short_error(e):
+    """Shorten error message (without huge SQL/parameters)"""
+    err_msg = str(e)
+    if len(err_msg) > 1000:
+        return err_msg[:1000] + "... [truncated]"
+    return err_msg
+
+
+def run_sequential(sqlite_path, postgres_uri, pending, load_method, pbar):
+    """Migrate pending ranges one after another in this process"""
+    total_migrated = 0
+    write_seconds = 0.0
+    for rowid_range in pending:
         try:
-            chunk_df.to_sql(
-                'user_events',
-                postgres_engine,
-                if_exists='append',
-                index=False,
-                method='multi',
-                chunksize=10000
+            _, rows, seconds = migrate_range(
+                sqlite_path, postgres_uri, rowid_range, load_method, _PbarQueue(pbar),
             )
         except Exception as e:
             print()
             print("=" * 80)
-            print(f"ОШИБКА при вставке чанка offset={offset:,}, size={len(chunk_df)}")
-            # Пытаемся вывести более короткое сообщение без огромного SQL/parameters
-            err_msg = str(e)
-            if len(err_msg) > 1000:
-                err_msg_short = err_msg[:1000] + "... [truncated]"
-            else:
-                err_msg_short = err_msg
-            print(err_msg_short)
+            print(f"ОШИБКА при загрузке диапазона rowid ({rowid_range['last_rowid']:,}, {rowid_range['end_rowid']:,}]")
+            print(short_error(e))
             print("Миграция прервана из-за ошибки. Проверьте сообщение выше.")
+            print("Для продолжения с последнего чекпоинта запустите скрипт с --resume.")
             print("=" * 80)
             sys.exit(1)
-        
-        total_migrated += len(chunk_df)
-        offset += CHUNK_SIZE
-        pbar.update(len(chunk_df))
-
-print()
-print("✓ Импорт данных завершен")
-print()
-
-# Create indexes
-print("Создание индексов...")
-with postgres_engine.connect() as conn:
-    for index_sql in create_indexes_sql:
-        try:
-            conn.execute(text(index_sql))
-            conn.commit()
-            print(f"✓ {index_sql.split('ON')[0].strip()}")
-        except Exception as e:
-            print(f"  (Индекс уже существует или ошибка: {e})")
-
-print()
-
-# Verify migration
-print("Проверка миграции...")
-with postgres_engine.connect() as conn:
-    result = conn.execute(text("SELECT COUNT(*) FROM user_events"))
-    postgres_count = result.fetchone()[0]
-    
-    result = conn.execute(text("SELECT MIN(event_date), MAX(event_date) FROM user_events"))
-    date_range = result.fetchone()
-    
-    print(f"SQLite записей:   {total_rows:,}")
-    print(f"PostgreSQL записей: {postgres_count:,}")
-    print(f"Диапазон дат:     {date_range[0]} - {date_range[1]}")
-
-if postgres_count == total_rows:
-    print()
+        total_migrated += rows
+        write_seconds += seconds
+    return total_migrated, write_seconds
+
+
+class _PbarQueue:
+    """Queue-like adapter that forwards progress straight to a tqdm bar"""
+
+    def __init__(self, pbar):
+        self.pbar = pbar
+
+    def put(self, rows):
+        self.pbar.update(rows)
+
+
+def run_parallel(sqlite_path, postgres_uri, pending, load_method, workers, pbar):
+    """
+    Migrate pending ranges in a process pool. Workers report progress through
+    a shared queue; a failed range is reported and left incomplete in the
+    checkpoint table so that --resume retries only that range.
+    """
+    total_migrated = 0
+    failed_ranges = []
+
+    with multiprocessing.Manager() as manager:
+        progress_queue = manager.Queue()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(migrate_range, sqlite_path, postgres_uri, r, load_method, progress_queue): r
+                for r in pending
+            }
+            not_done = set(futures)
+            while not_done:
+                done, not_done = wait(not_done, timeout=0.5, return_when=FIRST_COMPLETED)
+                while True:
+                    try:
+                        pbar.update(progress_queue.get_nowait())
+                    except queue.Empty:
+                        break
+                for future in done:
+                    rowid_range = futures[future]
+                    try:
+                        _, rows, _ = future.result()
+                        total_migrated += rows
+                    except Exception as e:
+                        failed_ranges.append(rowid_range['range_id'])
+                        tqdm.write(
+                            f"✗ Диапазон #{rowid_range['range_id']} rowid "
+                            f"({rowid_range['start_rowid']:,}, {rowid_range['end_rowid']:,}] "
+                            f"завершился ошибкой: {short_error(e)}"
+                        )
+
+    if failed_ranges:
+        print()
+        print("=" * 80)
+        print(f"ОШИБКА: не загружены диапазоны: {', '.join(str(r) for r in sorted(failed_ranges))}")
+        print("Остальные диапазоны сохранены. Для повторной загрузки только")
+        print("незавершенных диапазонов запустите скрипт с --resume.")
+        print("=" * 80)
+        sys.exit(1)
+
+    return total_migrated
+
+
+def main():
+    args = parse_args()
+    if args.workers < 1:
+        print("ОШИБКА: --workers должен быть >= 1")
+        sys.exit(1)
+
     print("=" * 80)
-    print("✓ МИГРАЦИЯ УСПЕШНО ЗАВЕРШЕНА!")
+    print("МИГРАЦИЯ ДАННЫХ ИЗ SQLITE В POSTGRESQL")
     print("=" * 80)
-else:
     print()
-    print("⚠ ВНИМАНИЕ: Количество записей не совпадает!")
-    print(f"  Разница: {abs(total_rows - postgres_count):,} записей")
 
-# Close connections
-sqlite_conn.close()
-postgres_engine.dispose()
+    # Get SQLite database path
+    sqlite_path = get_sqlite_path()
+    if not os.path.exists(sqlite_path):
+        print(f"ОШИБКА: SQLite база данных не найдена: {sqlite_path}")
+        sys.exit(1)
+
+    print(f"SQLite база: {sqlite_path}")
+    print(f"Размер файла: {os.path.getsize(sqlite_path) / (1024**3):.2f} GB")
+    print()
+
+    # Connect to SQLite
+    print("Подключение к SQLite...")
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    print("✓ Подключено")
+    print()
+
+    # Get PostgreSQL connection
+    print("Подключение к PostgreSQL...")
+    postgres_uri = get_postgres_connection_string()
+    postgres_engine = create_engine(postgres_uri, pool_pre_ping=True)
+
+    try:
+        with postgres_engine.connect() as conn:
+            result = conn.execute(text("SELECT version()"))
+            version = result.fetchone()[0]
+            print(f"✓ Подключено к PostgreSQL: {version}")
+    except Exception as e:
+        print(f"✗ Ошибка подключения к PostgreSQL: {e}")
+        print(f"  URI: {postgres_uri.replace(postgres_uri.split('@')[0].split('://')[1], '***')}")
+        sys.exit(1)
+
+    print()
+
+    # Get table schema from SQLite
+    print("Анализ структуры таблиц...")
+    sqlite_cursor = sqlite_conn.cursor()
+    sqlite_cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = [row[0] for row in sqlite_cursor.fetchall()]
+
+    if 'user_events' not in tables:
+        print("ОШИБКА: Таблица 'user_events' не найдена в SQLite")
+        sys.exit(1)
+
+    print(f"Найдено таблиц: {len(tables)}")
+    print(f"Основная таблица: user_events")
+    print()
+
+    # Get table info
+    sqlite_cursor.execute("PRAGMA table_info(user_events)")
+    columns_info = sqlite_cursor.fetchall()
+
+    print("Структура таблицы user_events:")
+    for col in columns_info:
+        print(f"  - {col[1]} ({col[2]})")
+    print()
+
+    # Count rows
+    print("Подсчет записей...")
+    sqlite_cursor.execute("SELECT COUNT(*), MIN(rowid), MAX(rowid) FROM user_events")
+    total_rows, min_rowid, max_rowid = sqlite_cursor.fetchone()
+    print(f"Всего записей: {total_rows:,}")
+    print()
+
+    # Create table in PostgreSQL
+    print("Создание таблицы в PostgreSQL...")
+    fresh_table = False
+    with postgres_engine.connect() as conn:
+        inspector = inspect(postgres_engine)
+        table_names = inspector.get_table_names()
+        table_exists = 'user_events' in table_names
+
+        if args.resume:
+            # Режим возобновления: не трогаем существующую таблицу, только убеждаемся, что она есть
+            if not table_exists:
+                print("⚠ Режим --resume, но таблица user_events в PostgreSQL не найдена.")
+                print("  Будет создана новая таблица и миграция начнется с нуля.")
+                conn.execute(text(create_table_sql))
+                conn.commit()
+                fresh_table = True
+                print("✓ Таблица создана")
+        else:
+            # Обычный режим: можно удалить старую таблицу
+            if args.yes:
+                if table_exists:
+                    conn.execute(text("DROP TABLE IF EXISTS user_events CASCADE;"))
+                    conn.commit()
+                    print("✓ Старая таблица удалена")
+                conn.execute(text(create_table_sql))
+                conn.commit()
+                fresh_table = True
+                print("✓ Таблица создана")
+            else:
+                if table_exists:
+                    drop_existing = input("Удалить существующую таблицу user_events в PostgreSQL? (y/N): ")
+                    if drop_existing.lower() == 'y':
+                        conn.execute(text("DROP TABLE IF EXISTS user_events CASCADE;"))
+                        conn.commit()
+                        print("✓ Старая таблица удалена")
+                        conn.execute(text(create_table_sql))
+                        conn.commit()
+                        fresh_table = True
+                        print("✓ Таблица создана")
+                    else:
+                        print("Используем уже существующую таблицу user_events")
+                else:
+                    conn.execute(text(create_table_sql))
+                    conn.commit()
+                    fresh_table = True
+                    print("✓ Таблица создана")
+
+        # Существующая таблица могла быть создана без loaded_at
+        ensure_loaded_at(conn)
+        conn.execute(text(create_checkpoint_table_sql))
+        if fresh_table:
+            conn.execute(text(f"DELETE FROM {CHECKPOINT_TABLE} WHERE source = :source"), {'source': CHECKPOINT_SOURCE})
+        conn.commit()
+
+        # Месячные партиции на весь диапазон дат создаем заранее, до запуска воркеров
+        sqlite_cursor.execute("SELECT MIN(event_date), MAX(event_date) FROM user_events")
+        min_event_date, max_event_date = sqlite_cursor.fetchone()
+        created_partitions = ensure_month_partitions(conn, min_event_date, max_event_date)
+        conn.commit()
+        if created_partitions:
+            print(f"✓ Создано месячных партиций: {len(created_partitions)} "
+                  f"({created_partitions[0]} - {created_partitions[-1]})")
+
+        # Create indexes (will be created after data import for better performance)
+        print("  (Индексы будут созданы после импорта данных)")
+
+    print()
+
+    print(f"Начало миграции данных (чанки по {CHUNK_SIZE:,} записей, воркеров: {args.workers})...")
+    print()
+
+    # Check if table already has data
+    with postgres_engine.connect() as conn:
+        result = conn.execute(text("SELECT COUNT(*) FROM user_events"))
+        existing_count = result.fetchone()[0]
+        result = conn.execute(
+            text(f"""
+                SELECT range_id, start_rowid, end_rowid, last_rowid, rows_migrated, completed
+                FROM {CHECKPOINT_TABLE}
+                WHERE source = :source
+                ORDER BY range_id
+            """),
+            {'source': CHECKPOINT_SOURCE},
+        )
+        checkpoints = [dict(row._mapping) for row in result]
+
+        if checkpoints:
+            rows_done = sum(c['rows_migrated'] for c in checkpoints)
+            incomplete = [c for c in checkpoints if not c['completed']]
+            print(f"Найдены чекпоинты: {len(checkpoints)} диапазонов, незавершенных: {len(incomplete)} "
+                  f"(уже перенесено {rows_done:,} записей)")
+            if not (args.yes or args.resume):
+                resume = input("Продолжить миграцию с чекпоинтов? (y/N): ")
+                if resume.lower() != 'y':
+                    print("Миграция отменена")
+                    sys.exit(0)
+        elif existing_count > 0:
+            # Таблица заполнена без чекпоинта (например, старой версией скрипта с OFFSET).
+            # Продолжать по COUNT(*) нельзя: при дубликатах это пропускает или повторяет строки.
+            print(f"В PostgreSQL уже есть {existing_count:,} записей, но чекпоинт миграции не найден.")
+            print("Невозможно надежно определить место продолжения.")
+            print("Запустите миграцию без --resume, чтобы пересоздать таблицу user_events.")
+            sys.exit(1)
+        else:
+            rows_done = 0
+            num_ranges = 1 if args.workers == 1 else args.workers * RANGES_PER_WORKER
+            checkpoints = plan_ranges(min_rowid, max_rowid, num_ranges) if total_rows > 0 else []
+            for c in checkpoints:
+                conn.execute(
+                    text(f"""
+                        INSERT INTO {CHECKPOINT_TABLE} (source, range_id, start_rowid, end_rowid, last_rowid)
+                        VALUES (:source, :range_id, :start_rowid, :end_rowid, :last_rowid)
+                    """),
+                    {'source': CHECKPOINT_SOURCE, **c},
+                )
+                c['completed'] = False
+            conn.commit()
+            print(f"Запланировано диапазонов rowid: {len(checkpoints)}")
+
+    sqlite_conn.close()
+    pending = [c for c in checkpoints if not c['completed']]
+
+    print(f"Импорт данных (метод загрузки: {args.load_method})...")
+    run_start = time.perf_counter()
+    with tqdm(total=total_rows, initial=rows_done, unit="rows", unit_scale=True) as pbar:
+        if args.workers == 1:
+            total_migrated, write_seconds = run_sequential(
+                sqlite_path, postgres_uri, pending, args.load_method, pbar,
+            )
+        else:
+            total_migrated = run_parallel(
+                sqlite_path, postgres_uri, pending, args.load_method, args.workers, pbar,
+            )
+            # Время записи в воркерах пересекается, поэтому для пропускной
+            # способности параллельного режима берем фактическое время выполнения
+            write_seconds = time.perf_counter() - run_start
+
+    print()
+    print("✓ Импорт данных завершен")
+    write_stats = load_stats(total_migrated, write_seconds)
+    print(f"  Записано в PostgreSQL: {write_stats['rows']:,} строк за {write_stats['seconds']:.1f} сек "
+          f"({write_stats['rows_per_sec']:,.0f} строк/сек, метод: {args.load_method}, воркеров: {args.workers})")
+    print()
+
+    # Create indexes
+    print("Создание индексов...")
+    with postgres_engine.connect() as conn:
+        for index_sql in create_indexes_sql:
+            try:
+                conn.execute(text(index_sql))
+                conn.commit()
+                print(f"✓ {index_sql.split('ON')[0].strip()}")
+            except Exception as e:
+                print(f"  (Индекс уже существует или ошибка: {e})")
+
+    print()
+
+    # Per-user summary of deposits (FTD/RD analysis joins it)
+    print("Построение user_deposit_summary...")
+    with postgres_engine.connect() as conn:
+        summary_stats = refresh_deposit_summary(conn, full=True)
+    print(f"✓ Пользователей с депозитами: {summary_stats['users']:,}")
+    print()
+
+    # Verify migration
+    print("Проверка миграции...")
+    with postgres_engine.connect() as conn:
+        result = conn.execute(text("SELECT COUNT(*) FROM user_events"))
+        postgres_count = result.fetchone()[0]
+
+        result = conn.execute(text("SELECT MIN(event_date), MAX(event_date) FROM user_events"))
+        date_range = result.fetchone()
+
+        print(f"SQLite записей:   {total_rows:,}")
+        print(f"PostgreSQL записей: {postgres_count:,}")
+        print(f"Диапазон дат:     {date_range[0]} - {date_range[1]}")
+
+    if postgres_count == total_rows:
+        print()
+        print("=" * 80)
+        print("✓ МИГРАЦИЯ УСПЕШНО ЗАВЕРШЕНА!")
+        print("=" * 80)
+    else:
+        print()
+        print("⚠ ВНИМАНИЕ: Количество записей не совпадает!")
+        print(f"  Разница: {abs(total_rows - postgres_count):,} записей")
+
+    # Close connections
+    postgres_engine.dispose()
+
+    print()
+    print("Следующие шаги:")
+    print("1. Установите переменную окружения DB_TYPE=postgresql")
+    print("2. Перезапустите контейнеры: docker-compose restart")
+    print("3. Обновите подключение в Superset")
 
-print()
-print("Следующие шаги:")
-print("1. Установите переменную окружения DB_TYPE=postgresql")
-print("2. Перезапустите контейнеры: docker-compose restart")
-print("3. Обновите подключение в Superset")
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Columnar Parquet staging layer for pixel CSV exports
+A pixel export is converted once (convert_pixels_to_parquet.py) into a
+hive-partitioned dataset (event_day=YYYY-MM-DD/event_type=...) with typed
+columns, parsed PIXEL_TS, numeric publisher/campaign IDs and the advertiser
+mapping already applied. Loaders and checkers then read only the columns
+and partitions they need instead of re-parsing the CSV text.
+
+Requires pyarrow (optional dependency).
+"""
+import os
+import pandas as pd
+from db_utils import parse_pixel_ts
+from pixel_schema import ADVERTISER_MAPPING, coerce_pixel_ids
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+    ds = None
+
+PARTITION_COLUMNS = ['event_day', 'event_type']
+
+STRING_COLUMNS = [
+    'event_id', 'external_user_id', 'ubidex_id', 'event_type', 'sub_id', 'affiliate_id',
+    'currency', 'converted_currency', 'website', 'country', 'transaction_id', 'advertiser',
+]
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for the Parquet staging layer: pip install pyarrow")
+
+
+def pixel_arrow_schema():
+    """Arrow schema of the staged dataset (partition columns included)"""
+    _require_pyarrow()
+    fields = [(col, pa.string()) for col in STRING_COLUMNS]
+    fields += [
+        ('event_date', pa.timestamp('us', tz='UTC')),
+        ('publisher_id', pa.int64()),
+        ('campaign_id', pa.int64()),
+        ('deposit_amount', pa.float64()),
+        ('converted_amount', pa.float64()),
+        ('event_day', pa.string()),
+    ]
+    return pa.schema(fields)
+
+
+def get_pixels_parquet_dir():
+    """
+    Get Parquet dataset directory from PIXELS_PARQUET_DIR.
+    Returns None when the variable is not set or the dataset does not exist.
+    """
+    dataset_dir = os.environ.get('PIXELS_PARQUET_DIR')
+    if dataset_dir and os.path.isdir(dataset_dir):
+        return dataset_dir
+    return None
+
+
+def normalize_pixel_chunk(chunk_df):
+    """
+    Convert a pixel CSV chunk (read with pixel_read_csv_kwargs) to the
+    typed staging layout. Rows without a parseable PIXEL_TS are dropped.
+
+    Returns:
+        (normalized DataFrame, number of rows whose PIXEL_TS took the slow parsing path)
+    """
+    df = coerce_pixel_ids(chunk_df.copy())
+    df['event_date'], slow_ts_rows = parse_pixel_ts(df['event_date'])
+    df = df.dropna(subset=['event_date'])
+
+    if 'advertiser_id' in df.columns:
+        df['advertiser'] = df['advertiser_id'].map(ADVERTISER_MAPPING)
+        df = df.drop(columns=['advertiser_id'])
+
+    # Недостающие колонки добавляем пустыми, чтобы схема всех файлов совпадала
+    for col in STRING_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+        df[col] = df[col].astype('string')
+    for col in ['publisher_id', 'campaign_id']:
+        if col not in df.columns:
+            df[col] = pd.array([pd.NA] * len(df), dtype='Int64')
+    for col in ['deposit_amount', 'converted_amount']:
+        if col not in df.columns:
+            df[col] = float('nan')
+
+    df['event_type'] = df['event_type'].fillna('unknown')
+    df['event_day'] = df['event_date'].dt.strftime('%Y-%m-%d')
+    return df, slow_ts_rows
+
+
+def write_pixel_chunk(df, dataset_dir, chunk_num):
+    """Append a normalized chunk to the partitioned dataset"""
+    _require_pyarrow()
+    schema = pixel_arrow_schema()
+    table = pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+    ds.write_dataset(
+        table,
+        dataset_dir,
+        format='parquet',
+        partitioning=ds.partitioning(
+            pa.schema([(col, pa.string()) for col in PARTITION_COLUMNS]),
+            flavor='hive',
+        ),
+        basename_template=f'chunk-{chunk_num:06d}-{{i}}.parquet',
+        existing_data_behavior='overwrite_or_ignore',
+    )
+
+
+def _dataset_filter(start_date=None, end_date=None, event_types=None):
+    """Build a partition/row filter expression (pushed down to Parquet)"""
+    expr = None
+
+    def _and(a, b):
+        return b if a is None else a & b
+
+    if start_date is not None:
+        expr = _and(expr, ds.field('event_day') >= str(pd.Timestamp(start_date).date()))
+    if end_date is not None:
+        end_ts = pd.Timestamp(end_date)
+        expr = _and(expr, ds.field('event_day') <= str(end_ts.date()))
+        if end_ts != end_ts.normalize():
+            # Конец периода внутри дня - дополнительно фильтруем по времени
+            if end_ts.tzinfo is None:
+                end_ts = end_ts.tz_localize('UTC')
+            expr = _and(expr, ds.field('event_date') <= pa.scalar(end_ts.to_pydatetime(), pa.timestamp('us', tz='UTC')))
+    if event_types is not None:
+        expr = _and(expr, ds.field('event_type').isin(list(event_types)))
+    return expr
+
+
+def open_pixel_dataset(dataset_dir):
+    """Open staged dataset with hive partitioning"""
+    _require_pyarrow()
+    return ds.dataset(
+        dataset_dir,
+        format='parquet',
+        schema=pixel_arrow_schema(),
+        partitioning=ds.partitioning(
+            pa.schema([(col, pa.string()) for col in PARTITION_COLUMNS]),
+            flavor='hive',
+        ),
+    )
+
+
+def read_pixel_dataset(dataset_dir, columns=None, start_date=None, end_date=None, event_types=None):
+    """
+    Read staged pixel events into a DataFrame.
+    Only the requested columns are decoded and only matching
+    event_day/event_type partitions are opened.
+
+    Args:
+        dataset_dir: dataset root directory
+        columns: list of columns to read (default: all)
+        start_date: first day to include (inclusive)
+        end_date: last day or timestamp to include (inclusive)
+        event_types: optional list of event types, e.g. ['deposit']
+    """
+    dataset = open_pixel_dataset(dataset_dir)
+    table = dataset.to_table(
+        columns=columns,
+        filter=_dataset_filter(start_date, end_date, event_types),
+    )
+    return table.to_pandas()
+
+
+def iter_pixel_batches(dataset_dir, columns=None, start_date=None, end_date=None, event_types=None,
+                       batch_size=50000):
+    """
+    Stream staged pixel events as DataFrames of up to batch_size rows.
+    Same pushdown as read_pixel_dataset, with bounded memory.
+    """
+    dataset = open_pixel_dataset(dataset_dir)
+    scanner = dataset.scanner(
+        columns=columns,
+        filter=_dataset_filter(start_date, end_date, event_types),
+        batch_size=batch_size,
+    )
+    for batch in scanner.to_batches():
+        if batch.num_rows > 0:
+            yield batch.to_pandas()
+
+
+def count_pixel_rows(dataset_dir, start_date=None, end_date=None, event_types=None):
+    """Count staged rows matching the filter (uses Parquet metadata where possible)"""
+    dataset = open_pixel_dataset(dataset_dir)
+    return dataset.count_rows(filter=_dataset_filter(start_date, end_date, event_types))
@@ -0,0 +1,95 @@
+"""
+Declarative schema of pixel CSV exports
+One definition of source column -> user_events column and read-time dtype.
+pixel_read_csv_kwargs() turns it into usecols/dtype/names for pd.read_csv,
+so unused columns are never materialized and low-cardinality columns arrive
+as categories instead of object strings. Integer IDs are read as strings and
+converted by coerce_pixel_ids() after reading: one malformed token ("123.0",
+"", junk) becomes NA instead of aborting the whole import.
+"""
+import pandas as pd
+
+# ADVERTISER_ID -> advertiser
+ADVERTISER_MAPPING = {1: '4rabet', 2: 'Crorebet'}
+
+# Колонка pixel-экспорта -> (колонка user_events, dtype при чтении)
+PIXEL_SCHEMA = {
+    'EVENT_ID': ('event_id', str),
+    'EXTERNAL_USER_ID': ('external_user_id', str),
+    'UBIDEX_ID': ('ubidex_id', str),
+    'TYPE': ('event_type', 'category'),
+    'PIXEL_TS': ('event_date', str),
+    'PUBLISHER_ID': ('publisher_id', str),
+    'CAMPAIGN_ID': ('campaign_id', str),
+    'SUB_ID': ('sub_id', str),
+    'AFFILIATE_ID': ('affiliate_id', str),
+    'DEPOSIT_AMOUNT': ('deposit_amount', 'float64'),
+    'CURRENCY': ('currency', 'category'),
+    'CONVERTED_AMOUNT': ('converted_amount', 'float64'),
+    'CONVERTED_CURRENCY': ('converted_currency', 'category'),
+    'WEBSITE': ('website', str),
+    'COUNTRY': ('country', 'category'),
+    'TRANSACTION_ID': ('transaction_id', str),
+    'ADVERTISER_ID': ('advertiser_id', str),
+}
+
+# Целочисленные ID: читаются строками, приводятся к Int64 в coerce_pixel_ids()
+PIXEL_ID_COLUMNS = ['publisher_id', 'campaign_id', 'advertiser_id']
+
+# В старых экспортах идентификатор события называется ID
+EVENT_ID_ALIASES = ['ID']
+
+PIXEL_DTYPES = {target: dtype for target, dtype in PIXEL_SCHEMA.values()}
+
+
+def coerce_pixel_ids(chunk_df):
+    """
+    Convert ID columns read as strings to nullable Int64.
+    Unparseable and fractional values become NA (pd.to_numeric(errors='coerce')).
+
+    Args:
+        chunk_df: chunk read with pixel_read_csv_kwargs (modified in place)
+
+    Returns:
+        the same DataFrame
+    """
+    for col in PIXEL_ID_COLUMNS:
+        if col in chunk_df.columns:
+            values = pd.to_numeric(chunk_df[col], errors='coerce')
+            chunk_df[col] = values.where(values == values.round()).astype('Int64')
+    return chunk_df
+
+
+def pixel_read_csv_kwargs(csv_path, columns=None):
+    """
+    Build pd.read_csv keyword arguments for a pixel export.
+    The header is read once; columns are renamed to user_events names
+    through names=, so usecols/dtype refer to the target names.
+
+    Args:
+        csv_path: path to pixel CSV export
+        columns: optional list of target columns to read (default: all known)
+
+    Returns:
+        dict with header, names, usecols and dtype (works with chunksize
+        and with csv_checkpoint.iter_csv_chunks)
+    """
+    header = list(pd.read_csv(csv_path, nrows=0).columns)
+    source_to_target = {source: target for source, (target, _) in PIXEL_SCHEMA.items()}
+    if 'EVENT_ID' not in header:
+        for alias in EVENT_ID_ALIASES:
+            if alias in header:
+                source_to_target[alias] = 'event_id'
+                break
+
+    names = [source_to_target.get(col, col) for col in header]
+    usecols = [
+        name for name in names
+        if name in PIXEL_DTYPES and (columns is None or name in columns)
+    ]
+    return {
+        'header': 0,
+        'names': names,
+        'usecols': usecols,
+        'dtype': {name: PIXEL_DTYPES[name] for name in usecols},
+    }
@@ -0,0 +1,207 @@
+"""
+Publisher dimension table (publishers)
+One row per publisher_id with the canonical name, ad format and the first/last
+date the publisher appeared in spend data. Spend fact tables
+(publisher_spend, publisher_spend_daily) carry only publisher_id; reports join
+publishers for name and format. Changing the format rules means re-deriving
+format for this small table (fix_format_in_database.py), not for every fact row.
+
+The canonical name is the one seen on the latest date, so renames in the spend
+exports follow the newest file. Loaders upsert into publishers in the same
+transaction as the facts they load. Spend tables created before the
+dimension existed are migrated once, on purpose, by
+migrate_publishers_dimension.py (backfill + dropping publisher_name/format).
+"""
+import pandas as pd
+from sqlalchemy import text
+from db_utils import copy_dataframe
+from publisher_parsing import parse_publishers
+
+PUBLISHERS_TABLE = 'publishers'
+SPEND_TABLES = {
+    # Таблица фактов -> выражение даты, когда паблишер встречался
+    'publisher_spend': "TO_DATE(month, 'YYYY-MM')",
+    'publisher_spend_daily': 'date',
+}
+STAGE_TABLE = 'publishers_stage'
+
+create_publishers_sql = f"""
+CREATE TABLE IF NOT EXISTS {PUBLISHERS_TABLE} (
+    publisher_id BIGINT PRIMARY KEY,
+    publisher_name VARCHAR(255) NOT NULL,
+    format VARCHAR(50) NOT NULL,
+    first_seen DATE NOT NULL,
+    last_seen DATE NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_publishers_format ON {PUBLISHERS_TABLE}(format);
+"""
+
+# Новое название/формат принимаются, только если данные не старее сохраненных
+upsert_publishers_sql = f"""
+INSERT INTO {PUBLISHERS_TABLE} (publisher_id, publisher_name, format, first_seen, last_seen)
+SELECT publisher_id, publisher_name, format, first_seen, last_seen
+FROM {STAGE_TABLE}
+ON CONFLICT (publisher_id) DO UPDATE
+SET publisher_name = CASE WHEN EXCLUDED.last_seen >= {PUBLISHERS_TABLE}.last_seen
+                          THEN EXCLUDED.publisher_name ELSE {PUBLISHERS_TABLE}.publisher_name END,
+    format = CASE WHEN EXCLUDED.last_seen >= {PUBLISHERS_TABLE}.last_seen
+                  THEN EXCLUDED.format ELSE {PUBLISHERS_TABLE}.format END,
+    first_seen = LEAST({PUBLISHERS_TABLE}.first_seen, EXCLUDED.first_seen),
+    last_seen = GREATEST({PUBLISHERS_TABLE}.last_seen, EXCLUDED.last_seen),
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+
+def publishers_from_spend(spend, seen_column):
+    """
+    Collapse spend rows to one row per publisher for upsert_publishers.
+
+    Args:
+        spend: DataFrame with publisher_id, publisher_name and seen_column
+        seen_column: date column (date of the daily row or first day of the month)
+
+    Returns:
+        DataFrame with publisher_id, publisher_name, first_seen, last_seen
+    """
+    rows = spend[['publisher_id', 'publisher_name', seen_column]].dropna()
+    rows = rows.rename(columns={seen_column: 'seen'})
+    rows['seen'] = pd.to_datetime(rows['seen']).dt.date
+    return (
+        rows.groupby(['publisher_id', 'publisher_name'], sort=False)['seen']
+        .agg(first_seen='min', last_seen='max')
+        .reset_index()
+    )
+
+
+def upsert_publishers(conn, publishers):
+    """
+    Insert new publishers and refresh name/format/seen range of known ones.
+    Format is derived here from the canonical name (parse_publishers), so
+    every loader classifies publishers the same way.
+
+    Args:
+        conn: SQLAlchemy PostgreSQL connection (caller commits)
+        publishers: DataFrame with publisher_id, publisher_name, first_seen,
+            last_seen (several names per publisher_id allowed)
+
+    Returns:
+        Number of publishers upserted
+    """
+    if len(publishers) == 0:
+        return 0
+
+    # Каноническое название - последнее по дате; диапазон - по всем названиям
+    ordered = publishers.sort_values(['publisher_id', 'last_seen'])
+    canonical = ordered.drop_duplicates('publisher_id', keep='last').set_index('publisher_id')
+    seen = ordered.groupby('publisher_id').agg(first_seen=('first_seen', 'min'), last_seen=('last_seen', 'max'))
+    stage = seen.join(canonical[['publisher_name']]).reset_index()
+    stage['publisher_id'] = stage['publisher_id'].astype('int64')
+    stage['format'] = parse_publishers(stage['publisher_name'])['format'].astype(str)
+
+    conn.execute(text(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} (
+            publisher_id BIGINT PRIMARY KEY,
+            publisher_name VARCHAR(255) NOT NULL,
+            format VARCHAR(50) NOT NULL,
+            first_seen DATE NOT NULL,
+            last_seen DATE NOT NULL
+        ) ON COMMIT DROP
+    """))
+    conn.execute(text(f"TRUNCATE {STAGE_TABLE}"))
+    copy_dataframe(conn, stage, STAGE_TABLE,
+                   columns=['publisher_id', 'publisher_name', 'format', 'first_seen', 'last_seen'])
+    conn.execute(text(upsert_publishers_sql))
+    return len(stage)
+
+
+def _legacy_columns(conn, table_name):
+    result = conn.execute(text("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = :table_name
+          AND column_name IN ('publisher_name', 'format')
+    """), {'table_name': table_name})
+    return [row[0] for row in result]
+
+
+def ensure_publishers(conn):
+    """
+    Create the publishers table if it does not exist (no changes to the spend
+    tables; see migrate_spend_tables).
+
+    Args:
+        conn: SQLAlchemy PostgreSQL connection (commits)
+    """
+    conn.execute(text(create_publishers_sql))
+    conn.commit()
+
+
+def publishers_exists(conn):
+    """True if the publishers table exists (read-only check)"""
+    return conn.execute(text("SELECT to_regclass(:name)"), {'name': PUBLISHERS_TABLE}).scalar() is not None
+
+
+def legacy_spend_tables(conn):
+    """
+    Spend tables that still carry the denormalized publisher_name/format
+    columns, i.e. need migrate_spend_tables (read-only check).
+
+    Returns:
+        dict {fact table: list of legacy columns}
+    """
+    legacy = {}
+    for table_name in SPEND_TABLES:
+        columns = _legacy_columns(conn, table_name)
+        if columns:
+            legacy[table_name] = columns
+    return legacy
+
+
+def migrate_spend_tables(conn):
+    """
+    One-time migration of legacy spend tables (migrate_publishers_dimension.py):
+    publishers are backfilled from the publisher_name stored in fact rows,
+    then the denormalized publisher_name/format columns are dropped.
+    Runs in one transaction.
+
+    Args:
+        conn: SQLAlchemy PostgreSQL connection (commits the migration)
+
+    Returns:
+        dict {fact table: publishers backfilled} for migrated tables
+    """
+    conn.execute(text(create_publishers_sql))
+    migrated = {}
+    for table_name, legacy in legacy_spend_tables(conn).items():
+        if 'publisher_name' in legacy:
+            seen_expr = SPEND_TABLES[table_name]
+            publishers = pd.read_sql(text(f"""
+                SELECT
+                    publisher_id,
+                    publisher_name,
+                    MIN({seen_expr}) AS first_seen,
+                    MAX({seen_expr}) AS last_seen
+                FROM {table_name}
+                WHERE publisher_name IS NOT NULL
+                GROUP BY publisher_id, publisher_name
+            """), conn)
+            migrated[table_name] = upsert_publishers(conn, publishers)
+        else:
+            migrated[table_name] = 0
+        conn.execute(text(f"ALTER TABLE {table_name} "
+                          + ', '.join(f"DROP COLUMN {column}" for column in legacy)))
+    conn.commit()
+    return migrated
+
+
+def warn_legacy_spend_tables(conn):
+    """Print a warning if spend tables still need migrate_publishers_dimension.py"""
+    legacy = legacy_spend_tables(conn)
+    if legacy:
+        print(f"   ВНИМАНИЕ: таблицы {', '.join(legacy)} еще содержат publisher_name/format.")
+        print("   Справочник publishers для старых данных не заполнен - запустите один раз:")
+        print("   python migrate_publishers_dimension.py")
+    return legacy
@@ -0,0 +1,102 @@
+"""
+Publisher name parsing shared by spend loaders and analyses
+Spend exports name publishers like "(12345) Network-PUSH-Premium": the
+numeric ID in leading parentheses and the ad format as a token of the name.
+One precompiled regex extracts both in a single pass: every format token is
+an optional lookahead group, and the format is the first group that matched
+in priority order (POP, BANNER, VIDEO, PUSH, NATIVE). Parsing runs once per
+unique publisher string (spend files repeat the same names on every day).
+"""
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+FORMAT_CATEGORIES = ['POP', 'PUSH', 'VIDEO', 'BANNER', 'NATIVE', 'OTHER']
+
+# Порядок проверки форматов: сначала более специфичные (POP до PUSH и т.д.)
+FORMAT_PRIORITY = ['POP', 'BANNER', 'VIDEO', 'PUSH', 'NATIVE']
+
+_FORMAT_TOKENS = {
+    'POP': r'-POP\b|POP-|POP\s|POP$',
+    'BANNER': r'-BANNER\b|BANNER-|BANNER\s|BANNER$',
+    'VIDEO': r'-VIDEO\b|VIDEO-|VIDEO\s|VIDEO$',
+    'PUSH': r'-PUSH\b|PUSH-|PUSH\s|PUSH$|IN-PAGE|INPAGE',
+    'NATIVE': r'-NATIVE\b|NATIVE-|NATIVE\s|NATIVE$',
+}
+
+# Применяется к названию в верхнем регистре. push_inside - PUSH внутри слова
+# ("REALPUSHX"): такой PUSH форматом не считается
+PUBLISHER_PATTERN = re.compile(
+    r'^(?:\((?P<publisher_id>\d+)\))?'
+    + ''.join(
+        f'(?:(?=.*?(?P<{fmt.lower()}>{token})))?'
+        for fmt, token in _FORMAT_TOKENS.items()
+    )
+    + r'(?:(?=.*?(?P<push_inside>[A-Z]PUSH[A-Z])))?',
+    re.DOTALL,
+)
+
+
+def _pick_format(groups):
+    """Format from PUBLISHER_PATTERN groups (dict or DataFrame of matches)"""
+    for fmt in FORMAT_PRIORITY:
+        found = groups[fmt.lower()]
+        if fmt == 'PUSH':
+            if found is not None and groups['push_inside'] is None:
+                return fmt
+        elif found is not None:
+            return fmt
+    return 'OTHER'
+
+
+@lru_cache(maxsize=None)
+def _parse_one(publisher_str):
+    match = PUBLISHER_PATTERN.match(publisher_str.upper())
+    groups = match.groupdict()
+    publisher_id = int(groups['publisher_id']) if groups['publisher_id'] else None
+    return publisher_id, _pick_format(groups)
+
+
+def extract_publisher_id(publisher_str):
+    """Numeric publisher ID from "(12345) Name", None if absent"""
+    return _parse_one(str(publisher_str))[0]
+
+
+def extract_format(publisher_str):
+    """Ad format (POP/PUSH/VIDEO/BANNER/NATIVE/OTHER) from publisher name"""
+    return _parse_one(str(publisher_str))[1]
+
+
+def parse_publishers(values):
+    """
+    Vectorized publisher_id + format for a column of publisher names.
+    The regex runs once per unique name (Series.str.extract), results are
+    broadcast back through factorize codes.
+
+    Args:
+        values: Series (or list) of publisher names
+
+    Returns:
+        DataFrame with publisher_id (Int64, NA if absent) and format
+        (categorical with FORMAT_CATEGORIES), same index as values
+    """
+    series = pd.Series(values) if not isinstance(values, pd.Series) else values
+    codes, uniques = pd.factorize(series.astype(str), sort=False)
+    groups = pd.Series(uniques, dtype=object).str.upper().str.extract(PUBLISHER_PATTERN)
+
+    # Первый сработавший формат в порядке приоритета
+    conditions = []
+    for fmt in FORMAT_PRIORITY:
+        found = groups[fmt.lower()].notna()
+        if fmt == 'PUSH':
+            found &= groups['push_inside'].isna()
+        conditions.append(found.to_numpy())
+    unique_formats = np.select(conditions, FORMAT_PRIORITY, default='OTHER')
+    unique_ids = pd.to_numeric(groups['publisher_id']).astype('Int64')
+
+    format_codes = pd.Categorical(unique_formats, categories=FORMAT_CATEGORIES).codes
+    return pd.DataFrame({
+        'publisher_id': unique_ids.array.take(codes, allow_fill=True),
+        'format': pd.Categorical.from_codes(format_codes[codes], categories=FORMAT_CATEGORIES),
+    }, index=series.index)
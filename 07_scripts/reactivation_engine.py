@@ -0,0 +1,337 @@
+"""
+Single-pass reactivation engine
+Deposits are streamed once, sorted by (user, time), and every period window
+is evaluated on the same chunk with vectorized NumPy: the user's first
+deposit in the window and the deposit right before it (the previous one in
+sorted order) give days_inactive and the inactivity bucket. This replaces
+the per-period LEFT JOIN user_events ... MAX(event_date) over the whole
+history.
+
+Memory stays bounded: a chunk is processed as soon as it arrives and only
+the rows of its last (possibly incomplete) user are carried into the next one.
+"""
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from db_utils import sql_days_between
+
+# Границы категорий неактивности (дни): [0, 7), [7, 14), [14, 30), [30, 90), [90, ...)
+INACTIVITY_BINS = [7, 14, 30, 90]
+INACTIVITY_LABELS = ['0-7 days', '7-14 days', '14-30 days', '30-90 days', '90+ days']
+
+DETAIL_COLUMNS = ['user_id', 'first_deposit', 'prev_deposit_date', 'days_inactive', 'period']
+
+NS_PER_DAY = 86400 * 10**9
+
+deposits_sql = """
+SELECT external_user_id, event_date
+FROM user_events
+WHERE event_type = 'deposit'
+  AND external_user_id IS NOT NULL
+  {until}
+ORDER BY external_user_id, event_date
+"""
+
+
+def period_window(start_date, end_date):
+    """
+    Turn inclusive 'YYYY-MM-DD' dates into a [start, end) timestamp window
+    (same days as event_date >= 'start 00:00:00' AND <= 'end 23:59:59').
+    """
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+    return start, end
+
+
+def _naive_utc(values):
+    # SQLite отдает строки, Parquet - UTC с таймзоной, PostgreSQL - naive TIMESTAMP
+    dates = pd.to_datetime(values)
+    if getattr(dates.dt, 'tz', None) is not None:
+        dates = dates.dt.tz_convert('UTC').dt.tz_localize(None)
+    return dates.to_numpy(dtype='datetime64[ns]')
+
+
+def iter_deposit_chunks(conn, until=None, chunk_size=200000):
+    """
+    Stream deposits sorted by (external_user_id, event_date).
+    On PostgreSQL rows come from a server-side cursor (stream_results).
+
+    Args:
+        conn: SQLAlchemy connection
+        until: optional upper bound (exclusive) - later deposits can't matter
+        chunk_size: rows per DataFrame
+    """
+    params = {}
+    until_sql = ''
+    if until is not None:
+        until_sql = 'AND event_date < :until'
+        params['until'] = pd.Timestamp(until).to_pydatetime()
+    query = text(deposits_sql.format(until=until_sql))
+    stream_conn = conn.execution_options(stream_results=True)
+    for chunk in pd.read_sql(query, stream_conn, params=params, chunksize=chunk_size):
+        yield chunk
+
+
+def iter_parquet_deposit_chunks(dataset_dir, until=None, chunk_size=200000):
+    """
+    Deposits from the Parquet staging dataset, sorted by (user, time).
+    The dataset is partitioned by day, so the two deposit columns are read
+    once and sorted in memory before being sliced into chunks.
+    """
+    from pixel_parquet import read_pixel_dataset
+
+    end_date = None
+    if until is not None:
+        end_date = pd.Timestamp(until) - pd.Timedelta(seconds=1)
+    deposits = read_pixel_dataset(
+        dataset_dir,
+        columns=['external_user_id', 'event_date'],
+        end_date=end_date,
+        event_types=['deposit'],
+    )
+    deposits = deposits.dropna(subset=['external_user_id'])
+    deposits = deposits.sort_values(['external_user_id', 'event_date'], kind='stable', ignore_index=True)
+    for offset in range(0, len(deposits), chunk_size):
+        yield deposits.iloc[offset:offset + chunk_size]
+
+
+def categorize_days(days_inactive):
+    """Vectorized inactivity bucket for an array of days (NaN -> None)"""
+    days = np.asarray(days_inactive, dtype='float64')
+    labels = np.array(INACTIVITY_LABELS, dtype=object)[np.searchsorted(INACTIVITY_BINS, days, side='right')]
+    labels[np.isnan(days)] = None
+    return labels
+
+
+def _scan_chunk(users, dates, windows):
+    """Evaluate all windows on a chunk holding complete users only"""
+    results = {}
+    if len(users) == 0:
+        return results
+    # Номер пользователя внутри чанка (строки отсортированы по пользователю)
+    new_user = np.empty(len(users), dtype=bool)
+    new_user[0] = True
+    new_user[1:] = users[1:] != users[:-1]
+    codes = np.cumsum(new_user)
+
+    for name, (start, end) in windows.items():
+        in_window = np.flatnonzero((dates >= start) & (dates < end))
+        if len(in_window) == 0:
+            continue
+        # Первый депозит пользователя в окне
+        first_mask = np.empty(len(in_window), dtype=bool)
+        first_mask[0] = True
+        first_mask[1:] = codes[in_window[1:]] != codes[in_window[:-1]]
+        first_idx = in_window[first_mask]
+
+        # Предыдущий депозит - строка перед ним, если она того же пользователя
+        prev_idx = first_idx - 1
+        has_prev = (first_idx > 0) & (codes[np.maximum(prev_idx, 0)] == codes[first_idx])
+        prev_dates = np.where(has_prev, dates[np.maximum(prev_idx, 0)], np.datetime64('NaT'))
+
+        first_dates = dates[first_idx]
+        gap_ns = (first_dates - prev_dates).astype('int64').astype('float64')
+        # Целые дни с отбрасыванием дробной части, как CAST(julianday(a) - julianday(b) AS INTEGER)
+        days = np.where(has_prev, np.floor(gap_ns / NS_PER_DAY), np.nan)
+
+        results[name] = pd.DataFrame({
+            'user_id': users[first_idx],
+            'first_deposit': first_dates,
+            'prev_deposit_date': prev_dates,
+            'days_inactive': pd.array(days, dtype='Int64'),
+            'period': categorize_days(days),
+        })
+    return results
+
+
+def scan_reactivations(chunks, windows):
+    """
+    Compute first deposit / previous deposit / days_inactive for every
+    window in one pass over sorted deposit chunks.
+
+    Args:
+        chunks: iterable of DataFrames with external_user_id, event_date,
+            sorted by (external_user_id, event_date)
+        windows: dict name -> (start, end) timestamps, end exclusive
+            (see period_window)
+
+    Returns:
+        dict name -> DataFrame with DETAIL_COLUMNS, one row per depositor of
+        the window; users without an earlier deposit have NaT/NA/None in
+        prev_deposit_date/days_inactive/period
+    """
+    windows = {
+        name: (np.datetime64(pd.Timestamp(start), 'ns'), np.datetime64(pd.Timestamp(end), 'ns'))
+        for name, (start, end) in windows.items()
+    }
+    parts = {name: [] for name in windows}
+    carry_users = np.array([], dtype=object)
+    carry_dates = np.array([], dtype='datetime64[ns]')
+
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        users = np.concatenate([carry_users, chunk['external_user_id'].astype(str).to_numpy(dtype=object)])
+        dates = np.concatenate([carry_dates, _naive_utc(chunk['event_date'])])
+
+        # Последний пользователь может продолжиться в следующем чанке - переносим его строки
+        tail_start = len(users) - 1
+        while tail_start > 0 and users[tail_start - 1] == users[-1]:
+            tail_start -= 1
+        carry_users, carry_dates = users[tail_start:], dates[tail_start:]
+
+        for name, df in _scan_chunk(users[:tail_start], dates[:tail_start], windows).items():
+            parts[name].append(df)
+
+    for name, df in _scan_chunk(carry_users, carry_dates, windows).items():
+        parts[name].append(df)
+
+    results = {}
+    for name, frames in parts.items():
+        if frames:
+            results[name] = pd.concat(frames, ignore_index=True)
+        else:
+            results[name] = pd.DataFrame(columns=DETAIL_COLUMNS)
+    return results
+
+
+def reactivations_only(detail):
+    """Depositors of a window that had an earlier deposit (= reactivations)"""
+    return detail[detail['prev_deposit_date'].notna()].reset_index(drop=True)
+
+
+def summarize_reactivations(reactivations):
+    """
+    Distribution by inactivity period: count, avg_days, percentage,
+    rows in INACTIVITY_LABELS order (empty buckets omitted).
+    """
+    summary = reactivations.groupby('period').agg({
+        'user_id': 'count',
+        'days_inactive': 'mean'
+    }).round(1)
+    summary.columns = ['count', 'avg_days']
+    summary['percentage'] = (summary['count'] / summary['count'].sum() * 100).round(1)
+    return summary.reindex([p for p in INACTIVITY_LABELS if p in summary.index])
+
+
+def compute_reactivations(conn, windows, chunk_size=200000, parquet_dir=None):
+    """
+    Run scan_reactivations over user_events deposits (or the Parquet
+    staging dataset when parquet_dir is given), reading nothing past the
+    latest window end.
+
+    Returns:
+        dict name -> detail DataFrame (see scan_reactivations)
+    """
+    until = max(pd.Timestamp(end) for _, end in windows.values())
+    if parquet_dir:
+        chunks = iter_parquet_deposit_chunks(parquet_dir, until=until, chunk_size=chunk_size)
+    else:
+        chunks = iter_deposit_chunks(conn, until=until, chunk_size=chunk_size)
+    return scan_reactivations(chunks, windows)
+
+
+def compare_periods(summaries, control, target):
+    """
+    Comparison table with percentages across periods (one row per
+    inactivity bucket plus TOTAL): {name}_count / {name}_% per period,
+    the control average, and target minus average / each control period.
+
+    Args:
+        summaries: dict name -> summarize_reactivations() result, in column order
+        control: names of the control periods (averaged)
+        target: name of the period compared against the control
+
+    Raises:
+        ValueError: control is empty or names a period missing from summaries
+    """
+    if not control:
+        raise ValueError("compare_periods needs at least one control period")
+    unknown = [name for name in [target, *control] if name not in summaries]
+    if unknown:
+        raise ValueError(f"Unknown periods: {', '.join(unknown)} (available: {', '.join(summaries)})")
+
+    comparison = pd.DataFrame(index=INACTIVITY_LABELS)
+    totals = {}
+    for name, summary in summaries.items():
+        summary = summary.reindex(INACTIVITY_LABELS)
+        comparison[f'{name}_count'] = summary['count'].fillna(0)
+        comparison[f'{name}_%'] = summary['percentage'].fillna(0)
+        totals[f'{name}_count'] = comparison[f'{name}_count'].sum()
+        totals[f'{name}_%'] = 100.0
+
+    comparison['Control_avg_count'] = (
+        sum(comparison[f'{name}_count'] for name in control) / len(control)
+    ).round(0)
+    control_total = sum(totals[f'{name}_count'] for name in control) / len(control)
+    comparison['Control_avg_%'] = (comparison['Control_avg_count'] / control_total * 100).round(1)
+    totals['Control_avg_count'] = control_total
+    totals['Control_avg_%'] = 100.0
+
+    comparison[f'Diff_{target}_vs_Avg'] = comparison[f'{target}_count'] - comparison['Control_avg_count']
+    totals[f'Diff_{target}_vs_Avg'] = totals[f'{target}_count'] - control_total
+    for name in control:
+        comparison[f'Diff_{target}_vs_{name}'] = comparison[f'{target}_count'] - comparison[f'{name}_count']
+        totals[f'Diff_{target}_vs_{name}'] = totals[f'{target}_count'] - totals[f'{name}_count']
+
+    return pd.concat([comparison, pd.Series(totals, name='TOTAL').to_frame().T])
+
+
+def window_params(start, end):
+    """[start, end) window as query parameters (text comparable on SQLite)"""
+    return {
+        'start': pd.Timestamp(start).strftime('%Y-%m-%d %H:%M:%S'),
+        'end': pd.Timestamp(end).strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def reactivations_sql(conn, group_columns=(), user_filter=''):
+    """
+    Window-function plan for reactivations in one window (:start, :end),
+    for filtered cohorts where the database should do the work: LAG() gives
+    every deposit its previous one, ROW_NUMBER() picks the first deposit in
+    the window per user (and group_columns, e.g. publisher_id). Both are
+    served by the partial deposit index (ensure_deposit_index) on
+    PostgreSQL and SQLite alike.
+
+    Args:
+        conn: connection (picks the dialect for days_inactive)
+        group_columns: extra user_events columns to split first deposits by
+        user_filter: extra SQL condition on deposits, e.g. 'AND external_user_id = ANY(:ids)'
+
+    Returns:
+        SQL text with user_id, group_columns, first_deposit, prev_deposit_date,
+        days_inactive (whole days) for reactivated users only
+    """
+    group_sql = ''.join(f', {col}' for col in group_columns)
+    days_sql = sql_days_between('first_deposit', 'prev_deposit_date', conn, whole=True)
+    return f"""
+    WITH deposits AS (
+        SELECT
+            external_user_id{group_sql},
+            event_date,
+            LAG(event_date) OVER (PARTITION BY external_user_id ORDER BY event_date) AS prev_deposit_date
+        FROM user_events
+        WHERE event_type = 'deposit'
+          AND external_user_id IS NOT NULL
+          AND event_date < :end
+          {user_filter}
+    ),
+    period_first_deposit AS (
+        SELECT
+            external_user_id{group_sql},
+            event_date AS first_deposit,
+            prev_deposit_date,
+            ROW_NUMBER() OVER (PARTITION BY external_user_id{group_sql} ORDER BY event_date) AS rn
+        FROM deposits
+        WHERE event_date >= :start
+    )
+    SELECT
+        external_user_id AS user_id{group_sql},
+        first_deposit,
+        prev_deposit_date,
+        {days_sql} AS days_inactive
+    FROM period_first_deposit
+    WHERE rn = 1
+      AND prev_deposit_date IS NOT NULL
+    """
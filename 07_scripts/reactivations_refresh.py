@@ -0,0 +1,204 @@
+"""
+Incremental maintenance of reactivations_materialized
+The table holds one row per reactivation deposit (a deposit made at least
+7 days after the user's previous deposit). Instead of recomputing LAG() over
+all deposits, a refresh only touches users whose deposits were loaded after
+the stored watermark (user_events.loaded_at, minus a safety window for loads
+that commit late): their reactivations from the earliest new deposit on are
+deleted and recomputed, seeded with the last deposit before it. Everything runs in one transaction, so dashboards keep
+reading the previous version until the commit.
+"""
+from sqlalchemy import text
+from db_utils import (
+    ensure_deposit_index, ensure_refresh_state, require_loaded_at, get_watermark, get_deposits_watermark,
+    set_watermark, watermark_since,
+)
+
+REACTIVATIONS_TABLE = 'reactivations_materialized'
+
+# Категории неактивности (дни между депозитами)
+INACTIVITY_PERIOD_SQL = """
+    CASE
+        WHEN EXTRACT(EPOCH FROM (deposit_date - prev_deposit_date)) / 86400 < 14 THEN '7-14 days'
+        WHEN EXTRACT(EPOCH FROM (deposit_date - prev_deposit_date)) / 86400 < 30 THEN '14-30 days'
+        WHEN EXTRACT(EPOCH FROM (deposit_date - prev_deposit_date)) / 86400 < 90 THEN '30-90 days'
+        ELSE '90+ days'
+    END
+"""
+
+# Уникальный ключ (user_id, first_deposit) - тот же, что нужен для REFRESH ... CONCURRENTLY
+create_table_sql = f"""
+CREATE TABLE IF NOT EXISTS {REACTIVATIONS_TABLE} (
+    user_id TEXT NOT NULL,
+    inactivity_period TEXT NOT NULL,
+    first_deposit TIMESTAMP NOT NULL,  -- Дата реактивации для фильтрации
+    days_inactive NUMERIC,
+    PRIMARY KEY (user_id, first_deposit)
+);
+CREATE INDEX IF NOT EXISTS idx_reactivations_first_deposit ON {REACTIVATIONS_TABLE}(first_deposit);
+CREATE INDEX IF NOT EXISTS idx_reactivations_period ON {REACTIVATIONS_TABLE}(inactivity_period);
+"""
+
+full_rebuild_sql = f"""
+INSERT INTO {REACTIVATIONS_TABLE} (user_id, inactivity_period, first_deposit, days_inactive)
+SELECT
+    external_user_id,
+    {INACTIVITY_PERIOD_SQL},
+    deposit_date,
+    EXTRACT(EPOCH FROM (deposit_date - prev_deposit_date)) / 86400
+FROM (
+    SELECT
+        external_user_id,
+        event_date AS deposit_date,
+        LAG(event_date) OVER (PARTITION BY external_user_id ORDER BY event_date) AS prev_deposit_date
+    FROM public.user_events
+    WHERE event_type = 'deposit'
+      AND external_user_id IS NOT NULL
+) d
+WHERE prev_deposit_date IS NOT NULL
+  AND EXTRACT(EPOCH FROM (deposit_date - prev_deposit_date)) / 86400 >= 7
+ON CONFLICT (user_id, first_deposit) DO NOTHING
+"""
+
+# Пользователи с депозитами, загруженными после watermark, и самая ранняя
+# дата среди этих депозитов (с нее пересчитываются реактивации)
+affected_users_sql = """
+CREATE TEMP TABLE reactivation_affected_users ON COMMIT DROP AS
+SELECT external_user_id, MIN(event_date) AS since
+FROM public.user_events
+WHERE event_type = 'deposit'
+  AND external_user_id IS NOT NULL
+  AND loaded_at > :since
+  AND loaded_at <= :new_watermark
+GROUP BY external_user_id
+"""
+
+delete_affected_sql = f"""
+DELETE FROM {REACTIVATIONS_TABLE} r
+USING reactivation_affected_users a
+WHERE r.user_id = a.external_user_id
+  AND r.first_deposit >= a.since
+"""
+
+incremental_insert_sql = f"""
+INSERT INTO {REACTIVATIONS_TABLE} (user_id, inactivity_period, first_deposit, days_inactive)
+SELECT
+    external_user_id,
+    {INACTIVITY_PERIOD_SQL},
+    deposit_date,
+    EXTRACT(EPOCH FROM (deposit_date - prev_deposit_date)) / 86400
+FROM (
+    SELECT
+        e.external_user_id,
+        e.event_date AS deposit_date,
+        LAG(e.event_date) OVER (PARTITION BY e.external_user_id ORDER BY e.event_date) AS prev_deposit_date,
+        s.since
+    FROM (
+        -- Затравка: последний депозит пользователя до самого раннего нового
+        SELECT a.external_user_id, a.since, COALESCE(seed.seed_date, a.since) AS from_date
+        FROM reactivation_affected_users a
+        LEFT JOIN LATERAL (
+            SELECT MAX(p.event_date) AS seed_date
+            FROM public.user_events p
+            WHERE p.event_type = 'deposit'
+              AND p.external_user_id = a.external_user_id
+              AND p.event_date < a.since
+        ) seed ON TRUE
+    ) s
+    JOIN public.user_events e
+      ON e.external_user_id = s.external_user_id
+     AND e.event_type = 'deposit'
+     AND e.event_date >= s.from_date
+) d
+WHERE deposit_date >= since
+  AND prev_deposit_date IS NOT NULL
+  AND EXTRACT(EPOCH FROM (deposit_date - prev_deposit_date)) / 86400 >= 7
+ON CONFLICT (user_id, first_deposit) DO NOTHING
+"""
+
+
+def _is_materialized_view(conn):
+    result = conn.execute(
+        text("SELECT 1 FROM pg_matviews WHERE schemaname = 'public' AND matviewname = :name"),
+        {'name': REACTIVATIONS_TABLE},
+    )
+    return result.fetchone() is not None
+
+
+def _table_exists(conn):
+    return conn.execute(
+        text("SELECT to_regclass(:name)"), {'name': f'public.{REACTIVATIONS_TABLE}'}
+    ).scalar() is not None
+
+
+def prepare_reactivations_table(conn):
+    """
+    Create the incremental table and the supporting user_events index on
+    the first build. An old materialized view with the same name is dropped
+    (the table replaces it with the same columns). Later refreshes run no DDL
+    on user_events; loaded_at itself comes from schema setup (ensure_loaded_at).
+
+    Returns:
+        True if the table has to be fully built (new table or no watermark)
+    """
+    require_loaded_at(conn)
+    ensure_refresh_state(conn)
+    is_view = _is_materialized_view(conn)
+    if is_view:
+        conn.execute(text(f"DROP MATERIALIZED VIEW {REACTIVATIONS_TABLE} CASCADE"))
+    if is_view or not _table_exists(conn):
+        # Индекс для затравки (последний депозит пользователя до периода) и пересчета по пользователю
+        ensure_deposit_index(conn)
+        conn.execute(text(create_table_sql))
+    conn.commit()
+    return get_watermark(conn, REACTIVATIONS_TABLE) is None
+
+
+def refresh_reactivations(conn, full=False):
+    """
+    Bring reactivations_materialized up to date with user_events.
+
+    Args:
+        conn: SQLAlchemy connection to PostgreSQL
+        full: rebuild from scratch instead of an incremental refresh
+
+    Returns:
+        dict with mode ('full'/'incremental'/'up-to-date'), affected_users,
+        deleted, inserted and the new watermark
+    """
+    needs_full = prepare_reactivations_table(conn)
+    full = full or needs_full
+
+    watermark = get_watermark(conn, REACTIVATIONS_TABLE)
+    new_watermark = get_deposits_watermark(conn)
+
+    stats = {'mode': 'full' if full else 'incremental', 'affected_users': 0,
+             'deleted': 0, 'inserted': 0, 'watermark': new_watermark}
+
+    if full:
+        # DELETE (не TRUNCATE: он блокирует чтение) + INSERT в одной транзакции -
+        # читатели видят старые данные до коммита
+        conn.execute(text(f"DELETE FROM {REACTIVATIONS_TABLE}"))
+        stats['inserted'] = conn.execute(text(full_rebuild_sql)).rowcount
+    elif new_watermark is None:
+        stats['mode'] = 'up-to-date'
+        conn.commit()
+        return stats
+    else:
+        # Окно перед watermark: загрузки, закоммиченные позже своего loaded_at
+        conn.execute(text(affected_users_sql), {'since': watermark_since(watermark), 'new_watermark': new_watermark})
+        stats['affected_users'] = conn.execute(
+            text("SELECT COUNT(*) FROM reactivation_affected_users")
+        ).scalar()
+        stats['deleted'] = conn.execute(text(delete_affected_sql)).rowcount
+        stats['inserted'] = conn.execute(text(incremental_insert_sql)).rowcount
+
+    if not full and stats['affected_users'] == 0:
+        stats['mode'] = 'up-to-date'
+    # Watermark не откатывается назад (например, после удаления последних строк)
+    if watermark is not None and not full:
+        new_watermark = max(new_watermark, watermark)
+        stats['watermark'] = new_watermark
+    set_watermark(conn, REACTIVATIONS_TABLE, new_watermark)
+    conn.commit()
+    return stats
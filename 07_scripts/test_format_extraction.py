@@ -1,31 +1,6 @@
 #!/usr/bin/env python3
-"""Тестирование функции extract_format"""
-import re
-
-def extract_format(publisher_str):
-    """Улучшенная функция определения формата"""
-    name_upper = str(publisher_str).upper()
-    
-    # Проверяем форматы в правильном порядке - сначала более специфичные
-    # POP - проверяем перед PUSH, чтобы перехватить "-POP" раньше
-    if re.search(r'-POP\b|POP-|POP\s|POP$', name_upper):
-        return 'POP'
-    # BANNER - проверяем первым среди остальных, так как может быть в конце названия
-    elif re.search(r'-BANNER\b|BANNER-|BANNER\s|BANNER$', name_upper):
-        return 'BANNER'
-    # VIDEO - проверяем перед PUSH
-    elif re.search(r'-VIDEO\b|VIDEO-|VIDEO\s|VIDEO$', name_upper):
-        return 'VIDEO'
-    # PUSH - проверяем последним, исключая случаи где PUSH внутри слова
-    # Ищем PUSH только как отдельное слово (после/перед дефисом или пробелом)
-    elif (re.search(r'-PUSH\b|PUSH-|PUSH\s|PUSH$|IN-PAGE|INPAGE', name_upper) and 
-          not re.search(r'[A-Z]PUSH[A-Z]', name_upper)):  # Исключаем PUSH внутри слова
-        return 'PUSH'
-    # NATIVE
-    elif re.search(r'-NATIVE\b|NATIVE-|NATIVE\s|NATIVE$', name_upper):
-        return 'NATIVE'
-    else:
-        return 'OTHER'
+"""Тестирование extract_format и векторного parse_publishers"""
+from publisher_parsing import extract_format, parse_publishers
 
 # Test cases
 test_cases = [
@@ -51,3 +26,15 @@ for name, expected in test_cases:
         print(f"  ⚠ НЕСООТВЕТСТВИЕ!")
     print()
 
+# Векторный разбор должен совпадать с построчным
+print("Тестирование parse_publishers (векторно):")
+print()
+names = [name for name, _ in test_cases]
+parsed = parse_publishers(names)
+mismatches = 0
+for (name, expected), fmt, pub_id in zip(test_cases, parsed['format'], parsed['publisher_id']):
+    expected_id = int(name[1:name.index(')')])
+    if fmt != expected or pub_id != expected_id:
+        mismatches += 1
+        print(f"✗ {name}: format={fmt}, publisher_id={pub_id}")
+print(f"{'✓' if mismatches == 0 else '✗'} Несоответствий: {mismatches}")
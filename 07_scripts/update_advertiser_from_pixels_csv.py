@@ -8,7 +8,9 @@ import io
 import os
 from datetime import datetime
 from sqlalchemy import create_engine, text
-from db_utils import get_postgres_connection_string
+from db_utils import get_postgres_connection_string, parse_pixel_ts
+from pixel_parquet import get_pixels_parquet_dir, iter_pixel_batches
+from pixel_schema import ADVERTISER_MAPPING, pixel_read_csv_kwargs, coerce_pixel_ids
 
 # Fix encoding for Windows console
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -21,12 +23,15 @@ print()
 # CSV file path
 CSV_FILE = r"C:\Users\Nalivator3000\Downloads\pixels-019b379c-d78c-71d3-9d2a-4831948c32c5-12-19-2025-17-16-24-01.csv"
 CHUNK_SIZE = 50000
+PARQUET_DIR = get_pixels_parquet_dir()
 
-if not os.path.exists(CSV_FILE):
+if PARQUET_DIR:
+    print(f"Parquet датасет: {PARQUET_DIR}")
+elif not os.path.exists(CSV_FILE):
     print(f"ОШИБКА: CSV файл не найден: {CSV_FILE}")
     sys.exit(1)
-
-print(f"CSV файл: {CSV_FILE}")
+else:
+    print(f"CSV файл: {CSV_FILE}")
 print(f"Размер чанка: {CHUNK_SIZE:,} строк")
 print()
 
@@ -35,10 +40,14 @@ print("Подключение к PostgreSQL...")
 pg_uri = get_postgres_connection_string()
 engine = create_engine(pg_uri)
 
+slow_ts_rows = 0  # Строки с PIXEL_TS не в стандартном формате (медленный парсинг)
+
 def process_chunk(chunk_df):
     """Обработка чанка данных для обновления advertiser"""
-    # Выбираем нужные колонки
-    required_cols = ['EXTERNAL_USER_ID', 'PIXEL_TS', 'ADVERTISER_ID']
+    global slow_ts_rows
+    chunk_df = coerce_pixel_ids(chunk_df)
+    # Схема уже оставила только external_user_id, event_date (PIXEL_TS) и advertiser_id
+    required_cols = ['external_user_id', 'event_date', 'advertiser_id']
     
     # Проверяем наличие колонок
     missing_cols = [col for col in required_cols if col not in chunk_df.columns]
@@ -46,14 +55,12 @@ def process_chunk(chunk_df):
         print(f"⚠ Предупреждение: отсутствуют колонки: {missing_cols}")
         return pd.DataFrame()
     
-    chunk_df = chunk_df[required_cols].copy()
-    
     # Удаляем записи без EXTERNAL_USER_ID
-    chunk_df = chunk_df[chunk_df['EXTERNAL_USER_ID'].notna()]
+    chunk_df = chunk_df[chunk_df['external_user_id'].notna()].copy()
     
     # Обрабатываем дату
-    chunk_df['PIXEL_TS'] = chunk_df['PIXEL_TS'].astype(str).str.replace(' UTC', '', regex=False)
-    chunk_df['event_date'] = pd.to_datetime(chunk_df['PIXEL_TS'], errors='coerce', utc=True)
+    chunk_df['event_date'], slow_rows = parse_pixel_ts(chunk_df['event_date'])
+    slow_ts_rows += slow_rows
     chunk_df = chunk_df.dropna(subset=['event_date'])
     
     # Фильтруем по дате (2-8 декабря)
@@ -63,27 +70,52 @@ def process_chunk(chunk_df):
     ]
     
     # Маппим ADVERTISER_ID в advertiser (1 = 4rabet, 2 = Crorebet)
-    chunk_df['advertiser'] = chunk_df['ADVERTISER_ID'].map({1: '4rabet', 2: 'Crorebet'})
+    chunk_df['advertiser'] = chunk_df['advertiser_id'].map(ADVERTISER_MAPPING)
     
     # Удаляем записи, где advertiser не определен
     chunk_df = chunk_df[chunk_df['advertiser'].notna()]
     
     # Оставляем только external_user_id, event_date и advertiser
-    chunk_df = chunk_df[['EXTERNAL_USER_ID', 'event_date', 'advertiser']].rename(columns={'EXTERNAL_USER_ID': 'external_user_id'})
+    chunk_df = chunk_df[['external_user_id', 'event_date', 'advertiser']].copy()
     
     # Конвертируем дату в формат для SQL
     chunk_df['event_date'] = chunk_df['event_date'].dt.tz_localize(None)  # Убираем timezone для SQL
     
     return chunk_df
 
-# Подсчет строк в CSV
-print("Подсчет строк в CSV...")
-try:
-    total_rows = sum(1 for _ in open(CSV_FILE, 'r', encoding='utf-8')) - 1  # Минус заголовок
-    print(f"Всего строк в CSV: {total_rows:,}")
-except Exception as e:
-    print(f"⚠ Не удалось подсчитать строки: {e}")
+def process_parquet_batch(batch_df):
+    """Батч из Parquet уже типизирован и отфильтрован по дате - оставляем записи с advertiser"""
+    batch_df = batch_df[batch_df['external_user_id'].notna() & batch_df['advertiser'].notna()].copy()
+    batch_df['event_date'] = batch_df['event_date'].dt.tz_localize(None)  # Убираем timezone для SQL
+    return batch_df
+
+if PARQUET_DIR:
+    # Читаем только 3 колонки и только партиции за 2-8 декабря
+    chunks = iter_pixel_batches(
+        PARQUET_DIR,
+        columns=['external_user_id', 'event_date', 'advertiser'],
+        start_date='2025-12-02',
+        end_date='2025-12-08',
+        batch_size=CHUNK_SIZE,
+    )
+    chunk_processor = process_parquet_batch
     total_rows = 0
+else:
+    # Подсчет строк в CSV
+    print("Подсчет строк в CSV...")
+    try:
+        total_rows = sum(1 for _ in open(CSV_FILE, 'r', encoding='utf-8')) - 1  # Минус заголовок
+        print(f"Всего строк в CSV: {total_rows:,}")
+    except Exception as e:
+        print(f"⚠ Не удалось подсчитать строки: {e}")
+        total_rows = 0
+    # Из CSV читаются только 3 нужные колонки, сразу с типами и именами user_events
+    chunks = pd.read_csv(
+        CSV_FILE,
+        chunksize=CHUNK_SIZE,
+        **pixel_read_csv_kwargs(CSV_FILE, columns=['external_user_id', 'event_date', 'advertiser_id'])
+    )
+    chunk_processor = process_chunk
 print()
 
 # Начинаем обработку
@@ -96,13 +128,9 @@ start_time = datetime.now()
 
 try:
     with engine.connect() as conn:
-        for chunk_num, chunk in enumerate(pd.read_csv(
-            CSV_FILE,
-            chunksize=CHUNK_SIZE,
-            low_memory=False
-        ), 1):
+        for chunk_num, chunk in enumerate(chunks, 1):
             # Обрабатываем чанк
-            processed_chunk = process_chunk(chunk)
+            processed_chunk = chunk_processor(chunk)
             
             if len(processed_chunk) == 0:
                 rows_processed += len(chunk)
@@ -151,7 +179,8 @@ try:
                 remaining = total_rows - rows_processed if total_rows > 0 else 0
                 eta = remaining / rate / 60 if rate > 0 and remaining > 0 else 0
                 
-                print(f"Прогресс: {rows_processed:,} / {total_rows:,} ({rows_processed/total_rows*100:.1f}% если известен размер) | "
+                percent = rows_processed / total_rows * 100 if total_rows > 0 else 0
+                print(f"Прогресс: {rows_processed:,} / {total_rows:,} ({percent:.1f}% если известен размер) | "
                       f"Скорость: {rate:.0f} строк/сек | "
                       f"Обновлено: {rows_updated:,}")
 
@@ -173,6 +202,8 @@ print(f"Обновлено записей: {rows_updated:,}")
 print(f"Время: {elapsed_total/60:.1f} минут")
 if elapsed_total > 0:
     print(f"Средняя скорость: {rows_processed/elapsed_total:.0f} строк/сек")
+if not PARQUET_DIR:
+    print(f"PIXEL_TS вне формата 'YYYY-MM-DD HH:MM:SS UTC' (медленный парсинг): {slow_ts_rows:,} строк")
 print()
 
 # Финальная проверка
@@ -29,15 +29,13 @@
 -- в таблице user_events. Если они появятся позже, можно будет добавить аналогичные CTE.
 
 WITH 
--- 0. Предварительно определяем формат для каждого паблишера (оптимизация)
+-- 0. Формат каждого паблишера - из справочника publishers
 publisher_format AS (
-    SELECT DISTINCT ON (publisher_id)
+    SELECT
         publisher_id,
         format
-    FROM publisher_spend
-    WHERE publisher_id IS NOT NULL AND publisher_id != 0
-    GROUP BY publisher_id, format
-    ORDER BY publisher_id, COUNT(*) DESC
+    FROM publishers
+    WHERE publisher_id != 0
 ),
 
 -- 1. Получаем все депозиты с атрибутами и форматом
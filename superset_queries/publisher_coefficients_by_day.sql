@@ -20,6 +20,7 @@ daily_spend AS (
         spend,
         current_cpa
     FROM publisher_spend_daily
+    JOIN publishers USING (publisher_id)  -- Название и формат из справочника
     WHERE date >= COALESCE('{{ start_date }}'::date, (SELECT MIN(date) FROM publisher_spend_daily))
       AND date <= COALESCE('{{ end_date }}'::date, (SELECT MAX(date) FROM publisher_spend_daily))
       AND publisher_id != 0  -- Исключаем органику
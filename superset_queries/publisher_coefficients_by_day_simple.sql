@@ -18,6 +18,7 @@ daily_spend AS (
         spend,
         current_cpa
     FROM publisher_spend_daily
+    JOIN publishers USING (publisher_id)  -- Название и формат из справочника
     WHERE publisher_id != 0  -- Исключаем органику
       AND spend >= 50  -- Минимальные расходы
 ),
@@ -20,6 +20,7 @@ period_spend AS (
         spend,
         current_cpa
     FROM publisher_spend
+    JOIN publishers USING (publisher_id)  -- Название и формат из справочника
     WHERE month >= COALESCE(SUBSTRING('{{ start_date }}'::text, 1, 7), '2025-11')  -- Извлекаем YYYY-MM из даты
       AND month <= COALESCE(SUBSTRING('{{ end_date }}'::text, 1, 7), '2025-11')
       AND publisher_id != 0  -- Исключаем органику
@@ -44,8 +44,8 @@ publisher_advertiser AS (
 period_spend AS (
     SELECT 
         ps.publisher_id,
-        ps.publisher_name,
-        ps.format,
+        p.publisher_name,
+        p.format,
         ps.month,
         ps.deposits_reported,
         ps.spend,
@@ -59,6 +59,7 @@ period_spend AS (
             END
         ) as brand
     FROM publisher_spend ps
+    JOIN publishers p ON p.publisher_id = ps.publisher_id  -- Название и формат из справочника
     LEFT JOIN publisher_advertiser pa
         ON ps.publisher_id = pa.publisher_id
         AND ps.month = pa.month
@@ -12,6 +12,7 @@ nov_spend AS (
         spend,
         current_cpa
     FROM publisher_spend
+    JOIN publishers USING (publisher_id)  -- Название и формат из справочника
     WHERE month = '2025-11'
 ),
 
@@ -13,6 +13,7 @@ nov_spend AS (
         spend,
         current_cpa
     FROM publisher_spend
+    JOIN publishers USING (publisher_id)  -- Название и формат из справочника
     WHERE month = '2025-11'
       AND publisher_id != 0  -- Исключаем органику
       AND spend > 50  -- Только паблишеры со значительными расходами